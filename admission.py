@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+"""
+生成请求的准入控制。
+
+大量设备同时刷新时，每个请求都会拉取全部订阅并渲染（或启动一个 main.py 子进程），
+同时进行的生成过多会耗尽内存，所有请求一起变慢。AdmissionController 限制：
+    - 同时进行的生成数（max_concurrent）
+    - 排队等待的请求数（max_queue），队列已满时立即拒绝
+    - 每个请求的最长排队时间（queue_timeout），超时放弃
+被拒绝时抛出 Saturated，调用方返回 503 并带上 Retry-After。
+
+生成在其他线程中执行并可能超时（GenerationEngine）时，调用方用 slot.hold_until(future)
+把名额交给 future：请求因超时提前返回后，名额一直占用到后台生成真正结束，
+保证 max_concurrent 限制的是实际在进行的生成数。
+
+默认值读取环境变量 GENERATE_MAX_CONCURRENT（4）、GENERATE_MAX_QUEUE（16）、
+GENERATE_QUEUE_TIMEOUT（秒，30）。stats() 返回当前队列深度与等待时间，供监控使用。
+"""
+import math
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+
+class Saturated(Exception):
+    """生成请求被拒绝（队列已满或排队超时），retry_after 为建议的重试秒数"""
+
+    def __init__(self, reason, retry_after):
+        self.reason = reason
+        self.retry_after = retry_after
+        super().__init__(f"{reason}，请在 {retry_after} 秒后重试")
+
+
+class Slot:
+    """
+    admit() 分配的生成名额。
+
+    属性：
+        waited: float
+            排队等待的秒数。
+        future: concurrent.futures.Future | None
+            hold_until 设置的 future，离开 with 块时尚未完成则继续占用名额直到其完成。
+    """
+
+    __slots__ = ('waited', 'future')
+
+    def __init__(self, waited):
+        self.waited = waited
+        self.future = None
+
+    def hold_until(self, future):
+        """名额随 future 一起释放（future 完成前离开 with 块时不释放）。"""
+        self.future = future
+
+
+class AdmissionController:
+    """
+    并发生成数上限 + 有界 FIFO 等待队列。
+
+    参数：
+        max_concurrent: int | None
+            同时进行的生成数上限。
+        max_queue: int | None
+            等待队列长度上限，0 表示不排队、满载时直接拒绝。
+        queue_timeout: float | None
+            默认的最长排队时间（秒）。
+    """
+
+    def __init__(self, max_concurrent=None, max_queue=None, queue_timeout=None):
+        if max_concurrent is None:
+            max_concurrent = int(os.environ.get('GENERATE_MAX_CONCURRENT', '4'))
+        if max_queue is None:
+            max_queue = int(os.environ.get('GENERATE_MAX_QUEUE', '16'))
+        if queue_timeout is None:
+            queue_timeout = float(os.environ.get('GENERATE_QUEUE_TIMEOUT', '30'))
+        self.max_concurrent = max(1, max_concurrent)
+        self.max_queue = max(0, max_queue)
+        self.queue_timeout = queue_timeout
+        self._cond = threading.Condition()
+        self._queue = deque()
+        self.active = 0
+        # 请求已返回（如超时）、名额仍被后台生成占用的个数
+        self.lingering = 0
+        # 统计信息
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.last_wait = 0.0
+        # 生成耗时的指数移动平均，用于估算 Retry-After
+        self.avg_duration = None
+
+    def retry_after(self):
+        """
+        按当前队列深度与平均生成耗时估算的重试等待秒数（至少 1 秒）。
+        """
+        duration = self.avg_duration or 1.0
+        rounds = (len(self._queue) + self.active) / self.max_concurrent
+        return max(1, math.ceil(duration * max(1.0, rounds)))
+
+    @contextmanager
+    def admit(self, timeout=None):
+        """
+        在 with 块内占用一个生成名额；需要排队时按到达顺序等待。
+        as 得到 Slot，可用 slot.hold_until(future) 让名额一直占用到 future 完成。
+
+        参数：
+            timeout: float | None
+                本次请求的最长排队时间（秒），为 None 时使用 queue_timeout。
+
+        异常：
+            Saturated: 队列已满，或排队超过 timeout。
+        """
+        timeout = self.queue_timeout if timeout is None else timeout
+        start = time.monotonic()
+        with self._cond:
+            if self.active >= self.max_concurrent or self._queue:
+                if len(self._queue) >= self.max_queue:
+                    self.rejected += 1
+                    raise Saturated('生成请求过多，等待队列已满', self.retry_after())
+                ticket = object()
+                self._queue.append(ticket)
+                deadline = start + timeout
+                try:
+                    while self._queue[0] is not ticket or self.active >= self.max_concurrent:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            self.timed_out += 1
+                            raise Saturated('生成请求排队超时', self.retry_after())
+                        self._cond.wait(remaining)
+                finally:
+                    self._queue.remove(ticket)
+                    # 队首变化，唤醒其余等待者重新检查
+                    self._cond.notify_all()
+            self.active += 1
+            self.admitted += 1
+            waited = time.monotonic() - start
+            self.total_wait += waited
+            self.max_wait = max(self.max_wait, waited)
+            self.last_wait = waited
+        started = time.monotonic()
+        slot = Slot(waited)
+        try:
+            yield slot
+        finally:
+            future = slot.future
+            if future is not None and not future.done():
+                with self._cond:
+                    self.lingering += 1
+                future.add_done_callback(lambda _: self._release(started, lingering=True))
+            else:
+                self._release(started)
+
+    def _release(self, started, lingering=False):
+        duration = time.monotonic() - started
+        with self._cond:
+            self.active -= 1
+            if lingering:
+                self.lingering -= 1
+            self.avg_duration = duration if self.avg_duration is None \
+                else 0.8 * self.avg_duration + 0.2 * duration
+            self._cond.notify_all()
+
+    def stats(self):
+        """
+        返回监控数据：当前并发数（lingering 为其中请求已超时返回、仍在后台生成的个数）、
+        队列深度、累计准入 / 拒绝 / 超时次数以及排队时间（秒）。
+        """
+        with self._cond:
+            return {
+                'active': self.active,
+                'lingering': self.lingering,
+                'queued': len(self._queue),
+                'max_concurrent': self.max_concurrent,
+                'max_queue': self.max_queue,
+                'queue_timeout': self.queue_timeout,
+                'admitted': self.admitted,
+                'rejected': self.rejected,
+                'timed_out': self.timed_out,
+                'avg_wait': round(self.total_wait / self.admitted, 3) if self.admitted else 0.0,
+                'max_wait': round(self.max_wait, 3),
+                'last_wait': round(self.last_wait, 3),
+                'avg_duration': round(self.avg_duration, 3) if self.avg_duration is not None else None,
+            }
+
+
+# 进程内共享的准入控制器：Flask 与 /api/generate 在同一进程中运行时共用同一组名额
+controller = AdmissionController()
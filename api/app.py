@@ -8,15 +8,31 @@ import argparse  # 添加 argparse 模块
 import tempfile
 import shutil
 import tempfile  # 导入 tempfile 模块
+import threading
 from datetime import datetime, timedelta
+from generation_engine import GenerationEngine
+from response_cache import ResponseCache, etag_matches, hash_key, template_version
+from admission import controller as admission, Saturated
 
 app = Flask(__name__, template_folder='../templates')  # 指定模板文件夹的路径
 app.secret_key = 'sing-box'  # 替换为实际的密钥
-os.environ['TEMP_JSON_DATA'] = '{"subscribes":[{"url":"URL LINK","tag":"tag_1","enabled":true,"emoji":1,"prefix":"","User-Agent":"clashmeta"},{"url":"URL LINK","tag":"tag_2","enabled":false,"emoji":0,"prefix":"❤️","User-Agent":"clashmeta"}],"auto_set_outbounds_dns":{"proxy":"","direct":""},"save_config_path":"./config.json","auto_backup":false,"exlude_protocol":"ssr","config_template":"","Only-nodes":false}'
+DEFAULT_TEMP_JSON_DATA = '{"subscribes":[{"url":"URL LINK","tag":"tag_1","enabled":true,"emoji":1,"prefix":"","User-Agent":"clashmeta"},{"url":"URL LINK","tag":"tag_2","enabled":false,"emoji":0,"prefix":"❤️","User-Agent":"clashmeta"}],"auto_set_outbounds_dns":{"proxy":"","direct":""},"save_config_path":"./config.json","auto_backup":false,"exlude_protocol":"ssr","config_template":"","Only-nodes":false}'
 
 # 获取系统默认的临时目录路径
 TEMP_DIR = tempfile.gettempdir()
 
+# 默认在当前进程内生成配置；设置环境变量 GENERATE_IN_SUBPROCESS=1 时，
+# 沿用每个请求启动一个 main.py 子进程的隔离模式
+GENERATE_IN_SUBPROCESS = os.environ.get('GENERATE_IN_SUBPROCESS', '').strip().lower() in ('1', 'true', 'yes')
+engine = GenerationEngine()
+# /config 的响应缓存（ETag / 304 / stale-while-revalidate），见 response_cache
+config_cache = ResponseCache()
+
+# TEMP_JSON_DATA 只保存在当前进程内（不再写入 os.environ），
+# 由 /edit_temp_json、/clear_temp_json_data 修改；生成请求只使用它的副本
+temp_json_lock = threading.Lock()
+temp_json_data_str = DEFAULT_TEMP_JSON_DATA
+
 """
 # 存储配置文件的过期时间（10分钟）
 config_expiry_time = None
@@ -29,13 +45,20 @@ def cleanup_temp_config():
         config_expiry_time = None
         config_file_path = None
 
-# 获取临时 JSON 数据
+# 获取临时 JSON 数据（每次返回新的 dict，修改它不会影响其他请求）
 def get_temp_json_data():
-    temp_json_data = os.environ.get('TEMP_JSON_DATA')
+    with temp_json_lock:
+        temp_json_data = temp_json_data_str
     if temp_json_data:
         return json.loads(temp_json_data)
     return {}
 
+# 设置临时 JSON 数据
+def set_temp_json_data(data):
+    global temp_json_data_str
+    with temp_json_lock:
+        temp_json_data_str = json.dumps(data, indent=4, ensure_ascii=False)
+
 # 获取config_template目录下的模板文件列表
 def get_template_list():
     template_list = []
@@ -61,6 +84,37 @@ def write_providers_json(data):
         with open('providers.json', 'w', encoding='utf-8') as json_file:
             json.dump(data, json_file, indent=4, ensure_ascii=False)
 
+# 子进程隔离模式：执行 main.py 生成配置文件，再读回文件内容
+def generate_in_subprocess(selected_template_index, temp_json_data):
+    temp_json_data_arg = json.dumps(json.dumps(temp_json_data, indent=4, ensure_ascii=False), indent=4, ensure_ascii=False)
+    subprocess.check_call([sys.executable, 'main.py', '--template_index', selected_template_index, '--temp_json_data', temp_json_data_arg])
+    CONFIG_FILE_NAME = temp_json_data.get("save_config_path", "config.json")
+    if CONFIG_FILE_NAME.startswith("./"):
+        CONFIG_FILE_NAME = CONFIG_FILE_NAME[2:]
+    # 设置配置文件的完整路径
+    config_file_path = os.path.join('/tmp/', CONFIG_FILE_NAME) 
+    if not os.path.exists(config_file_path):
+        config_file_path = CONFIG_FILE_NAME  # 使用相对于当前工作目录的路径 
+    # 读取配置文件内容
+    with open(config_file_path, 'r', encoding='utf-8') as config_file:
+        return config_file.read()
+
+# 生成配置并返回配置内容（str）；同时进行的生成数受 admission 限制，满载时抛出 Saturated
+def generate_config_content(selected_template_index, temp_json_data):
+    with admission.admit() as slot:
+        if GENERATE_IN_SUBPROCESS:
+            return generate_in_subprocess(selected_template_index, temp_json_data)
+        # 生成超时时名额随后台任务一起释放
+        return engine.render(temp_json_data, selected_template_index, slot).decode('utf-8')
+
+# 满载时的 503 响应
+def busy_response(e):
+    return Response(json.dumps({'status': 'error', 'message_CN': f'{e.reason}，请在 {e.retry_after} 秒后重试', 'message_VN': f'Máy chủ đang bận, vui lòng thử lại sau {e.retry_after} giây', 'message_EN': f'Server is busy, please retry after {e.retry_after} seconds'}, indent=4, ensure_ascii=False), content_type='application/json; charset=utf-8', status=503, headers={'Retry-After': str(e.retry_after)})
+
+# 缓存相关的响应头
+def cache_headers(entry, state):
+    return {'ETag': entry.etag, 'Cache-Control': config_cache.cache_control(), 'X-Cache': state}
+
 @app.route('/')
 def index():
     template_list = get_template_list()
@@ -91,7 +145,7 @@ def edit_temp_json():
             print (new_temp_json_data)
             if new_temp_json_data:
                 temp_json_data = json.loads(new_temp_json_data)
-                os.environ['TEMP_JSON_DATA'] = json.dumps(temp_json_data, indent=4, ensure_ascii=False)
+                set_temp_json_data(temp_json_data)
                 #flash('TEMP_JSON_DATA 已更新', 'success')
                 #flash('TEMP_JSON_DATA đã được cập nhật', 'Thành công^^')
                 return jsonify({'status': 'success'})  # 返回成功状态
@@ -109,8 +163,7 @@ def edit_temp_json():
 @app.route('/config/<path:url>', methods=['GET'])
 def config(url):
     
-    temp_json_data_str = os.environ['TEMP_JSON_DATA']
-    temp_json_data = json.loads(temp_json_data_str)
+    temp_json_data = get_temp_json_data()
     subscribe = temp_json_data['subscribes'][0]
     
     query_string = request.query_string.decode('utf-8')
@@ -186,26 +239,19 @@ def config(url):
     #return page_content
     try:
         selected_template_index = '0'
-        temp_json_data = json.dumps(json.dumps(temp_json_data, indent=4, ensure_ascii=False), indent=4, ensure_ascii=False)
-        subprocess.check_call([sys.executable, 'main.py', '--template_index', selected_template_index, '--temp_json_data', temp_json_data])
-        CONFIG_FILE_NAME = json.loads(os.environ['TEMP_JSON_DATA']).get("save_config_path", "config.json")
-        if CONFIG_FILE_NAME.startswith("./"):
-            CONFIG_FILE_NAME = CONFIG_FILE_NAME[2:]
-        # 设置配置文件的完整路径
-        config_file_path = os.path.join('/tmp/', CONFIG_FILE_NAME) 
-        if not os.path.exists(config_file_path):
-            config_file_path = CONFIG_FILE_NAME  # 使用相对于当前工作目录的路径 
-        os.environ['TEMP_JSON_DATA'] = json.dumps(json.loads('{"subscribes":[{"url":"URL LINK","tag":"tag_1","enabled":true,"emoji":1,"prefix":"","User-Agent":"clashmeta"},{"url":"URL LINK","tag":"tag_2","enabled":false,"emoji":0,"prefix":"❤️","User-Agent":"clashmeta"}],"auto_set_outbounds_dns":{"proxy":"","direct":""},"save_config_path":"./config.json","auto_backup":false,"exlude_protocol":"ssr","config_template":"","Only-nodes":false}'), indent=4, ensure_ascii=False)
-        # 读取配置文件内容
-        with open(config_file_path, 'r', encoding='utf-8') as config_file:
-            config_content = config_file.read()
-            if config_content:
-                flash('配置文件生成成功', 'success')
-                flash('Tạo file cấu hình thành công', 'Thành công^^')
-        config_data = json.loads(config_content)
-        return Response(config_content, content_type='text/plain; charset=utf-8')
+        # 缓存 key：订阅参数 + 实际使用的模板版本；命中时不重新拉取订阅
+        template_path = GenerationEngine.resolve_template(temp_json_data, selected_template_index).get('config_template')
+        cache_key = hash_key('config', temp_json_data, template_version(template_path))
+        entry, state = config_cache.get(cache_key, lambda: generate_config_content(selected_template_index, temp_json_data).encode('utf-8'))
+        if etag_matches(request.headers.get('If-None-Match'), entry.etag):
+            return Response(status=304, headers=cache_headers(entry, state))
+        if entry.body:
+            flash('配置文件生成成功', 'success')
+            flash('Tạo file cấu hình thành công', 'Thành công^^')
+        return Response(entry.body, content_type='text/plain; charset=utf-8', headers=cache_headers(entry, state))
+    except Saturated as e:
+        return busy_response(e)
     except subprocess.CalledProcessError as e:
-        os.environ['TEMP_JSON_DATA'] = json.dumps(json.loads('{"subscribes":[{"url":"URL LINK","tag":"tag_1","enabled":true,"emoji":1,"prefix":"","User-Agent":"clashmeta"},{"url":"URL LINK","tag":"tag_2","enabled":false,"emoji":0,"prefix":"❤️","User-Agent":"clashmeta"}],"auto_set_outbounds_dns":{"proxy":"","direct":""},"save_config_path":"./config.json","auto_backup":false,"exlude_protocol":"ssr","config_template":"","Only-nodes":false}'), indent=4, ensure_ascii=False)
         return Response(json.dumps({'status': 'error', 'message_CN': '执行子进程时出错，获取链接内容超时，请尝试本地运行脚本或者把订阅链接内容放到gist; 你的订阅链接可能需要使用 越南 ip才能打开，很抱歉vercel做不到，请你把订阅链接里的node内容保存到gist里再尝试解析它。或者请你在本地运行脚本;', 'message_VN': 'Có lỗi khi thực hiện tiến trình con, vượt quá thời gian để lấy nội dung liên kết, vui lòng thử chạy kịch bản cục bộ hoặc đặt nội dung liên kết đăng ký vào Github Gist; Liên kết đăng ký của bạn có thể cần sử dụng IP Việt Nam để mở, xin lỗi Vercel không thể làm điều đó, vui lòng lưu nội dung nút trong liên kết đăng ký vào Github Gist trước khi cố gắng phân tích nó. Hoặc vui lòng chạy kịch bản cục bộ;', 'message_EN': 'Fetching the link content is timing out, please try running the script locally or putting the subscription link content into Github Gist; Your subscription link may need to use Vietnam ip to open, sorry Vercel can not do that, please save the node content in the subscription link to Github Gist before trying to parse it. Or please run the script locally;'}, indent=4,ensure_ascii=False), content_type='application/json; charset=utf-8', status=500)
         #return jsonify({'status': 'error', 'message': str(e)}) 
     except Exception as e:
@@ -220,37 +266,33 @@ def generate_config():
             flash('请选择一个配置模板', 'error')
             flash('Vui lòng chọn một mẫu cấu hình', 'Lỗi!!!')
             return redirect(url_for('index'))
-        temp_json_data = json.dumps(os.environ['TEMP_JSON_DATA'], indent=4, ensure_ascii=False)
-        # 修改这里：执行main.py并传递模板序号作为命令行参数，如果未指定，则传递空字符串
-        subprocess.check_call([sys.executable, 'main.py', '--template_index', selected_template_index, '--temp_json_data', temp_json_data])
-        CONFIG_FILE_NAME = json.loads(os.environ['TEMP_JSON_DATA']).get("save_config_path", "config.json")
-        if CONFIG_FILE_NAME.startswith("./"):
-            CONFIG_FILE_NAME = CONFIG_FILE_NAME[2:]
-        # 设置配置文件的完整路径
-        config_file_path = os.path.join('/tmp/', CONFIG_FILE_NAME) 
-        if not os.path.exists(config_file_path):
-            config_file_path = CONFIG_FILE_NAME  # 使用相对于当前工作目录的路径 
-        os.environ['TEMP_JSON_DATA'] = json.dumps(json.loads('{"subscribes":[{"url":"URL LINK","tag":"tag_1","enabled":true,"emoji":1,"prefix":"","User-Agent":"clashmeta"},{"url":"URL LINK","tag":"tag_2","enabled":false,"emoji":0,"prefix":"❤️","User-Agent":"clashmeta"}],"auto_set_outbounds_dns":{"proxy":"","direct":""},"save_config_path":"./config.json","auto_backup":false,"exlude_protocol":"ssr","config_template":"","Only-nodes":false}'), indent=4, ensure_ascii=False)
-        # 读取配置文件内容
-        with open(config_file_path, 'r', encoding='utf-8') as config_file:
-            config_content = config_file.read()
-            if config_content:
-                flash('配置文件生成成功', 'success')
-                flash('Tạo file cấu hình thành công', 'Thành công^^')
-        config_data = json.loads(config_content)
+        # TEMP_JSON_DATA 为空时使用 providers.json
+        temp_json_data = read_providers_json()
+        config_content = generate_config_content(selected_template_index, temp_json_data)
+        set_temp_json_data(json.loads(DEFAULT_TEMP_JSON_DATA))
+        if config_content:
+            flash('配置文件生成成功', 'success')
+            flash('Tạo file cấu hình thành công', 'Thành công^^')
         return Response(config_content, content_type='text/plain; charset=utf-8')
+    except Saturated as e:
+        return busy_response(e)
     except subprocess.CalledProcessError as e:
-        os.environ['TEMP_JSON_DATA'] = json.dumps(json.loads('{"subscribes":[{"url":"URL LINK","tag":"tag_1","enabled":true,"emoji":1,"prefix":"","User-Agent":"clashmeta"},{"url":"URL LINK","tag":"tag_2","enabled":false,"emoji":0,"prefix":"❤️","User-Agent":"clashmeta"}],"auto_set_outbounds_dns":{"proxy":"","direct":""},"save_config_path":"./config.json","auto_backup":false,"exlude_protocol":"ssr","config_template":"","Only-nodes":false}'), indent=4, ensure_ascii=False)
+        set_temp_json_data(json.loads(DEFAULT_TEMP_JSON_DATA))
         return Response(json.dumps({'status': 'error', 'message_CN': '执行子进程时出错，获取链接内容超时，请尝试本地运行脚本或者把订阅链接内容放到gist; 你的订阅链接可能需要使用 越南 ip才能打开，很抱歉vercel做不到，请你把订阅链接里的node内容保存到gist里再尝试解析它。或者请你在本地运行脚本;', 'message_VN': 'Có lỗi khi thực hiện tiến trình con, vượt quá thời gian để lấy nội dung liên kết, vui lòng thử chạy kịch bản cục bộ hoặc đặt nội dung liên kết đăng ký vào Github Gist; Liên kết đăng ký của bạn có thể cần sử dụng IP Việt Nam để mở, xin lỗi Vercel không thể làm điều đó, vui lòng lưu nội dung nút trong liên kết đăng ký vào Github Gist trước khi cố gắng phân tích nó. Hoặc vui lòng chạy kịch bản cục bộ;', 'message_EN': 'Fetching the link content is timing out, please try running the script locally or putting the subscription link content into Github Gist; Your subscription link may need to use Vietnam ip to open, sorry Vercel can not do that, please save the node content in the subscription link to Github Gist before trying to parse it. Or please run the script locally;'}, indent=4,ensure_ascii=False), content_type='application/json; charset=utf-8', status=500)
     except Exception as e:
         #flash(f'Error occurred while generating the configuration file: {str(e)}', 'error')
         return Response(json.dumps({'status': 'error', 'message_CN': '订阅解析超时: 请检查订阅链接是否正确 or 请更换为no_groups模板 再尝试一次; 请不要修改 tag 值，除非你明白它是干什么的;', 'message_VN': 'Quá thời gian phân tích đăng ký: Vui lòng kiểm tra xem liên kết đăng ký có chính xác không hoặc vui lòng chuyển sang "nogroupstemplate" và thử lại; Vui lòng không chỉnh sửa giá trị "tag", trừ khi bạn hiểu nó làm gì;', 'message_EN': 'Subscription parsing timeout: Please check if the subscription link is correct or please change to "no_groups_template" and try again; Please do not modify the "tag" value unless you understand what it does;'}, indent=4,ensure_ascii=False), content_type='application/json; charset=utf-8', status=500)
     #return redirect(url_for('index'))
 
+# 监控：生成并发数、队列深度与排队时间
+@app.route('/stats', methods=['GET'])
+def stats():
+    return jsonify({'admission': admission.stats(), 'engine': engine.stats()})
+
 @app.route('/clear_temp_json_data', methods=['POST'])
 def clear_temp_json_data():
     try:
-        os.environ['TEMP_JSON_DATA'] = json.dumps({}, indent=4, ensure_ascii=False)
+        set_temp_json_data({})
         flash('TEMP_JSON_DATA 已清空', 'success')
         flash('TEMP_JSON_DATA đã được làm trống', 'Thành công^^')
     except Exception as e:
@@ -1,8 +1,148 @@
 from http.server import BaseHTTPRequestHandler
 from urllib.parse import urlparse, parse_qs
 import json
+import hmac
+import io
 import os
-from main import generate_config_from_providers  # 使用 main.py 中的封装函数
+import threading
+import zipfile
+from concurrent.futures import TimeoutError as GenerateTimeout
+from main import generate_config_from_providers, generate_configs_for_profiles, is_compact_output  # 使用 main.py 中的封装函数
+from config_writer import iter_config, dump_config
+from response_cache import ResponseCache, etag_matches, hash_key, template_version
+from admission import controller as admission, Saturated
+from refresh_scheduler import load_profiles
+from warmup import warm_up
+
+# 同一实例（Vercel 热启动 / 自托管进程）内复用的响应缓存，见 response_cache
+response_cache = ResponseCache()
+
+# profile → 环境变量名映射（refresh_scheduler 也按此预渲染各 profile）
+PROFILE_ENV_MAP = {
+    "default": "SUB_CONFIG",       # 兼容旧逻辑
+    "mac": "SUB_CONFIG_MAC",      # 给 Mac / SFM 用
+    "router": "SUB_CONFIG_ROUTER",  # 给路由器用
+    "ios": "SUB_CONFIG_IOS"       # 给IOS用
+}
+
+# 批量模式（?profiles=mac,router,ios）支持的响应格式 → Content-Type
+BATCH_FORMATS = {
+    "zip": "application/zip",
+    "multipart": "multipart/mixed; boundary={boundary}",
+}
+
+
+def pack_profiles(bodies, fmt, boundary):
+    """
+    把多个 profile 的配置打包为一个响应体。
+
+    参数：
+        bodies: dict[str, bytes]
+            profile -> 序列化后的配置，按此顺序打包。
+        fmt: str
+            zip：每个 profile 为 <profile>.json 的 zip 压缩包（文件时间固定，相同内容得到相同 ETag）；
+            multipart：multipart/mixed，每个 profile 一段，Content-Disposition 中带 name / filename。
+        boundary: str
+            multipart 的分隔符。
+
+    返回：
+        bytes: 响应体。
+    """
+    if fmt == "zip":
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+            for profile, body in bodies.items():
+                info = zipfile.ZipInfo(profile + ".json", date_time=(1980, 1, 1, 0, 0, 0))
+                info.compress_type = zipfile.ZIP_DEFLATED
+                archive.writestr(info, body)
+        return buffer.getvalue()
+    parts = []
+    for profile, body in bodies.items():
+        parts.append((
+            f"--{boundary}\r\n"
+            "Content-Type: application/json; charset=utf-8\r\n"
+            f'Content-Disposition: attachment; name="{profile}"; filename="{profile}.json"\r\n'
+            f"Content-Length: {len(body)}\r\n\r\n"
+        ).encode("ascii") + body + b"\r\n")
+    parts.append(f"--{boundary}--\r\n".encode("ascii"))
+    return b"".join(parts)
+
+
+class BatchGenerateError(Exception):
+    """批量生成中有 profile 失败，errors 为 profile -> 错误信息"""
+
+    def __init__(self, errors):
+        self.errors = errors
+        super().__init__("; ".join(f"{profile}: {error}" for profile, error in errors.items()))
+
+
+def profile_cache_key(profile, providers, compact):
+    """
+    返回 profile 生成结果在 response_cache 中的 key：(profile, providers, 模板版本, 输出格式)。
+    """
+    return hash_key(profile, providers, template_version(providers.get("config_template")), compact)
+
+
+# 同一进程内同时只运行一次预热
+warm_up_lock = threading.Lock()
+
+
+def warm_up_token_ok(token):
+    """
+    判断 token 是否与环境变量 WARMUP_TOKEN 一致；未设置 WARMUP_TOKEN 时一律拒绝（禁止通过 HTTP 触发 prefetch）。
+    """
+    expected = os.environ.get("WARMUP_TOKEN", "")
+    return bool(expected) and hmac.compare_digest((token or "").encode("utf-8"), expected.encode("utf-8"))
+
+
+def warm_up_profiles(prefetch=False):
+    """
+    预热 PROFILE_ENV_MAP 中已配置的各 profile（见 warmup.warm_up）。
+    prefetch=True 时同时拉取订阅、渲染，并把结果写入 response_cache，各 profile 的第一个请求直接命中缓存；
+    拉取与渲染占用一个 admission 名额，与普通生成请求一起受并发限制。
+
+    返回：
+        dict: 预热报告。
+
+    异常：
+        Saturated: 已有预热在进行，或 admission 满载 / 排队超时。
+    """
+    if not warm_up_lock.acquire(blocking=False):
+        raise Saturated("预热正在进行", admission.retry_after())
+    try:
+        profiles = load_profiles(PROFILE_ENV_MAP)
+        if not prefetch:
+            report, _ = warm_up(profiles)
+            return report
+        with admission.admit():
+            report, configs = warm_up(profiles, prefetch=True)
+        if response_cache.enabled:
+            for profile, config in configs.items():
+                compact = is_compact_output(profiles[profile])
+                response_cache.put(profile_cache_key(profile, profiles[profile], compact),
+                                   dump_config(config, not compact))
+        return report
+    finally:
+        warm_up_lock.release()
+
+
+def start_warm_up():
+    """
+    在后台线程中预热（不阻塞导入与第一个请求）。只加载、编译模板，不拉取订阅，
+    避免与第一个真实请求争抢机场与生成名额；环境变量 WARMUP=off 时不预热。
+    """
+    if (os.environ.get("WARMUP") or "basic").strip().lower() == "off":
+        return None
+
+    def run():
+        try:
+            warm_up_profiles()
+        except Exception as e:
+            print(f"[WARN] 预热失败: {e}")
+
+    thread = threading.Thread(target=run, name="warmup", daemon=True)
+    thread.start()
+    return thread
 
 """
 接下来你要做的操作（一步步）：
@@ -23,7 +163,19 @@ from main import generate_config_from_providers  # 使用 main.py 中的封装
 	•	老方式（如果你保留 SUB_CONFIG）：
 	•	https://XXX.vercel.app/api/generate
 
-3）如果想确认某个 profile 的 SUB_CONFIG 有没有读对：
+3）一次生成多个 profile（各 profile 共用的订阅只拉取、解析一次）：
+	•	https://XXX.vercel.app/api/generate?profiles=mac,router,ios
+返回包含 mac.json / router.json / ios.json 的 zip；追加 &format=multipart 返回 multipart/mixed。
+
+4）监控生成并发 / 排队情况：
+	•	https://XXX.vercel.app/api/generate?stats
+
+   预热（冷启动时自动在后台编译各 profile 的模板，环境变量 WARMUP=off 关闭）：
+	•	https://XXX.vercel.app/api/warmup
+   同时拉取订阅并渲染（需设置环境变量 WARMUP_TOKEN）：
+	•	https://XXX.vercel.app/api/warmup?prefetch&token=<WARMUP_TOKEN>
+
+5）如果想确认某个 profile 的 SUB_CONFIG 有没有读对：
 	•	https://XXX.vercel.app/api/generate?profile=router&debug
 会返回：用的是哪个 env_key，长度多少，方便排错。
 """
@@ -40,13 +192,38 @@ class handler(BaseHTTPRequestHandler):
             * 省略 profile    → 使用环境变量 SUB_CONFIG（兼容旧逻辑）
 
         - 也可以同时传 providers 参数，优先使用 query 里的 providers。
+        - GET /api/generate?profiles=mac,router,ios[&format=zip|multipart]
+            * 批量生成多个 profile：先拉取各 profile 订阅的并集（相同订阅只拉取一次），
+              再按各自的模板与 filter 渲染，打包为 zip（默认）或 multipart/mixed 返回
+        - 追加 compact 参数（如 ?profile=router&compact），或在该 profile 的 providers 中
+          设置 "compact_output": true 时输出紧凑 JSON。
+        - providers 中设置 "minify": true 时，还会删除出站中与 sing-box 默认值相同的字段。
+        - 生成结果按 (profile, providers, 模板版本, 输出格式) 缓存（RESPONSE_CACHE_TTL /
+          RESPONSE_CACHE_STALE），响应带 ETag / Cache-Control，If-None-Match 命中时返回 304。
+        - 同时进行的生成数受 admission 限制，满载或排队超时时返回 503 + Retry-After。
 
     返回：
         - 成功：生成的配置（JSON 格式）
-        - 失败：包含 error/detail 的 JSON 错误信息
+        - 失败：包含 error/detail 的 JSON 错误信息；生成超时（仅自托管模式）返回 504
     """
 
-    def _send_json(self, status_code: int, data):
+    # 自托管服务（generate_server.py）中设置为 GenerationEngine：生成在其线程池中执行并受超时限制；
+    # 为 None 时（Vercel）在当前线程直接生成
+    engine = None
+    # 自托管服务开启 --refresh 时设置为 RefreshScheduler：按 profile 请求时直接返回预渲染的配置
+    scheduler = None
+
+    def _generate(self, providers, slot=None):
+        if self.engine is None:
+            return generate_config_from_providers(providers)
+        return self.engine.generate(providers, slot=slot)
+
+    def _generate_batch(self, profiles, slot=None):
+        if self.engine is None:
+            return generate_configs_for_profiles(profiles)
+        return self.engine.generate_batch(profiles, slot=slot)
+
+    def _send_json(self, status_code: int, data, pretty: bool = True, headers=None):
         """
         统一返回 JSON 响应。
 
@@ -54,33 +231,177 @@ class handler(BaseHTTPRequestHandler):
             status_code: int
                 HTTP 状态码（例如 200, 400, 500）。
             data: Any
-                将被 json.dumps 序列化为响应体。
+                将被 iter_config 逐段序列化并逐块写入响应体（模板静态段复用缓存的片段）。
+            pretty: bool
+                True 为缩进 2 格的格式化 JSON，False 为紧凑 JSON。
+            headers: dict | None
+                额外的响应头。
         """
-        body = json.dumps(data, ensure_ascii=False, indent=2).encode("utf-8")
         self.send_response(status_code)
         self.send_header("Content-Type", "application/json; charset=utf-8")
         # 允许跨域调用
         self.send_header("Access-Control-Allow-Origin", "*")
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        # 响应体边序列化边写出，事先不知道总长度：不发 Content-Length，写完即关闭连接
+        self.send_header("Connection", "close")
+        self.end_headers()
+        for chunk in iter_config(data, pretty):
+            self.wfile.write(chunk)
+
+    def _send_cached(self, entry, state, headers=None, content_type="application/json; charset=utf-8"):
+        """
+        返回缓存中的生成结果；请求头 If-None-Match 与 ETag 匹配时返回 304（不带响应体）。
+
+        参数：
+            entry: response_cache.CacheEntry
+                序列化后的配置。
+            state: str
+                缓存状态（hit / stale / miss / bypass / prerendered），通过 X-Cache 响应头返回。
+            headers: dict | None
+                额外的响应头。
+            content_type: str
+                响应体的 Content-Type。
+        """
+        not_modified = etag_matches(self.headers.get("If-None-Match"), entry.etag)
+        self.send_response(304 if not_modified else 200)
+        if not not_modified:
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(entry.body)))
+        self.send_header("Access-Control-Allow-Origin", "*")
+        self.send_header("ETag", entry.etag)
+        self.send_header("Cache-Control", response_cache.cache_control())
+        self.send_header("X-Cache", state)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
         self.end_headers()
-        self.wfile.write(body)
+        if not not_modified:
+            self.wfile.write(entry.body)
+
+    def _do_batch(self, qs):
+        """
+        批量生成 qs["profiles"] 中的各 profile（逗号分隔，可重复传参），结果按 profile 组合缓存。
+
+        参数：
+            qs: dict[str, list[str]]
+                解析后的查询参数；format 为 zip（默认）或 multipart，compact 同单个 profile。
+        """
+        names = []
+        for value in qs["profiles"]:
+            for name in value.split(","):
+                name = name.strip().lower()
+                if name and name not in names:
+                    names.append(name)
+        fmt = (qs.get("format", ["zip"])[0].strip().lower() or "zip")
+        if fmt not in BATCH_FORMATS:
+            return self._send_json(400, {
+                "error": "invalid format",
+                "detail": f"format must be one of {', '.join(BATCH_FORMATS)}",
+            })
+        if not names:
+            return self._send_json(400, {
+                "error": "missing profiles",
+                "detail": "profiles must list at least one profile, e.g. profiles=mac,router,ios",
+            })
+        unknown = [name for name in names if name not in PROFILE_ENV_MAP]
+        if unknown:
+            return self._send_json(400, {
+                "error": "unknown profiles",
+                "detail": f"known profiles: {', '.join(PROFILE_ENV_MAP)}",
+                "profiles": unknown,
+            })
+
+        profiles = {}
+        for name in names:
+            env_key = PROFILE_ENV_MAP[name]
+            providers_raw = os.environ.get(env_key, "").strip()
+            if not providers_raw:
+                return self._send_json(400, {
+                    "error": "missing providers configuration",
+                    "detail": f"environment variable {env_key} is empty",
+                    "profile": name,
+                    "env_key": env_key
+                })
+            try:
+                profiles[name] = json.loads(providers_raw)
+            except Exception as e:
+                return self._send_json(400, {
+                    "error": "invalid providers json",
+                    "detail": str(e),
+                    "profile": name,
+                    "env_key": env_key
+                })
+
+        compact = {name: "compact" in qs or is_compact_output(providers) for name, providers in profiles.items()}
+        cache_key = hash_key("profiles", fmt, [profile_cache_key(name, profiles[name], compact[name]) for name in names])
+        boundary = "profiles-" + cache_key[:32]
+
+        def generate():
+            with admission.admit() as slot:
+                configs, errors = self._generate_batch(profiles, slot)
+                if errors:
+                    raise BatchGenerateError({name: str(error) for name, error in errors.items()})
+                bodies = {name: dump_config(configs[name], not compact[name]) for name in names}
+                return pack_profiles(bodies, fmt, boundary)
+
+        try:
+            entry, state = response_cache.get(cache_key, generate)
+        except Saturated as e:
+            return self._send_json(503, {
+                "error": "server_busy",
+                "detail": e.reason,
+                "retry_after": e.retry_after,
+                "profiles": names
+            }, headers={"Retry-After": str(e.retry_after)})
+        except GenerateTimeout:
+            return self._send_json(504, {
+                "error": "generate_timeout",
+                "detail": f"generation did not finish within {self.engine.timeout}s",
+                "profiles": names
+            })
+        except BatchGenerateError as e:
+            return self._send_json(500, {
+                "error": "generate_config_failed",
+                "detail": str(e),
+                "errors": e.errors,
+                "profiles": names
+            })
+        except Exception as e:
+            return self._send_json(500, {
+                "error": "generate_config_failed",
+                "detail": str(e),
+                "profiles": names
+            })
+
+        headers = {}
+        if fmt == "zip":
+            headers["Content-Disposition"] = 'attachment; filename="profiles.zip"'
+        return self._send_cached(entry, state, headers, BATCH_FORMATS[fmt].format(boundary=boundary))
 
     def do_GET(self):
         """
         处理 GET 请求。
 
         模式：
+            0）监控：
+                /api/generate?stats
+                - 返回准入控制的并发数、队列深度与排队时间。
+
             1）调试模式：
                 /api/generate?debug[&profile=router]
                 - 用于查看当前 profile 对应读取到哪个环境变量，以及内容长度。
 
-            2）正常生成配置：
+            2）批量生成（见 _do_batch）：
+                /api/generate?profiles=mac,router,ios[&format=zip|multipart]
+
+            3）正常生成配置：
                 /api/generate?providers=<urlencoded_json>[&profile=xxx]
                 或
                 /api/generate?profile=mac / router
                 - 若 URL 中没有 providers，则按 profile 选择对应环境变量。
         """
         parsed = urlparse(self.path)
-        qs = parse_qs(parsed.query)
+        qs = parse_qs(parsed.query, keep_blank_values=True)
 
         # ---------------------------
         # 读取 profile，决定用哪套 SUB_CONFIG
@@ -89,14 +410,16 @@ class handler(BaseHTTPRequestHandler):
         # 不区分大小写，统一转小写
         profile = profile.lower()
 
-        # profile → 环境变量名映射
-        profile_env_map = {
-            "default": "SUB_CONFIG",       # 兼容旧逻辑
-            "mac": "SUB_CONFIG_MAC",      # 给 Mac / SFM 用
-            "router": "SUB_CONFIG_ROUTER",  # 给路由器用
-            "ios": "SUB_CONFIG_IOS"       # 给IOS用
-        }
-        env_key = profile_env_map.get(profile, "SUB_CONFIG")
+        env_key = PROFILE_ENV_MAP.get(profile, "SUB_CONFIG")
+
+        # ---------------------------
+        # 监控：准入控制统计
+        # ---------------------------
+        if "stats" in qs:
+            stats = {"admission": admission.stats()}
+            if self.engine is not None:
+                stats["engine"] = self.engine.stats()
+            return self._send_json(200, stats)
 
         # ---------------------------
         # Debug 模式：观察对应 profile 的 SUB_CONFIG
@@ -112,11 +435,25 @@ class handler(BaseHTTPRequestHandler):
                 "env_len": len(env_val) if isinstance(env_val, str) else None
             })
 
+        # ---------------------------
+        # 批量模式：多个 profile 共用一次订阅拉取
+        # ---------------------------
+        if "profiles" in qs:
+            return self._do_batch(qs)
+
         # ---------------------------
         # 读取 providers 参数（优先用 URL 中的 providers）
         # ---------------------------
         providers_raw = qs.get("providers", [None])[0]
 
+        # 后台刷新模式：按 profile 请求时直接返回预渲染的配置，X-Data-Age 为订阅数据的秒数
+        if self.scheduler is not None and not (providers_raw or "").strip():
+            rendered = self.scheduler.get(profile)
+            if rendered is not None and ("compact" not in qs or not rendered.pretty):
+                return self._send_cached(rendered.entry, "prerendered", {
+                    "X-Data-Age": str(int(rendered.data_age()))
+                })
+
         # 如果 URL 里没有 providers，则按 profile 从环境变量取
         if not providers_raw or not isinstance(providers_raw, str) or not providers_raw.strip():
             env_val = os.environ.get(env_key, "").strip()
@@ -149,10 +486,32 @@ class handler(BaseHTTPRequestHandler):
             })
 
         # ---------------------------
-        # 调用核心逻辑生成配置
+        # 调用核心逻辑生成配置（命中缓存时不重新生成）
         # ---------------------------
         try:
-            config = generate_config_from_providers(providers)
+            compact = "compact" in qs or is_compact_output(providers)
+            cache_key = profile_cache_key(profile, providers, compact)
+
+            def generate():
+                with admission.admit() as slot:
+                    return dump_config(self._generate(providers, slot), not compact)
+
+            entry, state = response_cache.get(cache_key, generate)
+        except Saturated as e:
+            return self._send_json(503, {
+                "error": "server_busy",
+                "detail": e.reason,
+                "retry_after": e.retry_after,
+                "profile": profile,
+                "env_key": env_key
+            }, headers={"Retry-After": str(e.retry_after)})
+        except GenerateTimeout:
+            return self._send_json(504, {
+                "error": "generate_timeout",
+                "detail": f"generation did not finish within {self.engine.timeout}s",
+                "profile": profile,
+                "env_key": env_key
+            })
         except Exception as e:
             return self._send_json(500, {
                 "error": "generate_config_failed",
@@ -164,4 +523,9 @@ class handler(BaseHTTPRequestHandler):
         # ---------------------------
         # 正常返回生成的配置
         # ---------------------------
-        return self._send_json(200, config)
\ No newline at end of file
+        return self._send_cached(entry, state)
+
+
+# Vercel 冷启动：导入模块时即在后台预热其他 profile，自托管服务在 generate_server.main 中预热
+if os.environ.get("VERCEL"):
+    start_warm_up()
@@ -0,0 +1,42 @@
+from urllib.parse import urlparse, parse_qs
+
+from admission import Saturated
+from api.generate import handler as generate_handler, warm_up_profiles, warm_up_token_ok
+
+
+class handler(generate_handler):
+    """
+    预热 PROFILE_ENV_MAP 中已配置的各 profile：加载并编译模板、导入协议解析模块。
+
+    约定：
+        - GET /api/warmup                           只做模板编译等准备工作
+        - GET /api/warmup?prefetch&token=<token>    同时并行拉取订阅、渲染各 profile 并写入响应缓存；
+          token 也可放在请求头 X-Warmup-Token 中，须与环境变量 WARMUP_TOKEN 一致，
+          未设置 WARMUP_TOKEN 时不允许通过 HTTP 触发 prefetch
+
+    返回：
+        - 成功：预热报告（各 profile 的模板、耗时与错误信息）
+        - token 不匹配：403；已有预热在进行或生成满载：503 + Retry-After
+    """
+
+    def do_GET(self):
+        qs = parse_qs(urlparse(self.path).query, keep_blank_values=True)
+        prefetch = "prefetch" in qs
+        if prefetch:
+            token = qs.get("token", [""])[0] or self.headers.get("X-Warmup-Token", "")
+            if not warm_up_token_ok(token):
+                return self._send_json(403, {
+                    "error": "forbidden",
+                    "detail": "prefetch requires a token matching WARMUP_TOKEN",
+                })
+        try:
+            report = warm_up_profiles(prefetch=prefetch)
+        except Saturated as e:
+            return self._send_json(503, {
+                "error": "server_busy",
+                "detail": e.reason,
+                "retry_after": e.retry_after,
+            }, headers={"Retry-After": str(e.retry_after)})
+        except Exception as e:
+            return self._send_json(500, {"error": "warmup_failed", "detail": str(e)})
+        return self._send_json(200, report)
@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+"""
+配置引用关系检查与裁剪。
+
+combin_to_config 生成的配置中，出站、endpoint、DNS server、rule_set 之间通过 tag 互相引用：
+    - route.rules / route.final / ntp 等 → 出站
+    - selector / urltest 的 outbounds、default，出站 / DNS server 的 detour → 出站
+    - dns.rules / dns.final / route.default_domain_resolver / domain_resolver → DNS server
+    - route.rules / dns.rules 的 rule_set → rule_set，rule_set 的 download_detour → 出站
+
+ReferenceGraph 从这些入口出发遍历，找出引用了不存在 tag 的悬空引用，以及从任何入口都
+无法到达的出站、DNS server、rule_set（例如没有规则引用的 rule_set、set_proxy_rule_dns
+生成但最终没有 DNS 规则使用的 *_dns server、未被任何分组包含的节点）。
+prune_config 删除这些不可达项，减少 sing-box 需要下载和常驻内存的内容。
+"""
+
+OUTBOUND = 'outbound'
+DNS_SERVER = 'dns_server'
+RULE_SET = 'rule_set'
+
+KIND_NAMES = {OUTBOUND: '出站', DNS_SERVER: 'DNS server', RULE_SET: 'rule_set'}
+
+
+class ConfigReferenceError(ValueError):
+    """配置中存在悬空引用（引用了不存在的 tag）"""
+
+    def __init__(self, dangling):
+        self.dangling = dangling
+        super().__init__('配置中存在无效引用：' + '；'.join(
+            f"{where} → {KIND_NAMES[kind]} {tag!r}" for where, kind, tag in dangling
+        ))
+
+
+def _as_list(value):
+    if value is None:
+        return []
+    return value if isinstance(value, list) else [value]
+
+
+def _resolver_tag(value):
+    # domain_resolver 可以是 tag 字符串，也可以是 {"server": tag, ...}
+    if isinstance(value, dict):
+        return value.get('server')
+    return value
+
+
+class ReferenceGraph:
+    """
+    配置的引用图。
+
+    属性：
+        defined: dict[str, dict[str, dict]]
+            种类 → { tag: 对象 }，同一 tag 出现多次时取第一个。
+        roots: list[tuple]
+            (引用位置, 种类, tag)：route / dns 规则等不依赖其他对象的入口引用。
+        edges: dict[tuple, list[tuple]]
+            (种类, tag) → [(引用位置, 种类, tag), ...]：对象之间的引用。
+    """
+
+    def __init__(self, config):
+        self.config = config
+        self.defined = {OUTBOUND: {}, DNS_SERVER: {}, RULE_SET: {}}
+        self.roots = []
+        self.edges = {}
+
+        route = config.get('route') if isinstance(config.get('route'), dict) else {}
+        dns = config.get('dns') if isinstance(config.get('dns'), dict) else {}
+        outbounds = list(config.get('outbounds') or []) + list(config.get('endpoints') or [])
+
+        for outbound in outbounds:
+            self.defined[OUTBOUND].setdefault(outbound.get('tag'), outbound)
+        for server in dns.get('servers') or []:
+            self.defined[DNS_SERVER].setdefault(server.get('tag'), server)
+        for rule_set in route.get('rule_set') or []:
+            self.defined[RULE_SET].setdefault(rule_set.get('tag'), rule_set)
+
+        # 对象之间的引用
+        for outbound in outbounds:
+            where = f"出站 {outbound.get('tag')!r}"
+            refs = [(where, OUTBOUND, tag) for tag in _as_list(outbound.get('outbounds'))]
+            for key in ('default', 'detour'):
+                if outbound.get(key):
+                    refs.append((f"{where}.{key}", OUTBOUND, outbound[key]))
+            if _resolver_tag(outbound.get('domain_resolver')):
+                refs.append((f"{where}.domain_resolver", DNS_SERVER, _resolver_tag(outbound['domain_resolver'])))
+            self.edges.setdefault((OUTBOUND, outbound.get('tag')), []).extend(refs)
+        for server in dns.get('servers') or []:
+            where = f"DNS server {server.get('tag')!r}"
+            refs = []
+            if server.get('detour'):
+                refs.append((f"{where}.detour", OUTBOUND, server['detour']))
+            for key in ('address_resolver', 'domain_resolver'):
+                if _resolver_tag(server.get(key)):
+                    refs.append((f"{where}.{key}", DNS_SERVER, _resolver_tag(server[key])))
+            self.edges.setdefault((DNS_SERVER, server.get('tag')), []).extend(refs)
+        for rule_set in route.get('rule_set') or []:
+            if rule_set.get('download_detour'):
+                self.edges.setdefault((RULE_SET, rule_set.get('tag')), []).append(
+                    (f"rule_set {rule_set.get('tag')!r}.download_detour", OUTBOUND, rule_set['download_detour'])
+                )
+
+        # 入口引用：规则、final、默认解析器以及其他静态段中的 detour
+        for index, rule in enumerate(route.get('rules') or []):
+            self._add_rule_roots(rule, f"route.rules[{index}]", 'outbound', OUTBOUND)
+        for index, rule in enumerate(dns.get('rules') or []):
+            self._add_rule_roots(rule, f"dns.rules[{index}]", 'server', DNS_SERVER)
+        # 未设置 final 时，sing-box 使用第一个出站 / 第一个 DNS server
+        if route.get('final'):
+            self.roots.append(('route.final', OUTBOUND, route['final']))
+        elif outbounds:
+            self.roots.append(('默认出站', OUTBOUND, outbounds[0].get('tag')))
+        if dns.get('final'):
+            self.roots.append(('dns.final', DNS_SERVER, dns['final']))
+        elif dns.get('servers'):
+            self.roots.append(('默认 DNS server', DNS_SERVER, dns['servers'][0].get('tag')))
+        if _resolver_tag(route.get('default_domain_resolver')):
+            self.roots.append(('route.default_domain_resolver', DNS_SERVER,
+                               _resolver_tag(route['default_domain_resolver'])))
+        for section, key in (('geoip', 'download_detour'), ('geosite', 'download_detour')):
+            if isinstance(route.get(section), dict) and route[section].get(key):
+                self.roots.append((f"route.{section}.{key}", OUTBOUND, route[section][key]))
+        ntp = config.get('ntp')
+        if isinstance(ntp, dict) and ntp.get('detour'):
+            self.roots.append(('ntp.detour', OUTBOUND, ntp['detour']))
+        clash_api = (config.get('experimental') or {}).get('clash_api') if isinstance(config.get('experimental'), dict) else None
+        if isinstance(clash_api, dict) and clash_api.get('external_ui_download_detour'):
+            self.roots.append(('experimental.clash_api.external_ui_download_detour', OUTBOUND,
+                               clash_api['external_ui_download_detour']))
+
+    def _add_rule_roots(self, rule, where, target_key, target_kind):
+        if rule.get(target_key):
+            self.roots.append((f"{where}.{target_key}", target_kind, rule[target_key]))
+        for tag in _as_list(rule.get('rule_set')):
+            self.roots.append((f"{where}.rule_set", RULE_SET, tag))
+        # logical 规则的子规则
+        for index, child in enumerate(rule.get('rules') or []):
+            if isinstance(child, dict):
+                self._add_rule_roots(child, f"{where}.rules[{index}]", target_key, target_kind)
+
+    def dangling(self):
+        """
+        返回所有悬空引用：[(引用位置, 种类, tag), ...]。
+        """
+        result = []
+        for ref in self.roots:
+            if ref[2] not in self.defined[ref[1]]:
+                result.append(ref)
+        for refs in self.edges.values():
+            for ref in refs:
+                if ref[2] not in self.defined[ref[1]]:
+                    result.append(ref)
+        return result
+
+    def reachable(self):
+        """
+        返回从入口出发可以到达的 (种类, tag) 集合。
+        """
+        seen = set()
+        stack = [(kind, tag) for _, kind, tag in self.roots]
+        while stack:
+            node = stack.pop()
+            if node in seen or node[1] not in self.defined[node[0]]:
+                continue
+            seen.add(node)
+            stack.extend((kind, tag) for _, kind, tag in self.edges.get(node, ()))
+        return seen
+
+    def unreachable(self):
+        """
+        返回不可达的对象：{ 种类: [tag, ...] }，保持配置中的顺序。
+        """
+        seen = self.reachable()
+        return {
+            kind: [tag for tag in tags if (kind, tag) not in seen]
+            for kind, tags in self.defined.items()
+        }
+
+    def direct_only_groups(self):
+        """
+        返回只剩 direct 出站的 selector / urltest（通常是展开后没有任何节点而被降级的分组）。
+        """
+        direct_tags = {
+            tag for tag, outbound in self.defined[OUTBOUND].items() if outbound.get('type') == 'direct'
+        }
+        return [
+            tag for tag, outbound in self.defined[OUTBOUND].items()
+            if outbound.get('type') in ('selector', 'urltest')
+            and outbound.get('outbounds')
+            and all(member in direct_tags for member in _as_list(outbound['outbounds']))
+        ]
+
+
+def prune_config(config, graph=None):
+    """
+    删除不可达的出站、endpoint、DNS server 和 rule_set。
+
+    只替换相关列表（以及 dns / route 段的浅拷贝），不修改原有对象，
+    模板中被多次渲染共享的静态段保持不变。
+
+    参数：
+        config: dict
+            渲染后的完整配置（原地替换其中的列表）。
+        graph: ReferenceGraph | None
+            已构建的引用图，为 None 时新建。
+
+    返回：
+        dict[str, list[str]]: 被删除的 { 种类: [tag, ...] }。
+    """
+    if graph is None:
+        graph = ReferenceGraph(config)
+    removed = graph.unreachable()
+    dead = {kind: set(tags) for kind, tags in removed.items()}
+
+    for section in ('outbounds', 'endpoints'):
+        if dead[OUTBOUND] and isinstance(config.get(section), list):
+            config[section] = [item for item in config[section] if item.get('tag') not in dead[OUTBOUND]]
+    if dead[DNS_SERVER] and isinstance(config.get('dns'), dict):
+        config['dns'] = dict(config['dns'])
+        config['dns']['servers'] = [
+            item for item in config['dns'].get('servers') or [] if item.get('tag') not in dead[DNS_SERVER]
+        ]
+    if dead[RULE_SET] and isinstance(config.get('route'), dict):
+        config['route'] = dict(config['route'])
+        config['route']['rule_set'] = [
+            item for item in config['route'].get('rule_set') or [] if item.get('tag') not in dead[RULE_SET]
+        ]
+    return removed
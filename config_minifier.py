@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+面向路由器等资源受限设备的配置精简。
+
+机场节点多时，outbounds / endpoints 中大量字段与 sing-box 默认值相同（解析器写出的
+packet_encoding: xudp、tls.insecure: false、空 headers、空 server_name 等），
+minify_config 在渲染之后删除这些字段和空容器，减小传输体积以及 sing-box 解析时的内存占用。
+配合紧凑 JSON 输出（无缩进）使用效果最好。
+
+只处理 outbounds / endpoints：模板中的 dns / route / inbounds 由用户维护，保持原样。
+默认值以 sing-box 1.12 为准。
+"""
+import json
+
+# 目标 sing-box 版本下，各出站类型中非零值的默认值；与默认值相同的字段可以省略
+TYPE_DEFAULTS = {
+    'vless': {'packet_encoding': 'xudp'},
+    'tuic': {'congestion_control': 'cubic', 'udp_relay_mode': 'native', 'heartbeat': '10s'},
+    'wireguard': {'mtu': 1408},
+    'anytls': {'idle_session_check_interval': '30s', 'idle_session_timeout': '30s'},
+}
+
+# 嵌套对象中非零值的默认值
+NESTED_DEFAULTS = {
+    'multiplex': {'protocol': 'h2mux'},
+}
+
+# 缺省与零值含义不同的字段（sing-box 中为指针类型），不能按零值删除
+# vless 的 packet_encoding 缺省为 xudp，而 "" 表示不使用任何 packet encoding
+KEEP_ZERO = {
+    'vless': {'packet_encoding'},
+}
+
+# 无论取值如何都必须保留的字段
+REQUIRED_FIELDS = {'tag', 'type'}
+
+
+class MinifyStats:
+    """minify_config 的统计：删除的字段数，以及按紧凑 JSON 计算节省的字节数"""
+
+    def __init__(self):
+        self.removed_fields = 0
+        self.bytes_saved = 0
+
+    def record(self, key, value):
+        self.removed_fields += 1
+        # 紧凑 JSON 中 "key":value, 的长度
+        self.bytes_saved += len(json.dumps(key, ensure_ascii=False).encode('utf-8')) \
+            + len(json.dumps(value, ensure_ascii=False, separators=(',', ':')).encode('utf-8')) + 2
+
+    def __str__(self):
+        return f"删除 {self.removed_fields} 个默认值 / 空字段，节省约 {self.bytes_saved / 1024:.1f} KB"
+
+
+def _is_zero(value):
+    return value is None or value is False or value == '' or value == [] or value == {} or (
+        type(value) is int and value == 0
+    )
+
+
+def _minify_object(obj, defaults, keep_zero, stats):
+    """
+    返回精简后的新 dict（不修改 obj，模板中的静态出站会被多次渲染共享）。
+    """
+    result = {}
+    for key, value in obj.items():
+        if isinstance(value, dict):
+            if value.get('enabled') is False:
+                # tls / multiplex / utls / reality 等未启用时，其余字段都不会生效
+                stats.record(key, value)
+                continue
+            value = _minify_object(value, NESTED_DEFAULTS.get(key, {}), (), stats)
+        elif isinstance(value, list):
+            value = [
+                _minify_object(item, {}, (), stats) if isinstance(item, dict) else item
+                for item in value
+            ]
+        if key not in REQUIRED_FIELDS:
+            if key in defaults and value == defaults[key] and type(value) is type(defaults[key]):
+                stats.record(key, value)
+                continue
+            if key not in keep_zero and _is_zero(value):
+                stats.record(key, value)
+                continue
+        result[key] = value
+    return result
+
+
+def minify_outbound(outbound, stats=None):
+    """
+    精简单个出站 / endpoint：删除与 sing-box 默认值相同的字段、零值字段和空容器。
+
+    参数：
+        outbound: dict
+            出站对象。
+        stats: MinifyStats | None
+            统计对象，为 None 时新建。
+
+    返回：
+        dict: 精简后的新对象。
+    """
+    if stats is None:
+        stats = MinifyStats()
+    out_type = outbound.get('type')
+    return _minify_object(
+        outbound, TYPE_DEFAULTS.get(out_type, {}), KEEP_ZERO.get(out_type, ()), stats
+    )
+
+
+def minify_config(config):
+    """
+    对完整配置中的 outbounds / endpoints 做精简（替换为新列表，不修改原有出站对象）。
+
+    参数：
+        config: dict | list
+            渲染后的完整配置；Only-nodes 模式下的节点列表也可直接传入。
+
+    返回：
+        (dict | list, MinifyStats): 精简后的配置与统计信息。
+    """
+    stats = MinifyStats()
+    if isinstance(config, list):
+        return [minify_outbound(item, stats) if isinstance(item, dict) else item for item in config], stats
+    for section in ('outbounds', 'endpoints'):
+        if isinstance(config.get(section), list):
+            config[section] = [
+                minify_outbound(item, stats) if isinstance(item, dict) else item
+                for item in config[section]
+            ]
+    return config, stats
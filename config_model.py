@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+sing-box 配置模板的索引视图。
+
+combin_to_config / set_proxy_rule_dns 需要反复按 tag 查找出站、DNS server、rule_set，
+ConfigModel 在原配置 dict 之上维护 tag → 对象的索引，插入 / 删除时同步更新，
+所有查找都是 O(1)。模型直接修改传入的 config，不做拷贝。
+"""
+
+
+class ConfigModel:
+    """
+    包装一份 sing-box 配置（dict），维护以下索引：
+        - outbounds：tag → 出站对象、type → 第一个该类型的出站
+        - dns.servers：tag → DNS server
+        - route.rule_set：tag → rule_set
+
+    同一 tag 出现多次时，索引指向第一个出现的对象（与原先线性查找的结果一致）。
+    """
+
+    def __init__(self, config):
+        self.config = config
+        if not isinstance(config.get('outbounds'), list):
+            config['outbounds'] = []
+        # insert_outbound_before_tail 的待插入出站，访问 outbounds 时统一拼接
+        self._pending_tail = []
+        self._pending_tail_size = 0
+        self._outbound_index = {}
+        self._outbound_type_index = {}
+        for outbound in config['outbounds']:
+            self._index_outbound(outbound)
+        self._dns_server_index = {}
+        for server in self.dns_servers:
+            self._dns_server_index.setdefault(server.get('tag'), server)
+        self._rule_set_index = {}
+        for rule_set in self.rule_sets:
+            self._rule_set_index.setdefault(rule_set.get('tag'), rule_set)
+
+    # ------------------------------------------------------------------
+    # outbounds
+    # ------------------------------------------------------------------
+    @property
+    def outbounds(self):
+        self._flush_pending_tail()
+        return self.config['outbounds']
+
+    def _index_outbound(self, outbound):
+        self._outbound_index.setdefault(outbound.get('tag'), outbound)
+        self._outbound_type_index.setdefault(outbound.get('type'), outbound)
+
+    def _reindex_outbounds(self):
+        self._outbound_index = {}
+        self._outbound_type_index = {}
+        for outbound in self.outbounds:
+            self._index_outbound(outbound)
+
+    def outbound(self, tag):
+        """按 tag 查找出站，不存在时返回 None。"""
+        return self._outbound_index.get(tag)
+
+    def first_outbound_of_type(self, type_name):
+        """返回第一个 type 为 type_name 的出站，不存在时返回 None。"""
+        return self._outbound_type_index.get(type_name)
+
+    def append_outbounds(self, outbounds):
+        """在末尾追加出站并建立索引。"""
+        self.outbounds.extend(outbounds)
+        for outbound in outbounds:
+            self._index_outbound(outbound)
+
+    def insert_outbound_before_tail(self, outbound, tail=2):
+        """
+        等价于 outbounds.insert(-tail, outbound)：插入到倒数第 tail 个出站之前。
+
+        连续插入时先暂存，下次访问 outbounds 时一次性拼接，避免每次插入都移动整个列表。
+        """
+        if self._pending_tail and tail != self._pending_tail_size:
+            self._flush_pending_tail()
+        self._pending_tail.append(outbound)
+        self._pending_tail_size = tail
+        self._index_outbound(outbound)
+
+    def _flush_pending_tail(self):
+        if not self._pending_tail:
+            return
+        outbounds = self.config['outbounds']
+        pending, tail = self._pending_tail, self._pending_tail_size
+        self._pending_tail = []
+        if len(outbounds) >= tail:
+            outbounds[len(outbounds) - tail:len(outbounds) - tail] = pending
+        else:
+            # 列表长度不足 tail 时保持 list.insert 的原始语义
+            for outbound in pending:
+                outbounds.insert(-tail, outbound)
+
+    def remove_outbound(self, tag):
+        """删除所有 tag 匹配的出站，返回删除的数量。"""
+        outbounds = self.outbounds
+        kept = [outbound for outbound in outbounds if outbound.get('tag') != tag]
+        removed = len(outbounds) - len(kept)
+        if removed:
+            outbounds[:] = kept
+            self._reindex_outbounds()
+        return removed
+
+    # ------------------------------------------------------------------
+    # dns.servers
+    # ------------------------------------------------------------------
+    @property
+    def dns_servers(self):
+        dns = self.config.get('dns')
+        if not isinstance(dns, dict):
+            return []
+        # 只读访问：不在被包装的配置（可能是共享的编译后模板）里补写空的 servers
+        return dns.get('servers') or []
+
+    def dns_server(self, tag):
+        """按 tag 查找 DNS server，不存在时返回 None。"""
+        return self._dns_server_index.get(tag)
+
+    def has_dns_server(self, tag):
+        return tag in self._dns_server_index
+
+    def add_dns_servers(self, servers):
+        """在 dns.servers 末尾追加 server 并建立索引。"""
+        self.config.setdefault('dns', {}).setdefault('servers', []).extend(servers)
+        for server in servers:
+            self._dns_server_index.setdefault(server.get('tag'), server)
+
+    def remove_dns_server(self, tag):
+        """删除所有 tag 匹配的 DNS server，返回删除的数量。"""
+        servers = self.dns_servers
+        kept = [server for server in servers if server.get('tag') != tag]
+        removed = len(servers) - len(kept)
+        if removed:
+            servers[:] = kept
+            self._dns_server_index = {}
+            for server in servers:
+                self._dns_server_index.setdefault(server.get('tag'), server)
+        return removed
+
+    # ------------------------------------------------------------------
+    # route.rule_set
+    # ------------------------------------------------------------------
+    @property
+    def rule_sets(self):
+        route = self.config.get('route')
+        if not isinstance(route, dict):
+            return []
+        return route.get('rule_set') or []
+
+    def rule_set(self, tag):
+        """按 tag 查找 rule_set，不存在时返回 None。"""
+        return self._rule_set_index.get(tag)
+
+    def add_rule_set(self, rule_set):
+        """在 route.rule_set 末尾追加并建立索引。"""
+        self.config.setdefault('route', {}).setdefault('rule_set', []).append(rule_set)
+        self._rule_set_index.setdefault(rule_set.get('tag'), rule_set)
+
+    def remove_rule_set(self, tag):
+        """删除所有 tag 匹配的 rule_set，返回删除的数量。"""
+        rule_sets = self.rule_sets
+        kept = [rule_set for rule_set in rule_sets if rule_set.get('tag') != tag]
+        removed = len(rule_sets) - len(kept)
+        if removed:
+            rule_sets[:] = kept
+            self._rule_set_index = {}
+            for rule_set in rule_sets:
+                self._rule_set_index.setdefault(rule_set.get('tag'), rule_set)
+        return removed
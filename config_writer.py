@@ -0,0 +1,320 @@
+#!/usr/bin/env python3
+"""
+配置输出：将合并后的 sing-box 配置序列化为 JSON 字节串。
+
+一份模板渲染出的配置里，inbounds、route、experimental、dns 等大段内容在每次渲染之间
+完全相同，真正变化的只有 outbounds / endpoints。iter_config 按顶层字段逐段序列化，
+静态段的结果缓存在来源模板上（每个模板版本只序列化一次），每次只序列化变化的部分；
+较长的列表（如 outbounds）按 CHUNK_ITEMS 个元素一块分段输出，写文件 / 写 socket 时
+逐块写入，不再拼成一个完整的大字符串。
+
+序列化后端可插拔（见 BACKENDS / set_backend）：默认使用 stdlib json；安装了 orjson 时
+自动使用 orjson（格式化输出与 json.dumps(indent=2, ensure_ascii=False) 一致，
+仅浮点数的指数写法不同），也可通过环境变量 JSON_BACKEND=json / orjson 指定。
+
+写文件统一走 write_atomic：临时文件 + fsync + rename，读取方（sing-box 重载、
+路由器拉取配置）不会看到缺失或写了一半的文件；write_if_changed 边写边计算哈希，
+内容未变化时丢弃临时文件、不替换。
+"""
+import glob
+import hashlib
+import json
+import os
+import re
+import shutil
+import tempfile
+from datetime import datetime
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# 长列表分段输出时每段包含的元素个数
+CHUNK_ITEMS = 1000
+
+
+def _json_dumps(value, pretty):
+    if pretty:
+        return json.dumps(value, indent=2, ensure_ascii=False).encode('utf-8')
+    return json.dumps(value, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def _orjson_dumps(value, pretty):
+    try:
+        return orjson.dumps(value, option=orjson.OPT_INDENT_2 if pretty else 0)
+    except TypeError:
+        # 非字符串 key、超出 64 位的整数等 orjson 不支持的内容，退回 stdlib
+        return _json_dumps(value, pretty)
+
+
+# 后端名称 -> dumps(value, pretty) -> bytes
+BACKENDS = {'json': _json_dumps}
+if orjson is not None:
+    BACKENDS['orjson'] = _orjson_dumps
+
+_backend_name = 'orjson' if orjson is not None else 'json'
+_dumps = BACKENDS[_backend_name]
+
+
+def set_backend(name):
+    """
+    切换序列化后端。
+
+    参数：
+        name: str
+            BACKENDS 中的名称，例如 'json'、'orjson'。
+    """
+    global _backend_name, _dumps
+    if name not in BACKENDS:
+        raise ValueError(f"未知或未安装的 JSON 后端: {name}，可选: {', '.join(BACKENDS)}")
+    _backend_name, _dumps = name, BACKENDS[name]
+
+
+def get_backend():
+    """返回当前使用的序列化后端名称。"""
+    return _backend_name
+
+
+if os.environ.get('JSON_BACKEND'):
+    try:
+        set_backend(os.environ['JSON_BACKEND'].strip().lower())
+    except ValueError as e:
+        print(f"{e}，继续使用 {_backend_name}")
+
+
+class RenderedConfig(dict):
+    """
+    CompiledTemplate.render 的返回值：普通 dict，额外记录来源模板。
+
+    template 需提供 fragment(key, value, pretty)：value 为模板静态段时返回缓存的片段，
+    否则返回 None。
+    """
+    template = None
+
+
+def _key_prefix(key, pretty):
+    name = json.dumps(key, ensure_ascii=False)
+    return ('  ' + name + ': ' if pretty else name + ':').encode('utf-8')
+
+
+def dump_fragment(key, value, pretty=True):
+    """
+    序列化顶层字段 key: value，返回可直接拼接进顶层对象的字节片段。
+
+    pretty=True 时与 indent=2 的输出一致（片段自带一级缩进）；
+    pretty=False 时使用最紧凑的分隔符。
+    """
+    text = _dumps(value, pretty)
+    if pretty:
+        # JSON 字符串中的换行均已转义，因此直接在每个换行后补一级缩进即可
+        text = text.replace(b'\n', b'\n  ')
+    return _key_prefix(key, pretty) + text
+
+
+def iter_fragment(key, value, pretty=True):
+    """
+    与 dump_fragment 输出相同，但长列表按 CHUNK_ITEMS 个元素分段逐块产出。
+    """
+    if not isinstance(value, list) or len(value) <= CHUNK_ITEMS:
+        yield dump_fragment(key, value, pretty)
+        return
+    yield _key_prefix(key, pretty) + b'['
+    for start in range(0, len(value), CHUNK_ITEMS):
+        text = _dumps(value[start:start + CHUNK_ITEMS], pretty)
+        if pretty:
+            # "[\n    a,\n    b\n  ]" → "\n    a,\n    b"
+            text = text.replace(b'\n', b'\n  ')[1:-4]
+        else:
+            text = text[1:-1]
+        yield text if start == 0 else b',' + text
+    yield b'\n  ]' if pretty else b']'
+
+
+def iter_config(config, pretty=True):
+    """
+    将配置序列化为 UTF-8 JSON，逐块产出字节片段。
+
+    参数：
+        config: Any
+            最终配置。RenderedConfig 会复用模板上缓存的静态段片段；
+            其他 dict 逐个顶层字段序列化，非 dict（如 Only-nodes 的节点列表）整体序列化。
+        pretty: bool
+            True 输出缩进 2 格的格式化 JSON，False 输出紧凑 JSON。
+    """
+    if not isinstance(config, dict):
+        yield _dumps(config, pretty)
+        return
+    if not config:
+        yield b'{}'
+        return
+
+    template = getattr(config, 'template', None)
+    yield b'{\n' if pretty else b'{'
+    for index, (key, value) in enumerate(config.items()):
+        if index:
+            yield b',\n' if pretty else b','
+        fragment = template.fragment(key, value, pretty) if template is not None else None
+        if fragment is not None:
+            yield fragment
+        else:
+            yield from iter_fragment(key, value, pretty)
+    yield b'\n}' if pretty else b'}'
+
+
+def dump_config(config, pretty=True):
+    """
+    将配置序列化为 UTF-8 JSON 字节串（iter_config 的各段拼接）。
+
+    返回：
+        bytes: 序列化结果。
+    """
+    return b''.join(iter_config(config, pretty))
+
+
+def _as_chunks(data):
+    return (data,) if isinstance(data, (bytes, bytearray)) else data
+
+
+def _file_digest(path):
+    """返回 path 内容的 SHA-256 digest（分块读取），文件不存在时返回 None"""
+    digest = hashlib.sha256()
+    try:
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+    except FileNotFoundError:
+        return None
+    return digest.digest()
+
+
+def content_changed(path, data):
+    """
+    比较 path 现有内容与 data 的 SHA-256，文件不存在或内容不同时返回 True。
+
+    data 可以是 bytes，也可以是 bytes 片段的可迭代对象（如 iter_config(...)）。
+    """
+    current = _file_digest(path)
+    if current is None:
+        return True
+    digest = hashlib.sha256()
+    for chunk in _as_chunks(data):
+        digest.update(chunk)
+    return current != digest.digest()
+
+
+def _write_replace(path, data, current=None, before_replace=None):
+    """
+    write_atomic / write_if_changed 的实现：逐块写入同目录临时文件，再 os.replace 覆盖 path。
+
+    current 不为 None 时边写边计算 SHA-256，与 current 相同则丢弃临时文件、不替换；
+    before_replace 在替换前调用（如备份旧文件）。
+
+    返回：
+        bool: 已替换 path 时返回 True。
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.' + os.path.basename(path) + '.', suffix='.tmp')
+    digest = hashlib.sha256() if current is not None else None
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            for chunk in _as_chunks(data):
+                f.write(chunk)
+                if digest is not None:
+                    digest.update(chunk)
+            unchanged = digest is not None and digest.digest() == current
+            if not unchanged:
+                f.flush()
+                os.fsync(f.fileno())
+        if unchanged:
+            os.remove(tmp_path)
+            return False
+        if before_replace is not None:
+            before_replace()
+        try:
+            mode = os.stat(path).st_mode & 0o7777
+        except FileNotFoundError:
+            umask = os.umask(0)
+            os.umask(umask)
+            mode = 0o666 & ~umask
+        os.chmod(tmp_path, mode)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    # 目录项也落盘，避免断电后 rename 丢失（Windows 不支持对目录 fsync）
+    if hasattr(os, 'O_DIRECTORY'):
+        dir_fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+    return True
+
+
+def write_atomic(path, data):
+    """
+    原子写入：先写同目录下的临时文件并 fsync，再 os.replace 覆盖 path。
+
+    data 可以是 bytes，也可以是 bytes 片段的可迭代对象（逐块写入）。
+
+    已存在的文件保留原有权限；新文件按当前 umask 使用默认权限。
+    """
+    _write_replace(path, data)
+
+
+def write_if_changed(path, data, backup_keep=None):
+    """
+    与 write_atomic 相同，但内容与 path 现有内容一致时不替换文件。
+
+    data 逐块写入临时文件的同时计算 SHA-256，写完后与现有文件比较，
+    因此片段只需遍历一次，不必先收集成列表或拼接成完整的字节串。
+
+    参数：
+        path: str
+            目标文件路径。
+        data: bytes | Iterable[bytes]
+            要写入的内容。
+        backup_keep: int | None
+            不为 None 时，替换前先备份旧文件，并只保留最新的 backup_keep 份（见 backup_file）。
+
+    返回：
+        bool: 内容有变化并已写入时返回 True，内容未变化时返回 False。
+    """
+    before_replace = None
+    if backup_keep is not None:
+        before_replace = lambda: backup_file(path, backup_keep)
+    return _write_replace(path, data, _file_digest(path), before_replace)
+
+
+def backup_file(path, keep=5):
+    """
+    将 path 备份为 path.YYYYMMDDHHMMSS.bak，并只保留最新的 keep 份备份。
+
+    备份优先使用硬链接（随后 write_atomic 替换 path 时原文件内容仍保留在备份中），
+    不支持硬链接时退回复制。keep <= 0 表示不限制数量。
+
+    返回：
+        str | None: 备份文件路径；path 不存在时返回 None。
+    """
+    if not os.path.exists(path):
+        return None
+    backup_path = f"{path}.{datetime.now().strftime('%Y%m%d%H%M%S')}.bak"
+    if os.path.exists(backup_path):
+        os.remove(backup_path)
+    try:
+        os.link(path, backup_path)
+    except OSError:
+        shutil.copy2(path, backup_path)
+
+    if keep and keep > 0:
+        pattern = re.compile(re.escape(os.path.basename(path)) + r'\.\d{14}\.bak$')
+        backups = sorted(
+            item for item in glob.glob(glob.escape(path) + '.*.bak')
+            if pattern.match(os.path.basename(item))
+        )
+        for old in backups[:-keep]:
+            os.remove(old)
+    return backup_path
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+自托管的 /api/generate 服务（在 Vercel 之外运行，例如小型 VPS）。
+
+api/generate.py 的 handler 直接用 http.server 运行时一次只处理一个请求，一个慢机场会阻塞其他客户端。
+这里用固定大小的线程池并发处理请求，订阅拉取与渲染交给 GenerationEngine（独立线程池 + 超时，
+超时返回 504）；同一进程内的响应缓存、编译后的模板缓存和 HTTP 连接池在请求之间复用。
+
+用法：
+    python generate_server.py --port 8000 --workers 16 --generate-workers 4 --timeout 60
+    python generate_server.py --refresh --refresh-interval 1800 --refresh-output-dir ./profiles
+
+--refresh 启用后台刷新（见 refresh_scheduler）：各 profile 预先渲染，按 profile 请求时直接返回，
+响应头 X-Data-Age 为订阅数据的秒数；尚未渲染完成的 profile 仍按请求实时生成。
+
+启动时先预热各 profile（--warmup，默认读取 WARMUP 或 basic，见 warmup），
+也可随时访问 http://HOST:PORT/api/warmup 重新预热（?prefetch 需带上 WARMUP_TOKEN，见 api/warmup.py）。
+
+访问方式与 Vercel 相同：http://HOST:PORT/api/generate?profile=router
+"""
+import argparse
+import os
+from concurrent.futures import ThreadPoolExecutor
+from http.server import HTTPServer
+
+from generation_engine import GenerationEngine
+from refresh_scheduler import RefreshScheduler
+from api.generate import handler, warm_up_profiles
+from api.warmup import handler as warmup_handler
+
+
+class PooledHTTPServer(HTTPServer):
+    """
+    用固定大小线程池处理连接的 HTTPServer
+    （ThreadingHTTPServer 为每个请求新建线程，数量不受限制）。
+
+    参数：
+        server_address: tuple[str, int]
+            监听地址。
+        handler_class: type
+            请求处理类。
+        workers: int
+            同时处理的请求数，超出的连接在线程池队列中等待。
+    """
+
+    def __init__(self, server_address, handler_class, workers=16):
+        super().__init__(server_address, handler_class)
+        self.executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix='http')
+
+    def process_request(self, request, client_address):
+        self.executor.submit(self.process_request_worker, request, client_address)
+
+    def process_request_worker(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+    def server_close(self):
+        super().server_close()
+        self.executor.shutdown(wait=False)
+
+
+class ServerHandler(handler):
+    """按路径分发：/api/warmup 交给 api.warmup，其余路径按 /api/generate 处理。"""
+
+    def do_GET(self):
+        if self.path.split('?', 1)[0].rstrip('/') == '/api/warmup':
+            return warmup_handler.do_GET(self)
+        return super().do_GET()
+
+
+def make_server(host='0.0.0.0', port=8000, workers=16, generate_workers=None, timeout=None, socket_timeout=30,
+                scheduler=None):
+    """
+    创建自托管服务。
+
+    参数：
+        host / port:
+            监听地址。
+        workers: int
+            HTTP 工作线程数。
+        generate_workers: int | None
+            生成线程数（GenerationEngine，默认读取 GENERATE_WORKERS）。
+        timeout: float | None
+            单次生成的超时时间（秒，默认读取 GENERATE_TIMEOUT），超时返回 504。
+        socket_timeout: float | None
+            读取请求 / 写出响应时的 socket 超时（秒），防止慢客户端长期占用工作线程。
+        scheduler: RefreshScheduler | None
+            后台刷新调度器，设置后按 profile 请求时返回预渲染的配置。
+
+    返回：
+        PooledHTTPServer: 尚未开始 serve_forever 的服务。
+    """
+    engine = GenerationEngine(max_workers=generate_workers, timeout=timeout)
+    request_handler = type('handler', (ServerHandler,), {
+        'engine': engine, 'timeout': socket_timeout, 'scheduler': scheduler,
+    })
+    return PooledHTTPServer((host, port), request_handler, workers=workers)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='自托管 /api/generate 服务')
+    parser.add_argument('--host', default=os.environ.get('GENERATE_SERVER_HOST', '0.0.0.0'), help='监听地址')
+    parser.add_argument('--port', type=int, default=int(os.environ.get('PORT', '8000')), help='监听端口')
+    parser.add_argument('--workers', type=int, default=int(os.environ.get('GENERATE_SERVER_WORKERS', '16')),
+                        help='HTTP 工作线程数')
+    parser.add_argument('--generate-workers', type=int, default=None, help='生成线程数（默认 GENERATE_WORKERS 或 4）')
+    parser.add_argument('--timeout', type=float, default=None, help='单次生成超时秒数（默认 GENERATE_TIMEOUT，不设置则不限制）')
+    parser.add_argument('--socket-timeout', type=float, default=30, help='socket 读写超时秒数')
+    parser.add_argument('--refresh', action='store_true', help='后台刷新订阅并预渲染各 profile')
+    parser.add_argument('--refresh-interval', type=float, default=None,
+                        help='订阅默认刷新间隔秒数（默认 REFRESH_INTERVAL 或 1800）')
+    parser.add_argument('--refresh-output-dir', default=None, help='预渲染结果同时写入的目录')
+    parser.add_argument('--warmup', choices=('off', 'basic', 'prefetch'),
+                        default=(os.environ.get('WARMUP') or 'basic').strip().lower(),
+                        help='启动时预热：off 不预热，basic 编译模板，prefetch 同时拉取订阅并渲染（默认 WARMUP 或 basic）')
+    args = parser.parse_args()
+
+    if args.warmup != 'off':
+        report = warm_up_profiles(prefetch=args.warmup == 'prefetch')
+        print(f"预热完成：{len(report['profiles'])} 个 profile，耗时 {report['time']} 秒")
+
+    scheduler = None
+    if args.refresh:
+        if args.refresh_output_dir:
+            os.makedirs(args.refresh_output_dir, exist_ok=True)
+        scheduler = RefreshScheduler(interval=args.refresh_interval, output_dir=args.refresh_output_dir).start()
+    server = make_server(args.host, args.port, args.workers, args.generate_workers, args.timeout, args.socket_timeout,
+                         scheduler)
+    print(f'generate 服务已启动：http://{args.host}:{args.port}/api/generate'
+          f'（HTTP 线程 {args.workers}，生成线程 {server.RequestHandlerClass.engine.max_workers}）')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        server.RequestHandlerClass.engine.shutdown(wait=False)
+        if scheduler is not None:
+            scheduler.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+进程内配置生成引擎。
+
+Flask 的 /config 与 /generate_config 原先每个请求都启动一个新的 python main.py 子进程
+（重新导入 flask、requests、yaml、paramiko 等），再从 /tmp 或当前目录读回生成的文件。
+GenerationEngine 直接在当前进程中调用 main.generate_config_from_providers，
+由固定大小的线程池执行，生成结果在内存中直接序列化返回；
+编译后的模板、filter 正则等缓存也能在请求之间复用。
+
+等待超时（timeout）只是让请求提前返回，工作线程中的拉取与渲染会继续执行到结束。
+这类仍在运行的超时任务计入 stats()，全部工作线程都被它们占满时拒绝新的生成（Saturated）；
+传入 admission 的 slot 时，名额一直占用到任务真正结束。
+"""
+import math
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+
+from admission import Saturated
+
+
+class GenerationEngine:
+    """
+    固定大小线程池上的配置生成引擎。
+
+    参数：
+        max_workers: int | None
+            工作线程数，默认读取环境变量 GENERATE_WORKERS（缺省为 4）。
+        timeout: float | None
+            单次生成的最长等待时间（秒），默认读取环境变量 GENERATE_TIMEOUT（缺省不限制）。
+    """
+
+    def __init__(self, max_workers=None, timeout=None):
+        if max_workers is None:
+            max_workers = int(os.environ.get('GENERATE_WORKERS', '4'))
+        if timeout is None and os.environ.get('GENERATE_TIMEOUT'):
+            timeout = float(os.environ['GENERATE_TIMEOUT'])
+        self.max_workers = max(1, max_workers)
+        self.timeout = timeout
+        # 每次生成使用独立的 GenerationContext，多个工作线程可以同时生成
+        self.executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='generate')
+        # 等待已超时、仍在工作线程中运行的任务
+        self._abandoned = set()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def resolve_template(providers_data, template_index=None):
+        """
+        providers 中没有 config_template 时，按 template_index（从 0 开始）
+        选择 config_template 目录下的本地模板，返回新的 providers dict。
+        template_index 为 None 时不做选择（与 /api/generate 一致，由 generate_config_from_providers 报错）。
+        """
+        import main
+
+        providers_data = dict(providers_data)
+        if template_index is None or (providers_data.get('config_template') or '').strip() \
+                or providers_data.get('Only-nodes'):
+            return providers_data
+        template_list = main.get_template()
+        if not template_list:
+            raise ValueError('没有找到模板文件')
+        index = int(template_index) if template_index != '' else 0
+        if index < 0 or index >= len(template_list):
+            raise ValueError(f'模板序号超出范围: {template_index}')
+        providers_data['config_template'] = os.path.join('config_template', template_list[index] + '.json')
+        return providers_data
+
+    def _generate(self, providers_data, template_index):
+        import main
+
+        providers_data = self.resolve_template(providers_data, template_index)
+        return main.generate_config_from_providers(providers_data)
+
+    def _submit(self, fn, *args):
+        with self._lock:
+            if len(self._abandoned) >= self.max_workers:
+                raise Saturated('生成线程均被超时的任务占用', self.retry_after())
+        return self.executor.submit(fn, *args)
+
+    def _wait(self, future, slot=None):
+        """
+        等待 future 最多 timeout 秒；超时的 future 记为仍在运行，直到其真正结束。
+        slot 为 admission.Slot 时，名额随 future 一起释放。
+        """
+        if slot is not None:
+            slot.hold_until(future)
+        try:
+            return future.result(timeout=self.timeout)
+        except TimeoutError:
+            with self._lock:
+                self._abandoned.add(future)
+            future.add_done_callback(self._forget)
+            raise
+
+    def _forget(self, future):
+        with self._lock:
+            self._abandoned.discard(future)
+
+    def retry_after(self):
+        """超时任务占满工作线程时建议的重试秒数（至少 1 秒）。"""
+        return max(1, math.ceil(self.timeout or 1))
+
+    def submit(self, providers_data, template_index=None):
+        """
+        提交一次生成，返回 concurrent.futures.Future，结果为 generate_config_from_providers 的返回值。
+
+        异常：
+            Saturated: 工作线程全部被超时仍在运行的任务占用。
+        """
+        return self._submit(self._generate, providers_data, template_index)
+
+    def generate(self, providers_data, template_index=None, slot=None):
+        """
+        生成配置并等待结果（最多等待 timeout 秒）。slot 见 _wait。
+        """
+        return self._wait(self.submit(providers_data, template_index), slot)
+
+    def generate_batch(self, profiles, slot=None):
+        """
+        批量生成多个 profile 并等待结果（最多等待 timeout 秒），订阅只拉取一次，
+        返回值同 main.generate_configs_for_profiles。slot 见 _wait。
+        """
+        import main
+
+        return self._wait(self._submit(main.generate_configs_for_profiles, profiles), slot)
+
+    def render(self, providers_data, template_index=None, slot=None):
+        """
+        生成配置并序列化为 UTF-8 JSON 字节串（格式化 / 紧凑与 save_config 写文件时一致）。
+        """
+        import main
+
+        final_config = self.generate(providers_data, template_index, slot)
+        return main.dump_config(final_config, not main.is_compact_output(providers_data))
+
+    def stats(self):
+        """返回工作线程数、超时时间与超时后仍在运行的任务数。"""
+        with self._lock:
+            return {
+                'max_workers': self.max_workers,
+                'timeout': self.timeout,
+                'timed_out_running': len(self._abandoned),
+            }
+
+    def shutdown(self, wait=True):
+        self.executor.shutdown(wait=wait)
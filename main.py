@@ -1,15 +1,19 @@
 #!/usr/bin/env python3
 import json, os, tool, time, requests, sys, importlib, argparse, yaml, ruamel.yaml
-import re
-from datetime import datetime
+import re, functools, copy, threading
 from urllib.parse import urlparse
-from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from api.app import TEMP_DIR
 from parsers.clash2base64 import clash2v2ray
 from gh_proxy_helper import set_gh_proxy
+from config_model import ConfigModel
+from config_minifier import minify_config
+from config_graph import ReferenceGraph, ConfigReferenceError, prune_config, KIND_NAMES
+from config_writer import (
+    RenderedConfig, dump_config, dump_fragment, iter_config, get_backend,
+    write_if_changed,
+)
 
-parsers_mod = {}
-providers = None
 color_code = [31, 32, 33, 34, 35, 36, 91, 92, 93, 94, 95, 96]
 
 
@@ -33,19 +37,92 @@ def loop_color(text):
     return text
 
 
+@functools.lru_cache(maxsize=None)
 def init_parsers():
     """
     初始化协议解析模块。
 
     扫描 parsers 目录下所有 .py 文件，
-    并通过 importlib 动态导入，填充 parsers_mod 映射：
+    并通过 importlib 动态导入，返回映射：
         文件名 -> 对应模块对象
+
+    进程内只导入一次，结果由各 GenerationContext 共享，调用方不应修改。
     """
+    parsers = {}
     for path, dirs, files in os.walk('parsers'):
         for file in files:
             name, ext = os.path.splitext(file)
             if ext == '.py':
-                parsers_mod[name] = importlib.import_module('parsers.' + name)
+                parsers[name] = importlib.import_module('parsers.' + name)
+    return parsers
+
+
+class GenerationContext:
+    """
+    一次配置生成的上下文，在整个生成流程中显式传递
+    （process_subscribes → get_nodes → get_parser，渲染、收尾检查与保存），
+    取代原先的模块级全局变量 providers / parsers_mod / args / temp_json_data，
+    同一进程内可以同时执行多次生成，互不影响。
+
+    参数：
+        providers: dict | None
+            本次生成使用的 providers 配置，结构与 providers.json 一致。
+            保存的是深拷贝：生成过程中对订阅项的修改（如拼接 subgroup 后的 tag）
+            不会影响调用方传入的对象，也不会泄漏到下一次生成。
+        parsers: dict[str, module] | None
+            协议名 -> 解析模块，为 None 时使用 init_parsers() 的结果。
+        fetched: dict[str, list[dict]] | None
+            订阅 url -> 预先拉取的节点列表（如后台刷新调度器缓存的结果），
+            命中时不再发起请求。
+    """
+
+    def __init__(self, providers=None, parsers=None, fetched=None):
+        self.providers = copy.deepcopy(providers) if providers else {}
+        self.parsers = init_parsers() if parsers is None else parsers
+        self.fetched = fetched or {}
+
+    def get(self, key, default=None):
+        """读取 providers 中的设置项。"""
+        return self.providers.get(key, default)
+
+    def user_agent(self, url):
+        """
+        返回订阅 url 对应的自定义 User-Agent（未配置时为空字符串）。
+        """
+        UA = ''
+        for subscribe in self.providers.get('subscribes') or []:
+            if 'enabled' in subscribe and not subscribe['enabled']:
+                continue
+            if subscribe['url'] == url:
+                UA = subscribe.get('User-Agent', '')
+        return UA
+
+    def subscription_key(self, url):
+        """
+        订阅的拉取结果由 url、User-Agent 与 exclude_protocol 决定，三者相同的订阅可以共用一次拉取。
+        """
+        return (url, self.user_agent(url), self.get('exclude_protocol') or '')
+
+    def fetch_nodes(self, url):
+        """
+        返回订阅 url 的节点列表：fetched 中已有时返回其深拷贝（后续处理会修改节点），
+        否则调用 get_nodes 拉取。
+        """
+        if url in self.fetched:
+            return copy.deepcopy(self.fetched[url])
+        return get_nodes(url, self)
+
+
+def active_subscribes(subscribes):
+    """
+    返回需要拉取的订阅：跳过未启用的订阅（enabled = false）
+    以及指向自身服务的订阅（防止循环订阅）。
+    """
+    return [
+        subscribe for subscribe in subscribes
+        if not ('enabled' in subscribe and not subscribe['enabled'])
+        and 'sing-box-subscribe-doraemon.vercel.app' not in subscribe['url']
+    ]
 
 
 def get_template():
@@ -81,7 +158,51 @@ def load_json(path):
     return json.loads(tool.readFile(path))
 
 
-def process_subscribes(subscribes):
+@functools.lru_cache(maxsize=16)
+def compile_template_source(content):
+    """
+    将模板原文编译为 CompiledTemplate，按原文内容缓存。
+
+    同一份模板（内容完全相同）只解析、编译一次，之后的请求直接复用。
+
+    参数：
+        content: bytes
+            模板原文，优先按 JSON 解析，失败时再尝试 YAML。
+
+    返回：
+        CompiledTemplate: 编译后的模板（多次渲染共享，不可修改）。
+    """
+    try:
+        config = json.loads(content)
+    except Exception:
+        try:
+            config = yaml.safe_load(content.decode('utf-8'))
+        except Exception as e:
+            raise ValueError(f"读取远程模板失败: {e}")
+    return CompiledTemplate(config)
+
+
+def load_compiled_template(path):
+    """
+    读取本地模板文件并编译，文件未变化（mtime、大小相同）时直接复用缓存。
+
+    参数：
+        path: str
+            本地模板文件路径。
+
+    返回：
+        CompiledTemplate: 编译后的模板。
+    """
+    stat = os.stat(path)
+    return _load_compiled_template(path, stat.st_mtime_ns, stat.st_size)
+
+
+@functools.lru_cache(maxsize=16)
+def _load_compiled_template(path, mtime_ns, size):
+    return CompiledTemplate(load_json(path))
+
+
+def process_subscribes(subscribes, ctx):
     """
     处理所有订阅配置，生成按 tag 分组的节点字典。
 
@@ -94,25 +215,23 @@ def process_subscribes(subscribes):
         - 如果设置了 subgroup，将其附加到订阅 tag 上
         - 将节点按最终 tag 分组累加
 
+    参数：
+        subscribes: list[dict]
+            订阅配置列表（通常为 ctx.providers["subscribes"]）。
+        ctx: GenerationContext
+            本次生成的上下文。
+
     返回：
         dict[str, list[dict]]: { tag: [node, ...], ... }
     """
     nodes = {}
-    for subscribe in subscribes:
-        # 跳过未启用的订阅
-        if 'enabled' in subscribe and not subscribe['enabled']:
-            continue
-
-        # 避免递归调用自身提供的订阅服务
-        if 'sing-box-subscribe-doraemon.vercel.app' in subscribe['url']:
-            continue
-
-        _nodes = get_nodes(subscribe['url'])
+    # 跳过未启用的订阅，避免递归调用自身提供的订阅服务
+    for subscribe in active_subscribes(subscribes):
+        _nodes = ctx.fetch_nodes(subscribe['url'])
         
         if _nodes and len(_nodes) > 0:
-            add_prefix(_nodes, subscribe)
-            add_emoji(_nodes, subscribe)
-            nodefilter(_nodes, subscribe)
+            # 前缀 / emoji / ex-node-name 过滤合并为单次遍历
+            _nodes = compile_subscribe_transform(subscribe)(_nodes)
 
             # subgroup 存在时，将其拼接到 tag，中间增加标记 "subgroup"
             if subscribe.get('subgroup'):
@@ -131,22 +250,56 @@ def process_subscribes(subscribes):
     return nodes
 
 
-def action_keywords(nodes, action, keywords):
+@functools.lru_cache(maxsize=1024)
+def compile_regex(pattern):
+    """
+    编译并缓存正则表达式，模板中重复出现的 keywords / server_regex 只编译一次。
+    编译失败时抛出 re.error（异常不会被缓存）。
+    """
+    return re.compile(pattern)
+
+
+# 正则元字符：keyword 中不含这些字符时按普通子串匹配即可
+REGEX_META_CHARS = frozenset('.^$*+?{}[]\\|()')
+
+
+def split_literal_keyword(keyword):
+    """
+    若 keyword 只是若干普通字面量用 "|" 连接（如 "🇭🇰|HK|香港"），返回字面量列表；
+    含其他正则语法（分组、(?i)、字符类等）时返回 None。
     """
-    Filter nodes by matching node['tag'] against a list of regex patterns.
+    parts = keyword.split('|')
+    if all(REGEX_META_CHARS.isdisjoint(part) for part in parts):
+        return parts
+    return None
 
-    Usage:
-        action == "include": keep nodes that match ANY keyword regex
-        action == "exclude": remove nodes that match ANY keyword regex
 
-    Notes:
-        - Each keyword is treated as an independent regex pattern.
-        - This supports inline regex flags such as (?i).
-        - Avoid joining patterns with "|" because inline flags in the middle
-          of a combined regex will raise:
+def compile_literal_matcher(literals):
+    """
+    将一组字面量编译为一个多模式匹配器（转义后用 "|" 合并的单个正则），
+    一次 search 即可判断是否包含任意字面量。
+
+    re 是回溯引擎，不会构建 Aho-Corasick 这类自动机：在 tag 的每个位置仍逐个尝试各分支，
+    耗时同时随 tag 长度和字面量个数增长。提速来自省掉逐个 keyword 的 Python 循环和多次
+    search 调用，而不是匹配算法本身的复杂度变化。
+    """
+    return compile_regex('|'.join(re.escape(literal) for literal in dict.fromkeys(literals)))
+
+
+def compile_keyword_rule(action, keywords):
+    """
+    编译按 tag 关键字过滤的规则，返回单个节点的保留判定函数；规则无效时返回 None。
+
+    说明：
+        - action == "include"：保留 tag 匹配任意 keyword 的节点
+        - action == "exclude"：移除 tag 匹配任意 keyword 的节点
+        - 纯字面量 keyword（含 "HK|香港" 这类字面量的 "|" 组合）合并为一个
+          多模式匹配器，只需一次 search；
+          其余每个 keyword 作为独立正则（支持 (?i) 等内联 flag）。
+        - 不能把正则用 "|" 拼接成一个，否则中间的内联 flag 会报错：
           re.error: global flags not at the start of the expression
     """
-    exclude_mode = (action == "exclude")
+    literals = []
     compiled_patterns = []
 
     for kw in (keywords or []):
@@ -156,43 +309,143 @@ def action_keywords(nodes, action, keywords):
         if not kw:
             continue
 
+        parts = split_literal_keyword(kw)
+        if parts is not None:
+            literals.extend(parts)
+            continue
         try:
-            compiled_patterns.append(re.compile(kw))
+            compiled_patterns.append(compile_regex(kw))
         except re.error as e:
             print(f"[ERROR] Invalid regex keyword: {kw!r} -> {e}")
             raise
 
-    if not compiled_patterns:
-        return nodes
+    if not literals and not compiled_patterns:
+        return None
+
+    if action not in ("include", "exclude"):
+        print(f"[WARN] Unknown filter action: {action!r}, skip this filter")
+        return None
 
-    filtered_nodes = []
+    exclude_mode = (action == "exclude")
+    if literals:
+        compiled_patterns.insert(0, compile_literal_matcher(literals))
 
-    for node in nodes:
+    def keep(node):
         tag = str(node.get("tag", ""))
+        for pattern in compiled_patterns:
+            if pattern.search(tag):
+                return not exclude_mode
+        return exclude_mode
 
-        matched = any(pattern.search(tag) for pattern in compiled_patterns)
+    return keep
 
-        if action == "include":
-            if matched:
-                filtered_nodes.append(node)
-        elif action == "exclude":
-            if not matched:
-                filtered_nodes.append(node)
-        else:
-            print(f"[WARN] Unknown filter action: {action!r}, skip this filter")
+
+def compile_type_rule(action, types):
+    """
+    编译按节点协议类型过滤的规则，返回单个节点的保留判定函数；未提供有效类型时返回 None。
+
+    参数：
+        action: str
+            "exclude"：移除 type 在列表中的节点；其余取值均按 "include" 处理
+        types: list[str]
+            协议类型列表，例如 ["hysteria2", "trojan", "vmess"]，不区分大小写。
+    """
+    type_set = {t.strip().lower() for t in (types or []) if t.strip()}
+    if not type_set:
+        return None
+
+    exclude_mode = (action == "exclude")
+
+    def keep(node):
+        return (str(node.get('type', '')).lower() in type_set) ^ exclude_mode
+
+    return keep
+
+
+def compile_server_rule(action, server_regex):
+    """
+    编译按 server 字段正则过滤的规则，返回单个节点的保留判定函数。
+
+    include：server 匹配则保留；exclude：server 不匹配则保留。
+    """
+    regex = compile_regex(server_regex)
+    exclude_mode = (action == "exclude")
+
+    def keep(node):
+        return bool(regex.search(node.get("server", ""))) ^ exclude_mode
+
+    return keep
+
+
+class CompiledFilter:
+    """
+    模板 filter 数组编译后的形式：每条规则是一个单节点判定函数，
+    对某个 group 先选出生效的规则，再单次遍历节点完成全部过滤。
+    """
+
+    def __init__(self, rules):
+        # rules: list[tuple[for 字段, 判定函数]]
+        self.rules = rules
+        self._active = {}
+
+    def active_rules(self, group):
+        active = self._active.get(group)
+        if active is None:
+            active = [
+                keep for for_groups, keep in self.rules
+                if not for_groups or group in for_groups
+            ]
+            self._active[group] = active
+        return active
+
+    def apply(self, nodes, group):
+        active = self.active_rules(group)
+        if not active:
             return nodes
+        if len(active) == 1:
+            keep = active[0]
+            return [node for node in nodes if keep(node)]
+        filtered = []
+        for node in nodes:
+            for keep in active:
+                if not keep(node):
+                    break
+            else:
+                filtered.append(node)
+        return filtered
+
 
-    return filtered_nodes
+@functools.lru_cache(maxsize=256)
+def _compile_filters_spec(spec):
+    rules = []
+    for f in json.loads(spec):
+        if "server_regex" in f:
+            keep = compile_server_rule(f.get("action"), f["server_regex"])
+        elif "type" in f:
+            keep = compile_type_rule(f.get("action"), f["type"])
+        else:
+            keep = compile_keyword_rule(f.get("action"), f.get("keywords", []))
+        if keep is not None:
+            rules.append((f.get("for"), keep))
+    return CompiledFilter(rules)
 
 
+def compile_filters(filters):
+    """
+    将模板中的 filter 数组编译为 CompiledFilter。
+
+    编译结果按规范化后的 filter 内容缓存，不同出站使用相同 filter 时共享同一对象。
+    """
+    return _compile_filters_spec(json.dumps(filters or [], sort_keys=True, ensure_ascii=False))
+
 
 def nodes_filter(nodes, filters, group):
     """
-    对节点列表依次应用过滤规则 filters。
+    对节点列表应用过滤规则 filters，所有规则同时成立的节点才会保留。
 
-    支持 3 类规则（按优先级顺序执行）：
+    支持 3 类规则：
 
-    ① 按 server 正则过滤（最高优先级）
+    ① 按 server 正则过滤
         只保留 server 是 IPv4 的节点
         {
         "action": "include",
@@ -220,148 +473,60 @@ def nodes_filter(nodes, filters, group):
        "for": ["Asia", "America"]
        → 当 group 在 for 列表中时，该过滤规则才会生效。
 
+    filters 会先编译为单次遍历的判定函数（见 compile_filters），结果与逐条规则依次过滤一致。
+
     返回：
        list[dict] → 过滤后的节点列表
     """
+    return compile_filters(filters).apply(nodes, group)
 
-    for f in filters:
 
-        # 如果规则指定了适用分组，但当前不匹配，则跳过
-        if f.get("for") and group not in f["for"]:
-            continue
-
-        # -------------------------------------------------------------------
-        # ① server 正则过滤（你新加的能力：匹配 server 字段）
-        # -------------------------------------------------------------------
-        if "server_regex" in f:
-            regex = re.compile(f["server_regex"])
-            exclude_mode = (f["action"] == "exclude")
-
-            filtered = []
-            for node in nodes:
-                server = node.get("server", "")
-                matched = bool(regex.search(server))
-
-                # include: matched → 保留
-                # exclude: not matched → 保留
-                if matched ^ exclude_mode:
-                    filtered.append(node)
-
-            nodes = filtered
-            continue
-
-        # -------------------------------------------------------------------
-        # ② 协议类型过滤
-        # -------------------------------------------------------------------
-        if "type" in f:
-            # action_types 是你已有的函数，不改动
-            nodes = action_types(nodes, f["action"], f["type"])
-            continue
-
-        # -------------------------------------------------------------------
-        # ③ 按 tag 名称关键字过滤
-        # -------------------------------------------------------------------
-        nodes = action_keywords(nodes, f["action"], f.get("keywords", []))
-
-    return nodes
-
-def action_types(nodes, action, types):
+def compile_subscribe_transform(subscribe):
     """
-    按节点协议类型进行过滤。
-
-    参数：
-        nodes: list[dict]
-            要过滤的节点列表。
-        action: str
-            "include"：只保留 type 在列表中的节点
-            "exclude"：移除 type 在列表中的节点
-        types: list[str]
-            协议类型列表，例如 ["hysteria2", "trojan", "vmess"]。
-
-    返回：
-        list[dict]: 过滤后的节点列表。
-    """
-    temp_nodes = []
-    flag = False
-    if action == 'exclude':
-        flag = True
-
-    # 标准化协议类型：去空白并转小写
-    type_set = {t.strip().lower() for t in (types or []) if t.strip()}
-    if not type_set:
-        # 如果未提供有效类型，不执行任何过滤
-        return nodes
+    根据订阅配置构建一次性的节点后处理函数，单次遍历完成：
+        - prefix：为节点名称和 detour 名称添加前缀
+        - emoji：调用 tool.rename 为节点名称和 detour 名称添加地区 emoji
+        - ex-node-name：排除名称中包含任意片段的节点
 
-    for node in nodes:
-        node_type = str(node.get('type', '')).lower()
-        match_flag = node_type in type_set
-
-        # 同样使用 XOR 决定是否保留
-        if match_flag ^ flag:
-            temp_nodes.append(node)
-
-    return temp_nodes
-
-
-def add_prefix(nodes, subscribe):
-    """
-    为节点名称和 detour 名称添加前缀。
+    ex-node-name 为字符串，可用逗号或竖线分隔多个片段：
+        "HK,JP|Netflix"
+    所有片段预编译为一个多模式匹配器，按添加前缀 / emoji 之后的节点 tag 判断。
 
     参数：
-        nodes: list[dict]
-            节点列表。
         subscribe: dict
-            当前订阅配置，若包含 'prefix' 则生效。
-    """
-    if subscribe.get('prefix'):
-        for node in nodes:
-            node['tag'] = subscribe['prefix'] + node['tag']
-            if node.get('detour'):
-                node['detour'] = subscribe['prefix'] + node['detour']
-
+            当前订阅配置。
 
-def add_emoji(nodes, subscribe):
+    返回：
+        Callable[[list[dict]], list[dict]]:
+            接收节点列表，原地改写节点 tag / detour，返回排除后的新列表。
     """
-    根据订阅配置为节点名称和 detour 名称自动添加 emoji。
+    prefix = subscribe.get('prefix') or ''
+    emoji = subscribe.get('emoji')
+    exclude = None
+    if subscribe.get('ex-node-name'):
+        ex_nodename = re.split(r'[,\|]', subscribe['ex-node-name'])
+        exclude = compile_literal_matcher(ex_nodename)
 
-    参数：
-        nodes: list[dict]
-            节点列表。
-        subscribe: dict
-            当前订阅配置，若 'emoji' 为真，则调用 tool.rename 做重命名。
-    """
-    if subscribe.get('emoji'):
+    def transform(nodes):
+        result = []
         for node in nodes:
-            node['tag'] = tool.rename(node['tag'])
-            if node.get('detour'):
-                node['detour'] = tool.rename(node['detour'])
-
-
-def nodefilter(nodes, subscribe):
-    """
-    根据订阅配置中的 'ex-node-name' 字段，排除节点。
-
-    规则：
-        ex-node-name 为字符串，可用逗号或竖线分隔多个片段：
-            "HK,JP|Netflix"
-        只要节点 tag 中包含任意一个片段，该节点即被移除。
+            tag = prefix + node['tag']
+            detour = node.get('detour')
+            if emoji:
+                tag = tool.rename(tag)
+            node['tag'] = tag
+            if detour:
+                detour = prefix + detour
+                node['detour'] = tool.rename(detour) if emoji else detour
+            if exclude is not None and exclude.search(tag):
+                continue
+            result.append(node)
+        return result
 
-    参数：
-        nodes: list[dict]
-            当前订阅获取的节点列表（函数会在此列表上原地删除元素）。
-        subscribe: dict
-            当前订阅配置。
-    """
-    if subscribe.get('ex-node-name'):
-        ex_nodename = re.split(r'[,\|]', subscribe['ex-node-name'])
-        for exns in ex_nodename:
-            # 遍历 nodes 的副本，避免在迭代时直接修改原列表导致跳项
-            for node in nodes[:]:
-                if exns in node['tag']:
-                    nodes.remove(node)
+    return transform
 
 
-def get_nodes(url):
+def get_nodes(url, ctx):
     """
     从订阅 URL 或本地内容中提取节点列表。
 
@@ -373,6 +538,12 @@ def get_nodes(url):
         - Clash 格式配置（含 proxies）
         - sing-box 格式配置（含 outbounds）
 
+    参数：
+        url: str
+            订阅链接、本地文件路径或 base64 文本。
+        ctx: GenerationContext
+            本次生成的上下文（解析器、排除协议、User-Agent）。
+
     返回：
         list[dict]: 节点字典列表。
     """
@@ -409,7 +580,7 @@ def get_nodes(url):
             return []
 
         print(f"[DEBUG] parse_text_nodes() 文本长度 = {len(text)}")
-        data = parse_content(text)
+        data = parse_content(text, ctx)
         return flatten_nodes(data)
 
     def parse_clash_config(cfg):
@@ -527,7 +698,7 @@ def get_nodes(url):
     else:
         print("[DEBUG] 检测到 URL scheme，按远程订阅处理")
         try:
-            content = get_content_from_url(url)
+            content = get_content_from_url(url, ctx)
             print(f"[DEBUG] 远程内容获取成功，类型 = {type(content)}")
         except Exception as e:
             print(f"[WARN] 远程订阅获取失败: {e}")
@@ -561,7 +732,7 @@ def get_nodes(url):
     print("[DEBUG] ===== get_nodes() end =====")
     return result
 
-def parse_content(content):
+def parse_content(content, ctx):
     """
     将多行节点分享链接文本解析为节点列表。
 
@@ -576,6 +747,12 @@ def parse_content(content):
         - 根据协议选择对应解析器（get_parser）
         - 解析失败则跳过该行
 
+    参数：
+        content: str | bytes | list | tuple | None
+            订阅文本。
+        ctx: GenerationContext
+            本次生成的上下文。
+
     返回：
         list[dict]: 解析得到的节点列表。
     """
@@ -672,7 +849,7 @@ def parse_content(content):
         print(f"[DEBUG] 第 {idx} 行协议预览 = {scheme_preview}")
 
         try:
-            factory = get_parser(t)
+            factory = get_parser(t, ctx)
             print(f"[DEBUG] 第 {idx} 行 get_parser() 返回 = {factory}")
         except Exception as e:
             factory = None
@@ -715,19 +892,21 @@ def parse_content(content):
 
     return nodelist
 
-def get_parser(node):
+def get_parser(node, ctx):
     """
     根据分享链接文本判断协议类型，并返回对应的解析函数。
 
     逻辑：
         - 通过 tool.get_protocol 获取协议（如 vmess, trojan, hysteria2 等）
-        - 若 providers 中配置了 exclude_protocol，则排除对应协议
+        - 若 ctx.providers 中配置了 exclude_protocol，则排除对应协议
           （支持 "hy2" 自动映射为 "hysteria2"）
-        - 若协议不在 parsers_mod 中，或被排除，则返回 None
+        - 若协议不在 ctx.parsers 中，或被排除，则返回 None
 
     参数：
         node: str
             单行节点分享链接。
+        ctx: GenerationContext
+            本次生成的上下文。
 
     返回：
         Callable | None: 对应协议的解析函数，
@@ -761,7 +940,7 @@ def get_parser(node):
         return None
 
     # 2) 打印 providers.exclude_protocol 原始值
-    exclude_raw = providers.get('exclude_protocol')
+    exclude_raw = ctx.get('exclude_protocol')
     print(f"[DEBUG] providers.get('exclude_protocol') => {repr(exclude_raw)}")
 
     # 3) 处理需要排除的协议列表
@@ -791,12 +970,12 @@ def get_parser(node):
     else:
         print("[DEBUG] 未配置 exclude_protocol，跳过排除逻辑")
 
-    # 4) 打印 parsers_mod 信息
+    # 4) 打印 ctx.parsers 信息
     try:
-        parser_keys = list(parsers_mod.keys())
-        print(f"[DEBUG] parsers_mod.keys() => {parser_keys}")
+        parser_keys = list(ctx.parsers.keys())
+        print(f"[DEBUG] ctx.parsers.keys() => {parser_keys}")
     except Exception as e:
-        print(f"[WARN] 读取 parsers_mod.keys() 异常: {e}")
+        print(f"[WARN] 读取 ctx.parsers.keys() 异常: {e}")
         print("[DEBUG] ===== get_parser() end =====")
         return None
 
@@ -806,17 +985,17 @@ def get_parser(node):
         print("[DEBUG] ===== get_parser() end =====")
         return None
 
-    if proto not in parsers_mod.keys():
-        print(f"[WARN] 协议 {repr(proto)} 不在 parsers_mod 中，返回 None")
+    if proto not in ctx.parsers.keys():
+        print(f"[WARN] 协议 {repr(proto)} 不在 ctx.parsers 中，返回 None")
         print("[DEBUG] ===== get_parser() end =====")
         return None
 
     # 6) 取解析器
     try:
-        parser_obj = parsers_mod[proto]
-        print(f"[DEBUG] parsers_mod[{repr(proto)}] => {parser_obj}")
+        parser_obj = ctx.parsers[proto]
+        print(f"[DEBUG] ctx.parsers[{repr(proto)}] => {parser_obj}")
     except Exception as e:
-        print(f"[WARN] 读取 parsers_mod[{repr(proto)}] 异常: {e}")
+        print(f"[WARN] 读取 ctx.parsers[{repr(proto)}] 异常: {e}")
         print("[DEBUG] ===== get_parser() end =====")
         return None
 
@@ -833,7 +1012,7 @@ def get_parser(node):
     print("[DEBUG] ===== get_parser() end =====")
     return parser_func
 
-def get_content_from_url(url, n=10):
+def get_content_from_url(url, ctx, n=10):
     """
     从远程订阅 / 链接中获取内容，并根据内容类型进行解析。
 
@@ -841,7 +1020,7 @@ def get_content_from_url(url, n=10):
         1. 直接为单个节点分享链接（vmess://, ss://, trojan:// 等）：
            - 直接去空白行后返回纯文本内容。
         2. 机场订阅（普通 URL）：
-           - 根据 providers["subscribes"] 中配置的 User-Agent 请求。
+           - 根据 ctx.providers["subscribes"] 中配置的 User-Agent 请求。
            - 如失败会自动重试最多 n 次。
            - 若返回内容为：
                - 纯节点文本（含 vmess:// 等）：解码并返回文本。
@@ -852,6 +1031,8 @@ def get_content_from_url(url, n=10):
     参数：
         url: str
             订阅链接或单节点链接。
+        ctx: GenerationContext
+            本次生成的上下文。
         n: int
             请求失败时最大重试次数。
 
@@ -861,7 +1042,6 @@ def get_content_from_url(url, n=10):
             - dict：解析后的 Clash 或 sing-box 配置。
             - None：内容为空或仅空白。
     """
-    UA = ''
     print('get_content_from_url:::: \033[31m' + url + '\033[0m')
 
     prefixes = [
@@ -876,11 +1056,7 @@ def get_content_from_url(url, n=10):
         return response_text
 
     # 情况二：为机场订阅 URL，从 providers 中查找自定义 User-Agent
-    for subscribe in providers["subscribes"]:
-        if 'enabled' in subscribe and not subscribe['enabled']:
-            continue
-        if subscribe['url'] == url:
-            UA = subscribe.get('User-Agent', '')
+    UA = ctx.user_agent(url)
 
     response = tool.getResponse(url, custom_user_agent=UA)
     concount = 1
@@ -1000,64 +1176,134 @@ def get_content_form_file(url):
     return data
 
 
-def save_config(path, nodes):
+def save_config(path, nodes, ctx):
     """
     将最终生成的 nodes 写入配置文件。
 
     逻辑：
+        - 与现有文件内容（SHA-256）相同时跳过写入，返回 False，
+          调用方据此跳过 sing-box 重载等后续操作。
+        - providers 中 compact_output = True（或 minify = True）时输出紧凑 JSON（路由器等无需缩进的场景）。
         - 若 providers 中配置 auto_backup = True：
-            - 旧文件会重命名为 path.YYYYMMDDHHMMSS.bak
-        - 若 path 已存在，先删除再写入。
+            - 旧文件备份为 path.YYYYMMDDHHMMSS.bak
+            - 只保留最新的 backup_keep 份备份（默认 5，<= 0 表示不限制）
+        - 通过临时文件 + fsync + rename 原子替换 path，读取方不会看到缺失或写了一半的文件。
         - 写入失败时：
-            - 尝试从 temp_json_data 中读取 save_config_path
+            - 尝试从 ctx.providers 中读取 save_config_path
             - 将配置写入 /tmp 下对应文件
-            - 若仍失败则删除该文件并打印错误信息。
+            - 若仍失败则打印错误信息。
 
     参数：
         path: str
             主配置文件保存路径。
         nodes: Any
             要写入的配置内容（通常是 dict）。
+        ctx: GenerationContext
+            本次生成的上下文。
+
+    返回：
+        bool: 是否实际写入了文件。
     """
     try:
-        # 处理自动备份逻辑
-        if 'auto_backup' in providers and providers['auto_backup']:
-            now = datetime.now().strftime('%Y%m%d%H%M%S')
-            if os.path.exists(path):
-                os.rename(path, f'{path}.{now}.bak')
-
-        if os.path.exists(path):
-            os.remove(path)
-            print(f"已删除文件，并重新保存：\033[33m{path}\033[0m")
-        else:
-            print(f"文件不存在，正在保存：\033[33m{path}\033[0m")
-
-        tool.saveFile(path, json.dumps(nodes, indent=2, ensure_ascii=False))
+        backup_keep = ctx.get('backup_keep', 5) if ctx.get('auto_backup') else None
+        if write_config(path, nodes, not is_compact_output(ctx.providers), backup_keep=backup_keep):
+            print(f"已保存配置文件：\033[33m{path}\033[0m")
+            return True
+        print(f"配置未变化，跳过写入：\033[33m{path}\033[0m")
+        return False
     except Exception as e:
         print(f"保存配置文件时出错：{str(e)}")
 
         # 保存出错时，尝试使用临时路径 /tmp/config.json
-        config_path = json.loads(temp_json_data).get("save_config_path", "config.json")
+        config_path = ctx.get("save_config_path", "config.json")
         CONFIG_FILE_NAME = config_path
         config_file_path = os.path.join('/tmp', CONFIG_FILE_NAME)
 
         try:
-            if os.path.exists(config_file_path):
-                os.remove(config_file_path)
-                print(f"已删除文件，并重新保存：\033[33m{config_file_path}\033[0m")
-            else:
-                print(f"文件不存在，正在保存：\033[33m{config_file_path}\033[0m")
-
-            tool.saveFile(config_file_path, json.dumps(nodes, indent=2, ensure_ascii=False))
+            if write_config(config_file_path, nodes, not is_compact_output(ctx.providers)):
+                print(f"已保存配置文件：\033[33m{config_file_path}\033[0m")
+                return True
+            print(f"配置未变化，跳过写入：\033[33m{config_file_path}\033[0m")
+            return False
         except Exception as e:
-            # 再次失败则删除文件并输出错误
-            if os.path.exists(config_file_path):
-                os.remove(config_file_path)
-                print(f"已删除文件：\033[33m{config_file_path}\033[0m")
             print(f"再次保存配置文件时出错：{str(e)}")
+            return False
 
 
-def set_proxy_rule_dns(config):
+def is_compact_output(providers_data):
+    """
+    是否输出紧凑 JSON：providers 中 compact_output = True 或 minify = True 时为真。
+    """
+    return bool(providers_data.get('compact_output') or providers_data.get('minify'))
+
+
+def check_references(final_config, ctx):
+    """
+    检查配置中出站 / DNS server / rule_set 之间的引用（见 config_graph）。
+
+    逻辑：
+        - 存在悬空引用（引用了不存在的 tag）时：
+            - providers 中 strict_references = True：抛出 ConfigReferenceError，配置不会被输出
+            - 否则打印警告
+        - providers 中 prune_unused = True 时，删除从任何规则都无法到达的出站、
+          DNS server 和 rule_set。
+    """
+    if not isinstance(final_config, dict):
+        return final_config
+    graph = ReferenceGraph(final_config)
+    dangling = graph.dangling()
+    if dangling:
+        if ctx.get('strict_references'):
+            raise ConfigReferenceError(dangling)
+        print(f"[WARN] {ConfigReferenceError(dangling)}")
+    if ctx.get('prune_unused'):
+        removed = prune_config(final_config, graph)
+        summary = '，'.join(f"{KIND_NAMES[kind]} {len(tags)} 个" for kind, tags in removed.items() if tags)
+        print(f"[DEBUG] 删除不可达项: {summary or '无'}")
+    return final_config
+
+
+def finalize_config(final_config, ctx):
+    """
+    渲染后的收尾处理：引用检查 / 裁剪（check_references），再按需精简（minify_if_enabled）。
+    """
+    return minify_if_enabled(check_references(final_config, ctx), ctx)
+
+
+def minify_if_enabled(final_config, ctx):
+    """
+    providers 中 minify = True 时，删除出站中与 sing-box 默认值相同的字段和空容器
+    （见 config_minifier），并打印节省的字节数。
+    """
+    if not ctx.get('minify'):
+        return final_config
+    final_config, stats = minify_config(final_config)
+    print(f"[DEBUG] 配置精简: {stats}")
+    return final_config
+
+
+def write_config(path, config, pretty=True, backup_keep=None):
+    """
+    将配置序列化后原子写入 path（静态段复用模板缓存的片段，见 config_writer.dump_config）。
+
+    参数：
+        path: str
+            目标文件路径。
+        config: Any
+            要写入的配置。
+        pretty: bool
+            True 为缩进 2 格的格式化 JSON，False 为紧凑 JSON。
+        backup_keep: int | None
+            不为 None 时，写入前先备份旧文件，并只保留最新的 backup_keep 份。
+
+    返回：
+        bool: 内容有变化并已写入时返回 True，内容未变化时返回 False。
+    """
+    # 逐段序列化后直接逐块写入临时文件，同时计算哈希判断内容是否变化
+    return write_if_changed(path, iter_config(config, pretty), backup_keep)
+
+
+def set_proxy_rule_dns(config, asod, model=None):
     """
     根据路由规则自动生成对应的 DNS 规则，减少 DNS 泄露风险。
 
@@ -1071,30 +1317,36 @@ def set_proxy_rule_dns(config):
                 - 按 route 规则生成对应的 dns.rules 项：
                     - type = logical 时，递归处理子 rules
                     - 其他情况使用 pro_dns_from_route_rules 进行映射
-        - 最后去重 dns.rules，并将新生成的 DNS server 写入 config['dns']['servers']。
+        - 按规范化 JSON 去重 dns.rules（模板规则 + 新生成规则）
+        - 新生成规则中相邻、指向同一 server 且只含域名类匹配字段的规则合并为一条
+        - 将新生成的 DNS server（每个出站一个）写入 config['dns']['servers']。
+
+    参数：
+        config: dict
+            合并后的完整配置。
+        asod: dict
+            providers 中的 auto_set_outbounds_dns（{"proxy": tag, "direct": tag}）。
+        model: ConfigModel | None
+            config 的索引视图；为 None 时在此新建。
     """
+    if model is None:
+        model = ConfigModel(config)
     config_rules = config['route']['rules']
-    outbound_dns = []
-    dns_rules = config['dns']['rules']
-    asod = providers["auto_set_outbounds_dns"]
+    # 出站 tag -> 该出站专用的 DNS server，同一出站只生成一次
+    outbound_dns = {}
+    generated_rules = []
+    outbounds_dns_template = model.dns_server(asod["proxy"])
 
     for rule in config_rules:
         if rule['outbound'] in ['block', 'dns-out']:
             continue
 
         # 非 direct 出站规则，需要为其生成专用 DNS server
-        if rule['outbound'] != 'direct':
-            outbounds_dns_template = list(
-                filter(
-                    lambda server: server['tag'] == asod["proxy"],
-                    config['dns']['servers']
-                )
-            )[0]
+        if rule['outbound'] != 'direct' and rule['outbound'] not in outbound_dns:
             dns_obj = outbounds_dns_template.copy()
             dns_obj['tag'] = rule['outbound'] + '_dns'
             dns_obj['detour'] = rule['outbound']
-            if dns_obj not in outbound_dns:
-                outbound_dns.append(dns_obj)
+            outbound_dns[rule['outbound']] = dns_obj
 
         # 构造 DNS 规则条目
         if rule.get('type') and rule['type'] == 'logical':
@@ -1105,29 +1357,95 @@ def set_proxy_rule_dns(config):
                 'server': rule['outbound'] + '_dns' if rule['outbound'] != 'direct' else asod["direct"]
             }
             for _rule in rule['rules']:
-                child_rule = pro_dns_from_route_rules(_rule)
+                child_rule = pro_dns_from_route_rules(_rule, asod["direct"])
                 if child_rule:
                     dns_rule_obj['rules'].append(child_rule)
             if len(dns_rule_obj['rules']) == 0:
                 dns_rule_obj = None
         else:
-            dns_rule_obj = pro_dns_from_route_rules(rule)
+            dns_rule_obj = pro_dns_from_route_rules(rule, asod["direct"])
 
         if dns_rule_obj:
-            dns_rules.append(dns_rule_obj)
-
-    # 去重 DNS 规则
-    _dns_rules = []
-    for dr in dns_rules:
-        if dr not in _dns_rules:
-            _dns_rules.append(dr)
-    config['dns']['rules'] = _dns_rules
+            generated_rules.append(dns_rule_obj)
+
+    # 按规范化 JSON 去重 DNS 规则，保留第一次出现的位置
+    seen = set()
+    template_rules = []
+    for dr in config['dns']['rules']:
+        key = json.dumps(dr, sort_keys=True, ensure_ascii=False)
+        if key not in seen:
+            seen.add(key)
+            template_rules.append(dr)
+    _generated_rules = []
+    for dr in generated_rules:
+        key = json.dumps(dr, sort_keys=True, ensure_ascii=False)
+        if key not in seen:
+            seen.add(key)
+            _generated_rules.append(dr)
+    config['dns']['rules'] = template_rules + merge_dns_rules(_generated_rules)
 
     # 将为各出站生成的 DNS server 追加到 config['dns']['servers']
-    config['dns']['servers'].extend(outbound_dns)
+    model.add_dns_servers(list(outbound_dns.values()))
+
+
+# sing-box 中这些字段之间为"或"关系，只含这些字段的规则可以安全合并
+DNS_DOMAIN_MATCH_FIELDS = ("domain", "domain_suffix", "domain_keyword", "domain_regex", "geosite")
+
+
+def merge_dns_rules(dns_rules):
+    """
+    合并相邻且可合并的 DNS 规则，减少 dns.rules 数量。
+
+    可合并：规则只包含 server 与域名类匹配字段（DNS_DOMAIN_MATCH_FIELDS），
+    且与前一条规则的 server 相同。由于只合并相邻规则，规则的匹配优先级不变；
+    合并后同名字段的值取并集（保持顺序、去重）。
 
+    参数：
+        dns_rules: list[dict]
+            已去重的 DNS 规则列表。
 
-def pro_dns_from_route_rules(route_rule):
+    返回：
+        list[dict]: 合并后的 DNS 规则列表（未合并的规则保持原对象）。
+    """
+    def mergeable(rule):
+        fields = [key for key in rule if key != 'server']
+        return (
+            'server' in rule
+            and fields
+            and all(key in DNS_DOMAIN_MATCH_FIELDS for key in fields)
+        )
+
+    def as_list(value):
+        return list(value) if isinstance(value, list) else [value]
+
+    merged = []
+    for rule in dns_rules:
+        prev = merged[-1] if merged else None
+        if (
+            prev is not None
+            and mergeable(rule)
+            and mergeable(prev)
+            and prev['server'] == rule['server']
+        ):
+            if not prev.get('_merged'):
+                # 首次合并时复制一份，避免修改其他地方引用的规则对象
+                prev = {key: (as_list(value) if key != 'server' else value) for key, value in prev.items()}
+                prev['_merged'] = True
+                merged[-1] = prev
+            for key, value in rule.items():
+                if key == 'server':
+                    continue
+                values = prev.setdefault(key, [])
+                values.extend(v for v in as_list(value) if v not in values)
+            continue
+        merged.append(rule)
+
+    for rule in merged:
+        rule.pop('_merged', None)
+    return merged
+
+
+def pro_dns_from_route_rules(route_rule, direct_server):
     """
     将单条 route 规则映射为对应的 dns 规则条目。
 
@@ -1162,13 +1480,69 @@ def pro_dns_from_route_rules(route_rule):
         dns_rule_obj['server'] = (
             route_rule['outbound'] + '_dns'
             if route_rule['outbound'] != 'direct'
-            else providers["auto_set_outbounds_dns"]['direct']
+            else direct_server
         )
 
     return dns_rule_obj
 
 
-def pro_node_template(data_nodes, config_outbound, group):
+class FilterCache:
+    """
+    combin_to_config 单次渲染内的过滤结果缓存。
+
+    模板中经常有多个出站使用相同的 filter（如 "🇭🇰 HK" 与 "🇭🇰 HK-auto"），
+    以 (规范化后的 filter, group) 为 key 缓存过滤后的 tag 列表，
+    同一 filter 在同一分组下只计算一次；{all} 拼接后的列表按 filter 单独缓存。
+    """
+
+    def __init__(self):
+        self.results = {}
+        self.all_results = {}
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def spec(filters):
+        # 规范化：字段顺序不同但内容相同的 filter 视为同一个
+        return json.dumps(filters or [], sort_keys=True, ensure_ascii=False)
+
+    def get(self, data_nodes, filters, group, spec=None):
+        """
+        返回过滤后的节点 tag 列表（缓存中的列表为共享对象，调用方不可修改）。
+        """
+        key = (self.spec(filters) if spec is None else spec, group)
+        tags = self.results.get(key)
+        if tags is not None:
+            self.hits += 1
+            return tags
+        self.misses += 1
+        if filters:
+            data_nodes = nodes_filter(data_nodes, filters, group)
+        tags = [node.get('tag') for node in data_nodes]
+        self.results[key] = tags
+        return tags
+
+    def get_all(self, data, filters, spec=None):
+        """
+        返回 {all} 展开后的 tag 列表：按 data 中分组顺序拼接各分组的过滤结果。
+        """
+        if spec is None:
+            spec = self.spec(filters)
+        tags = self.all_results.get(spec)
+        if tags is not None:
+            self.hits += 1
+            return tags
+        tags = []
+        for group in data:
+            tags.extend(self.get(data[group], filters, group, spec))
+        self.all_results[spec] = tags
+        return tags
+
+    def stats(self):
+        return f"命中 {self.hits} 次，未命中 {self.misses} 次，缓存 {len(self.results)} 项"
+
+
+def pro_node_template(data_nodes, config_outbound, group, filter_cache=None):
     """
     根据当前出站模板 config_outbound 对 data_nodes 做过滤，
     并返回过滤后节点的 tag 列表。
@@ -1180,51 +1554,237 @@ def pro_node_template(data_nodes, config_outbound, group):
             模板中定义的出站对象（可能包含 filter 字段）。
         group: str
             当前分组名称（用于 nodes_filter 中的 for 匹配）。
+        filter_cache: FilterCache | None
+            渲染内共享的过滤结果缓存；为 None 时每次重新计算。
 
     返回：
         list[str]: 过滤后节点的 tag 字符串列表。
     """
+    if filter_cache is not None:
+        return filter_cache.get(data_nodes, config_outbound.get('filter'), group)
     if config_outbound.get('filter'):
         data_nodes = nodes_filter(data_nodes, config_outbound['filter'], group)
     return [node.get('tag') for node in data_nodes]
 
 
-def combin_to_config(config, data):
+def build_region_index(data):
     """
-    将根据订阅生成的节点数据 data 合并到配置模板 config 中。
+    为所有节点按地区建立索引，供 {region:XX} 占位符直接展开。
 
-    主要工作：
-        1. 处理模板中的 selector/urltest 等出站引用：
-           - 支持 {group} / {all} 占位符展开为实际节点 tag 列表。
-           - 若某个出站在展开后无任何节点，则降级为 direct。
-        2. 将 data 中的真实节点追加到 config['outbounds'] 中。
-        3. 若 providers["auto_set_outbounds_dns"] 配置完整，自动根据 route 生成 DNS 规则。
-        4. 针对 type = "wireguard" 的出站：
-           - 提取到单独的 endpoints 字段中。
-           - 并从 outbounds 中移除 wireguard 类型，满足部分模板要求。
+    每个节点的地区只通过 tool.region_of 计算一次（规则与 tool.regex_patterns 一致），
+    地区代码为旗帜 emoji 对应的两位大写字母，例如 🇭🇰 → HK。
 
     参数：
-        config: dict
-            配置模板（包含 outbounds、route、dns 等）。
         data: dict[str, list[dict]]
             订阅生成的节点数据，key 为分组名，value 为节点列表。
 
     返回：
-        dict: 合并后的完整配置。
+        dict[str, list[dict]]: { 'HK': [node, ...], ... }，保持节点原有顺序。
     """
-    config_outbounds = config["outbounds"] if config.get("outbounds") else None
-    i = 0
-
-    # 先处理带 subgroup 标记的分组，对 Proxy 进行分组插入
+    region_index = {}
     for group in data:
-        if 'subgroup' in group:
-            i += 1
-            for out in config_outbounds:
-                if out.get("outbounds") and out['tag'] == 'Proxy':
+        for node in data[group]:
+            flag = tool.region_of(str(node.get('tag', '')))
+            if flag:
+                region_index.setdefault(tool.flag_to_code(flag), []).append(node)
+    return region_index
+
+
+def region_code(value):
+    """
+    规范化 {region:XX} 占位符中的地区：两位代码不区分大小写（hk → HK），
+    也可以直接写旗帜 emoji（🇭🇰 → HK）。
+    """
+    value = value.strip()
+    if value and all(0x1F1E6 <= ord(c) <= 0x1F1FF for c in value):
+        return tool.flag_to_code(value)
+    return value.upper()
+
+
+class CompiledTemplate:
+    """
+    编译后的配置模板，可在多次渲染、多个并发请求之间共享。
+
+    编译时记录：
+        - 出站占位槽：含 outbounds 列表的出站（selector / urltest 等）的位置、
+          预处理后的 outbounds 项（{all} 去重已完成）、filter 及其规范化 key
+        - 自动 DNS 输入：dns.servers / dns.rules / route.rules 的原始引用，
+          按 auto_set_outbounds_dns 的 (proxy, direct) 缓存生成后的 dns 段
+        - 共享分组模式（模板顶层 shared_groups，见 shared_group_options）及各分组被引用的次数
+
+    共享分组模式：模板中多个出站都展开同一分组（{all} 或 {group}，且没有 filter）时，
+    每个分组只生成一个包含全部节点的 urltest / selector 出站，其他出站改为引用它，
+    不再在每个出站里重复写入成千上万个节点 tag，sing-box 也只对这些节点做一轮测速。
+
+    render 只复制会变化的部分（顶层 dict、outbounds 列表、占位出站），
+    其余静态部分（inbounds、route、experimental 等）直接共享引用，
+    这些静态段的序列化结果也缓存在模板上（见 fragment / config_writer.dump_config）。
+    因此编译后不应再修改传入的模板，也不应修改 render 结果中的静态部分；
+    需要修改时请先自行 deepcopy。
+    """
+
+    def __init__(self, config):
+        self.config = config
+        # 模板中出站的下标 -> (原始 outbounds, 预处理后的 outbounds 项, filter, filter 规范化 key)
+        self.slots = {}
+        for index, outbound in enumerate(config.get('outbounds') or []):
+            if outbound.get('outbounds'):
+                filters = outbound.get('filter')
+                self.slots[index] = (
+                    outbound['outbounds'],
+                    self.prepare_items(outbound['outbounds']),
+                    filters,
+                    FilterCache.spec(filters),
+                )
+        # (proxy, direct) -> 生成后的 dns 段；None 表示不满足自动 DNS 条件
+        self.dns_cache = {}
+        # dns_cache 中各 dns 段的 id，供 fragment 判断某个 dns 段是否由本模板持有
+        self.dns_ids = set()
+        # (顶层字段, 静态段 id, pretty, 序列化后端) -> 序列化后的字节片段
+        self.fragments = {}
+        # 同一模板会被多个请求线程同时渲染，dns_cache / dns_ids / fragments 的读写都在锁内进行
+        self.lock = threading.Lock()
+
+        self.shared_groups = self.shared_group_options(config.get('shared_groups'))
+        # 无 filter 的出站中 {all} 的个数，以及各 {group} 的个数；某分组被引用两次以上才值得共享
+        self.all_refs = 0
+        self.group_refs = {}
+        for _, items, filters, _ in self.slots.values():
+            if filters:
+                continue
+            for item in items:
+                if item == '{all}':
+                    self.all_refs += 1
+                elif item.startswith('{') and item.endswith('}'):
+                    self.group_refs[item[1:-1]] = self.group_refs.get(item[1:-1], 0) + 1
+
+    @staticmethod
+    def shared_group_options(value):
+        """
+        解析模板顶层的 shared_groups 配置（渲染时从输出中删除）：
+            - false / 缺省：关闭，节点 tag 直接展开到各出站（原有行为）
+            - true：开启，分组出站为 urltest，tag 为 "{group}-nodes"
+            - dict：开启，可指定 type（urltest / selector）、tag（{group} 替换为分组名），
+              其余字段（如 url、interval、tolerance）原样写入生成的分组出站
+
+        生成的 tag 与模板出站、订阅节点或其他分组的共享出站重名时，该分组不共享，仍直接展开节点。
+
+        返回：
+            dict | None: 规范化后的配置，关闭时为 None。
+        """
+        if not value:
+            return None
+        options = dict(value) if isinstance(value, dict) else {}
+        options.setdefault('type', 'urltest')
+        options.setdefault('tag', '{group}-nodes')
+        return options
+
+    def shares_group(self, group):
+        """分组 group 是否改为由共享分组出站引用。"""
+        return self.shared_groups is not None and self.all_refs + self.group_refs.get(group, 0) >= 2
+
+    @staticmethod
+    def prepare_items(items):
+        """
+        预处理出站的 outbounds 项：
+            - 含 {all} 时去掉其他 {group} 占位，避免展开重复
+            - 按原始顺序去重
+        """
+        if '{all}' in items:
+            items = [
+                item for item in items
+                if not (item.startswith('{') and item.endswith('}')) or item == '{all}'
+            ]
+        prepared = []
+        check_dup = set()
+        for item in items:
+            if item not in check_dup:
+                check_dup.add(item)
+                prepared.append(item)
+        return prepared
+
+    def dns_section(self, asod):
+        """
+        返回自动 DNS 生成后的 dns 段（按 proxy / direct 缓存），不满足条件时返回 None。
+
+        dns 段只依赖模板中的 route.rules、dns 与 auto_set_outbounds_dns，
+        与订阅节点无关，因此每个模板只需生成一次。
+        """
+        if not asod:
+            return None
+        key = (asod.get('proxy'), asod.get('direct'))
+        with self.lock:
+            if key in self.dns_cache:
+                return self.dns_cache[key]
+
+        dns = self.config.get('dns')
+        server_tags = {
+            server.get('tag') for server in (dns.get('servers') or [])
+        } if isinstance(dns, dict) else set()
+        section = None
+        if key[0] and key[1] and key[0] in server_tags and key[1] in server_tags:
+            section = dict(dns)
+            for name in ('servers', 'rules'):
+                if isinstance(section.get(name), list):
+                    section[name] = list(section[name])
+            # 在只含 dns / route 的临时配置上生成，不影响模板本身
+            set_proxy_rule_dns({'dns': section, 'route': self.config['route']}, asod)
+        with self.lock:
+            # 其他线程可能已生成同一 key 的 dns 段：以先写入的为准，保证返回同一个对象
+            section = self.dns_cache.setdefault(key, section)
+            if section is not None:
+                self.dns_ids.add(id(section))
+        return section
+
+    def fragment(self, key, value, pretty=True):
+        """
+        若 value 是本模板的静态段（模板原有字段或缓存的 dns 段），返回其缓存的序列化片段，
+        否则返回 None。静态段均由模板持有，id 在模板生命周期内不会被复用。
+        """
+        cache_key = (key, id(value), pretty, get_backend())
+        with self.lock:
+            if value is not self.config.get(key) and not (key == 'dns' and id(value) in self.dns_ids):
+                return None
+            fragment = self.fragments.get(cache_key)
+        if fragment is None:
+            fragment = dump_fragment(key, value, pretty)
+            with self.lock:
+                fragment = self.fragments.setdefault(cache_key, fragment)
+        return fragment
+
+    def render(self, data, ctx=None):
+        """
+        用订阅节点 data 填充模板，返回新的配置（RenderedConfig），逻辑见 combin_to_config。
+        ctx（GenerationContext）提供 auto_set_outbounds_dns，为 None 时不自动生成 DNS 规则。
+        """
+        config = RenderedConfig(self.config)
+        config.template = self
+        config.pop('shared_groups', None)
+        outbounds = []
+        # 渲染出的占位出站 id -> 编译时记录的槽位
+        slot_of = {}
+        for index, outbound in enumerate(self.config.get('outbounds') or []):
+            if index in self.slots:
+                outbound = dict(outbound)
+                slot_of[id(outbound)] = self.slots[index]
+            outbounds.append(outbound)
+        config['outbounds'] = outbounds
+
+        # 按 tag 索引出站 / DNS server / rule_set，后续查找均为 O(1)
+        model = ConfigModel(config)
+        i = 0
+
+        # 先处理带 subgroup 标记的分组，对 Proxy 进行分组插入
+        for group in data:
+            if 'subgroup' in group:
+                i += 1
+                out = model.outbound('Proxy')
+                if out and out.get("outbounds"):
+                    # 复制一份再修改，模板中的列表保持不变
                     out["outbounds"] = (
                         [out["outbounds"]]
                         if isinstance(out["outbounds"], str)
-                        else out["outbounds"]
+                        else list(out["outbounds"])
                     )
                     # 处理 {all} 占位，替换为当前 subgroup 标记
                     if '{all}' in out["outbounds"]:
@@ -1239,69 +1799,99 @@ def combin_to_config(config, data):
                             (group.rsplit("-", 1)[0]).rsplit("-", 1)[-1]
                         )
 
-            new_outbound = {
-                'tag': (group.rsplit("-", 1)[0]).rsplit("-", 1)[-1],
-                'type': 'selector',
-                'outbounds': ['{' + group + '}']
-            }
-            # 在倒数第二个位置插入新的 selector 出站
-            config_outbounds.insert(-2, new_outbound)
-
-            # 如果 group 不包含 'subgroup'，原逻辑会为 Proxy 追加 '{group}'
-            if 'subgroup' not in group:
-                for out in config_outbounds:
-                    if out.get("outbounds") and out['tag'] == 'Proxy':
-                        out["outbounds"] = (
-                            [out["outbounds"]]
-                            if isinstance(out["outbounds"], str)
-                            else out["outbounds"]
-                        )
-                        out["outbounds"].append('{' + group + '}')
-
-    temp_outbounds = []
-    if config_outbounds:
-        # 找到 type = 'direct' 的出站，用于占位时兜底
-        direct_item = next(
-            (item for item in config_outbounds if item.get('type') == 'direct'),
-            None
-        )
+                new_outbound = {
+                    'tag': (group.rsplit("-", 1)[0]).rsplit("-", 1)[-1],
+                    'type': 'selector',
+                    'outbounds': ['{' + group + '}']
+                }
+                # 在倒数第二个位置插入新的 selector 出站
+                model.insert_outbound_before_tail(new_outbound, 2)
+
+        config_outbounds = model.outbounds
+        temp_outbounds = []
+        # 地区索引仅在模板中出现 {region:XX} 时才构建
+        region_index = None
+        filter_cache = FilterCache()
+        # 分组名 -> 共享分组出站，按首次引用的顺序生成
+        shared_outbounds = {}
+        # 分组名 -> 共享分组出站的 tag；与模板出站、节点或其他共享出站重名的分组不共享，
+        # 仍直接展开节点，否则 sing-box 会因 tag 重复拒绝启动
+        shared_tags = {}
+        if self.shared_groups is not None:
+            taken = {outbound.get('tag') for outbound in config_outbounds}
+            for nodes in data.values():
+                taken.update(node.get('tag') for node in nodes)
+            for group in data:
+                if not data[group] or not self.shares_group(group):
+                    continue
+                tag = self.shared_groups['tag'].replace('{group}', group)
+                if tag in taken:
+                    print(f'共享分组出站 {tag} 与已有出站或节点重名，分组 {group} 改为直接展开节点')
+                    continue
+                taken.add(tag)
+                shared_tags[group] = tag
+
+        def shared_tag(group):
+            if group not in shared_outbounds:
+                options = self.shared_groups
+                outbound = {
+                    key: value for key, value in options.items() if key not in ('tag', 'type')
+                }
+                outbound['tag'] = shared_tags[group]
+                outbound['type'] = options['type']
+                outbound['outbounds'] = list(filter_cache.get(data[group], None, group))
+                shared_outbounds[group] = outbound
+            return shared_outbounds[group]['tag']
+
+        if config_outbounds:
+            # 找到 type = 'direct' 的出站，用于占位时兜底
+            direct_item = model.first_outbound_of_type('direct')
+
+            for po in config_outbounds:
+                if not po.get("outbounds"):
+                    continue
+                slot = slot_of.get(id(po))
+                if slot is None:
+                    items = self.prepare_items(po["outbounds"])
+                    filters = po.get('filter')
+                    spec = FilterCache.spec(filters)
+                else:
+                    source, items, filters, spec = slot
+                    # subgroup 处理过的 Proxy 已换成新列表，需要重新预处理
+                    if po["outbounds"] is not source:
+                        items = self.prepare_items(po["outbounds"])
 
-        # 预处理包含 {all} 的模板，避免展开重复
-        for po in config_outbounds:
-            if po.get("outbounds"):
-                if '{all}' in po["outbounds"]:
-                    o1 = []
-                    for item in po["outbounds"]:
-                        if item.startswith('{') and item.endswith('}'):
-                            _item = item[1:-1]
-                            if _item == 'all':
-                                o1.append(item)
-                        else:
-                            o1.append(item)
-                    po['outbounds'] = o1
+                # 共享分组模式只作用于模板中没有 filter 的出站
+                shared = slot is not None and not filters and self.shared_groups is not None
 
                 t_o = []
-                check_dup = []
-
-                for oo in po["outbounds"]:
-                    # 避免重复节点
-                    if oo in check_dup:
-                        continue
-                    else:
-                        check_dup.append(oo)
-
+                for oo in items:
                     # 模板占位符：{group} 或 {all}
                     if oo.startswith('{') and oo.endswith('}'):
                         oo_key = oo[1:-1]
                         if data.get(oo_key):
-                            nodes = data[oo_key]
-                            t_o.extend(pro_node_template(nodes, po, oo_key))
-                        else:
-                            if oo_key == 'all':
-                                # {all} 表示展开所有分组
-                                for group in data:
-                                    nodes = data[group]
-                                    t_o.extend(pro_node_template(nodes, po, group))
+                            if shared and oo_key in shared_tags:
+                                t_o.append(shared_tag(oo_key))
+                            else:
+                                t_o.extend(filter_cache.get(data[oo_key], filters, oo_key, spec))
+                        elif oo_key == 'all' and shared:
+                            # {all} 依次引用各分组的共享出站（只被引用一次的分组仍直接展开）
+                            for group in data:
+                                if not data[group]:
+                                    continue
+                                if group in shared_tags:
+                                    t_o.append(shared_tag(group))
+                                else:
+                                    t_o.extend(filter_cache.get(data[group], filters, group, spec))
+                        elif oo_key == 'all':
+                            # {all} 表示展开所有分组，相同 filter 的出站共用同一份结果
+                            t_o.extend(filter_cache.get_all(data, filters, spec))
+                        elif oo_key.startswith('region:'):
+                            # {region:HK} 直接从地区索引取节点，无需对全部节点跑地区正则
+                            if region_index is None:
+                                region_index = build_region_index(data)
+                            nodes = region_index.get(region_code(oo_key[len('region:'):]), [])
+                            t_o.extend(filter_cache.get(nodes, filters, oo_key, spec))
                     else:
                         # 普通字符串，直接保留
                         t_o.append(oo)
@@ -1320,49 +1910,77 @@ def combin_to_config(config, data):
                 if po.get('filter'):
                     del po['filter']
 
-    # 将 data 中的真实节点累加到临时 outbounds 列表
-    for group in data:
-        temp_outbounds.extend(data[group])
-
-    # 最终 outbounds = 模板中的出站 + 订阅生成的真实节点
-    config['outbounds'] = config_outbounds + temp_outbounds
-
-    # 自动根据 route 规则生成对应 DNS 规则，避免 DNS 泄露
-    dns_tags = [server.get('tag') for server in config['dns']['servers']]
-    asod = providers.get("auto_set_outbounds_dns")
-    if (
-        asod
-        and asod.get('proxy')
-        and asod.get('direct')
-        and asod['proxy'] in dns_tags
-        and asod['direct'] in dns_tags
-    ):
-        set_proxy_rule_dns(config)
-
-    # 提取所有 wireguard 类型出站，单独生成 endpoints 字段
-    wireguard_items = [
-        item for item in config['outbounds'] if item.get('type') == 'wireguard'
-    ]
-    if wireguard_items:
-        endpoints = []
-        for item in wireguard_items:
-            endpoints.append(item)
-
-        # 使用 OrderedDict 确保 'endpoints' 插入到 'outbounds' 之后
-        new_config = OrderedDict()
-        for key, value in config.items():
-            new_config[key] = value
-            if key == 'outbounds':
-                new_config['endpoints'] = endpoints
-
-        config = new_config
-
-        # 从 outbounds 中移除 wireguard 类型出站
-        config['outbounds'] = [
-            item for item in config['outbounds'] if item.get('type') != 'wireguard'
+        print(f"[DEBUG] filter 缓存: {filter_cache.stats()}")
+
+        # 将 data 中的真实节点累加到临时 outbounds 列表
+        for group in data:
+            temp_outbounds.extend(data[group])
+
+        # 最终 outbounds = 模板中的出站 + 共享分组出站 + 订阅生成的真实节点
+        model.append_outbounds(list(shared_outbounds.values()) + temp_outbounds)
+
+        # 自动根据 route 规则生成对应 DNS 规则，避免 DNS 泄露（结果随模板缓存）
+        dns = self.dns_section(ctx.get("auto_set_outbounds_dns") if ctx is not None else None)
+        if dns is not None:
+            config['dns'] = dns
+
+        # 提取所有 wireguard 类型出站，单独生成 endpoints 字段
+        wireguard_items = [
+            item for item in config['outbounds'] if item.get('type') == 'wireguard'
         ]
+        if wireguard_items:
+            endpoints = []
+            for item in wireguard_items:
+                endpoints.append(item)
+
+            # 按原有字段顺序重建，确保 'endpoints' 插入到 'outbounds' 之后
+            new_config = RenderedConfig()
+            new_config.template = self
+            for key, value in config.items():
+                new_config[key] = value
+                if key == 'outbounds':
+                    new_config['endpoints'] = endpoints
+
+            config = new_config
+
+            # 从 outbounds 中移除 wireguard 类型出站
+            config['outbounds'] = [
+                item for item in config['outbounds'] if item.get('type') != 'wireguard'
+            ]
+
+        return config
+
+
+def combin_to_config(config, data, ctx=None):
+    """
+    将根据订阅生成的节点数据 data 合并到配置模板 config 中。
+
+    主要工作：
+        1. 处理模板中的 selector/urltest 等出站引用：
+           - 支持 {group} / {all} 占位符展开为实际节点 tag 列表。
+           - 支持 {region:HK} / {region:JP} / {region:🇭🇰} 等占位符，按地区索引展开对应节点。
+           - 若某个出站在展开后无任何节点，则降级为 direct。
+        2. 将 data 中的真实节点追加到 config['outbounds'] 中。
+        3. 若 ctx.providers["auto_set_outbounds_dns"] 配置完整，自动根据 route 生成 DNS 规则。
+        4. 针对 type = "wireguard" 的出站：
+           - 提取到单独的 endpoints 字段中。
+           - 并从 outbounds 中移除 wireguard 类型，满足部分模板要求。
+
+    参数：
+        config: dict
+            配置模板（包含 outbounds、route、dns 等）。
+        data: dict[str, list[dict]]
+            订阅生成的节点数据，key 为分组名，value 为节点列表。
+        ctx: GenerationContext | None
+            本次生成的上下文；为 None 时不自动生成 DNS 规则。
+
+    返回：
+        dict: 合并后的完整配置。
 
-    return config
+    模板会先编译为 CompiledTemplate 再渲染；需要多次渲染同一模板时，
+    请直接复用 CompiledTemplate（见 compile_template_source / load_compiled_template）。
+    """
+    return CompiledTemplate(config).render(data, ctx)
 
 
 def updateLocalConfig(local_host, path):
@@ -1407,7 +2025,7 @@ def select_config_template(tl, selected_template_index=None):
     交互式选择配置模板索引。
 
     优先级：
-        1. 若命令行参数 args.template_index 不为空，直接使用；
+        1. 若 selected_template_index（命令行参数 --template_index）不为空，直接使用；
         2. 否则，提示用户输入序号：
             - 回车：默认选择第一个模板（索引 0）
             - 输入非法数字或越界：提示错误并递归重试。
@@ -1415,14 +2033,14 @@ def select_config_template(tl, selected_template_index=None):
     参数：
         tl: list[str]
             模板名称列表。
-        selected_template_index: Any
-            保留参数（当前逻辑未使用）。
+        selected_template_index: int | None
+            预先指定的模板索引（从 0 开始）。
 
     返回：
         int: 选中的模板索引（从 0 开始）。
     """
-    if args.template_index is not None:
-        uip = args.template_index
+    if selected_template_index is not None:
+        uip = selected_template_index
     else:
         uip = input('输入序号，载入对应config模板（直接回车默认选第一个配置模板）：')
         try:
@@ -1464,14 +2082,113 @@ def parse_json(value):
     except json.JSONDecodeError:
         raise argparse.ArgumentTypeError(f"Invalid JSON: {value}")
 
-def generate_config_from_providers(providers_data: dict):
+def load_template(ctx):
+    """
+    按 ctx.providers["config_template"] 加载并编译模板（可为远程 URL 或本地路径），编译结果按内容缓存。
+
+    返回：
+        CompiledTemplate | None: 未配置 config_template 时返回 None。
+    """
+    config_template_path = (ctx.get("config_template") or "").strip()
+    if not config_template_path:
+        return None
+    # 远程模板地址（HTTP / HTTPS）
+    if config_template_path.startswith("http://") or config_template_path.startswith("https://"):
+        resp = tool.get_session().get(config_template_path, timeout=10)
+        resp.raise_for_status()
+        # 优先按 JSON 解析，不行再尝试 YAML
+        return compile_template_source(resp.content)
+    # 本地模板文件
+    return load_compiled_template(config_template_path)
+
+
+def fetch_subscriptions(providers_list, parsers=None, workers=4):
+    """
+    并行拉取多份 providers 中订阅的并集，相同的订阅（见 GenerationContext.subscription_key）只拉取、解析一次。
+
+    参数：
+        providers_list: list[dict]
+            多份 providers 配置（如 mac / router / ios 各 profile）。
+        parsers: dict[str, module] | None
+            协议解析模块映射，为 None 时使用 init_parsers() 的结果。
+        workers: int
+            并行拉取的线程数。
+
+    返回：
+        list[dict[str, list[dict]]]: 与 providers_list 一一对应的 { url: 节点列表 }，
+        可直接作为 generate_config_from_providers 的 fetched 参数（各 profile 共享同一份节点，
+        使用时会先深拷贝）。拉取失败的订阅对应空列表。
+    """
+    jobs = {}
+    keys_list = []
+    for providers_data in providers_list:
+        ctx = GenerationContext(providers_data, parsers)
+        keys = {}
+        for subscribe in active_subscribes(ctx.get('subscribes') or []):
+            key = ctx.subscription_key(subscribe['url'])
+            jobs.setdefault(key, ctx)
+            keys[subscribe['url']] = key
+        keys_list.append(keys)
+
+    results = {}
+    if jobs:
+        with ThreadPoolExecutor(max_workers=max(1, min(workers, len(jobs))), thread_name_prefix='fetch') as executor:
+            futures = {key: executor.submit(get_nodes, key[0], ctx) for key, ctx in jobs.items()}
+            for key, future in futures.items():
+                try:
+                    results[key] = future.result()
+                except Exception as e:
+                    print(f"[WARN] 拉取订阅失败: {e}")
+                    results[key] = []
+    return [{url: results[key] for url, key in keys.items()} for keys in keys_list]
+
+
+def generate_configs_for_profiles(profiles, parsers=None, workers=4):
+    """
+    批量生成多个 profile 的配置：先并行拉取各 profile 订阅的并集（相同订阅只拉取、解析一次，
+    见 fetch_subscriptions），再用共享的节点数据按各 profile 自己的模板与 filter 渲染。
+
+    参数：
+        profiles: dict[str, dict]
+            profile -> providers（如 mac / router / ios）。
+        parsers: dict[str, module] | None
+            协议解析模块映射，为 None 时使用 init_parsers() 的结果。
+        workers: int
+            并行拉取订阅的线程数。
+
+    返回：
+        tuple[dict[str, dict], dict[str, Exception]]:
+            (各 profile 生成的配置, 生成失败的 profile -> 异常)；单个 profile 失败不影响其他 profile。
+    """
+    parsers = init_parsers() if parsers is None else parsers
+    names = list(profiles)
+    fetched_list = fetch_subscriptions([profiles[name] for name in names], parsers, workers)
+    configs = {}
+    errors = {}
+    for name, fetched in zip(names, fetched_list):
+        try:
+            configs[name] = generate_config_from_providers(profiles[name], parsers, fetched)
+        except Exception as e:
+            print(f"[WARN] 生成 profile {name} 失败: {e}")
+            errors[name] = e
+    return configs, errors
+
+
+def generate_config_from_providers(providers_data: dict, parsers=None, fetched=None):
     """
     给 Vercel / API 使用的封装函数。
 
+    每次调用使用独立的 GenerationContext，不读写模块级全局变量，
+    可以在多个线程中同时调用。
+
     输入:
         providers_data: dict
             从 SUB_CONFIG 或 URL 传进来的完整配置，
-            结构与原来的 providers.json 一致。
+            结构与原来的 providers.json 一致（不会被修改）。
+        parsers: dict[str, module] | None
+            协议解析模块映射，为 None 时使用 init_parsers() 的结果。
+        fetched: dict[str, list[dict]] | None
+            订阅 url -> 预先拉取的节点列表，命中的订阅不再重新拉取。
 
     输出:
         final_config: dict 或 list
@@ -1481,42 +2198,19 @@ def generate_config_from_providers(providers_data: dict):
     if not isinstance(providers_data, dict):
         raise ValueError("providers_data 必须是 dict")
 
-    # 仍沿用原脚本中的全局 providers 变量
-    global providers
-    providers = providers_data
-
-    # 初始化各协议解析器
-    init_parsers()
-
-    # 1) 处理 config_template （可为远程 URL 或本地路径）
-    config = None
-    config_template_path = (providers.get("config_template") or "").strip()
+    ctx = GenerationContext(providers_data, parsers, fetched)
 
-    if config_template_path:
-        # 远程模板地址（HTTP / HTTPS）
-        if config_template_path.startswith("http://") or config_template_path.startswith("https://"):
-            resp = requests.get(config_template_path, timeout=10)
-            resp.raise_for_status()
-            # 优先按 JSON 解析，不行再尝试 YAML
-            try:
-                config = resp.json()
-            except Exception:
-                try:
-                    config = yaml.safe_load(resp.text)
-                except Exception as e:
-                    raise ValueError(f"读取远程模板失败: {e}")
-        else:
-            # 本地模板文件
-            config = load_json(config_template_path)
+    # 1) 处理 config_template （可为远程 URL 或本地路径），编译结果按内容缓存
+    template = load_template(ctx)
 
     # 2) 处理订阅列表，生成各订阅下的节点
-    if "subscribes" not in providers or not providers["subscribes"]:
+    if not ctx.get("subscribes"):
         raise ValueError("providers 中缺少 subscribes 字段，或为空")
 
-    nodes = process_subscribes(providers["subscribes"])
+    nodes = process_subscribes(ctx.providers["subscribes"], ctx)
 
     # 3) 根据 Only-nodes 决定返回节点列表，还是结合模板生成完整配置
-    if providers.get("Only-nodes"):
+    if ctx.get("Only-nodes"):
         # 只返回节点列表（不套模板）
         combined_contents = []
         for sub_tag, contents in nodes.items():
@@ -1525,22 +2219,26 @@ def generate_config_from_providers(providers_data: dict):
         final_config = combined_contents
     else:
         # 需要完整配置，但没有模板 → 在无交互环境直接报错说明
-        if config is None:
+        if template is None:
             raise ValueError(
                 "config_template 为空且 Only-nodes 为 false："
                 "在无交互环境（如 Vercel）下无法选择模板。"
                 "请在 SUB_CONFIG 中提供 config_template，或把 Only-nodes 设为 true。"
             )
-        # 使用原有逻辑，将节点合并入模板
-        final_config = combin_to_config(config, nodes)
+        # 将节点填入编译后的模板，模板本身不被修改，可供后续请求复用
+        final_config = template.render(nodes, ctx)
+
+    # 引用检查 / 裁剪；路由器等 profile 可开启 minify，删除默认值字段
+    final_config = finalize_config(final_config, ctx)
 
     # 不在此处写文件，由上层 API 决定如何使用返回结果
     return final_config
 
 
-if __name__ == '__main__':
-    # 本地/命令行模式入口（保留原逻辑）
-    init_parsers()
+def main():
+    """
+    本地/命令行模式入口（保留原逻辑）。
+    """
     parser = argparse.ArgumentParser()
     parser.add_argument('--temp_json_data', type=parse_json, help='临时内容（JSON 字符串）')
     parser.add_argument('--template_index', type=int, help='模板序号')
@@ -1548,20 +2246,19 @@ if __name__ == '__main__':
     args = parser.parse_args()
 
     temp_json_data = args.temp_json_data
-    gh_proxy_index = args.gh_proxy_index
 
     # 1) 加载 providers：优先使用命令行传入的 JSON，其次读本地 providers.json
     if temp_json_data and temp_json_data != '{}':
-        providers = json.loads(temp_json_data)
+        ctx = GenerationContext(json.loads(temp_json_data))
     else:
-        providers = load_json('providers.json')
+        ctx = GenerationContext(load_json('providers.json'))
 
     # 2) 加载配置模板（支持远程 config_template，也支持本地交互选择）
-    if providers.get('config_template'):
+    if ctx.get('config_template'):
         # 远程模板模式
-        config_template_path = providers['config_template']
+        config_template_path = ctx.providers['config_template']
         print('选择: \033[33m' + config_template_path + '\033[0m')
-        response = requests.get(providers['config_template'])
+        response = requests.get(ctx.providers['config_template'])
         response.raise_for_status()
         config = response.json()
     else:
@@ -1577,10 +2274,10 @@ if __name__ == '__main__':
         config = load_json(config_template_path)
 
     # 3) 根据 subscribes 拉取所有机场节点
-    nodes = process_subscribes(providers["subscribes"])
+    nodes = process_subscribes(ctx.providers["subscribes"], ctx)
 
     # 4) 处理 GitHub 加速（对 config["route"]["rule_set"] 中的 URL 进行替换）
-    if hasattr(args, 'gh_proxy_index') and str(args.gh_proxy_index).isdigit():
+    if str(args.gh_proxy_index).isdigit():
         gh_proxy_index = int(args.gh_proxy_index)
         print(gh_proxy_index)
         urls = [item["url"] for item in config["route"]["rule_set"]]
@@ -1589,7 +2286,7 @@ if __name__ == '__main__':
             item["url"] = new_url
 
     # 5) 根据 Only-nodes 决定输出形式（节点列表 / 完整配置）
-    if providers.get('Only-nodes'):
+    if ctx.get('Only-nodes'):
         combined_contents = []
         for sub_tag, contents in nodes.items():
             # 遍历每个机场的节点内容并扁平化
@@ -1598,9 +2295,17 @@ if __name__ == '__main__':
         final_config = combined_contents
     else:
         # 将节点信息合并到模板 config 中
-        final_config = combin_to_config(config, nodes)
+        final_config = combin_to_config(config, nodes, ctx)
+    final_config = finalize_config(final_config, ctx)
 
-    # 6) 保存配置文件到 providers["save_config_path"]
-    save_config(providers["save_config_path"], final_config)
-    # 如果需要，可启用本地面板自动更新：
-    # updateLocalConfig('http://127.0.0.1:9090', providers['save_config_path'])
\ No newline at end of file
+    # 6) 保存配置文件到 providers["save_config_path"]（内容未变化时不写入）
+    #    配置了 reload_api（如 "http://127.0.0.1:9090"）时，仅在配置有变化时通知本地面板重载
+    if save_config(ctx.providers["save_config_path"], final_config, ctx) and ctx.get('reload_api'):
+        try:
+            updateLocalConfig(ctx.get('reload_api'), ctx.providers["save_config_path"])
+        except Exception as e:
+            print(f"通知本地面板重载配置时出错：{str(e)}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,133 @@
+# admission_test.py
+# 验证 admission.AdmissionController：FIFO 排队、队列满 / 排队超时时抛出 Saturated、
+# Retry-After 随队列深度增长、异常与超时后名额正确释放
+
+import os, sys
+
+# 计算项目根目录：.../项目根/parsers_test/admission_test.py → .../项目根
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_ROOT not in sys.path:
+    sys.path.append(PROJECT_ROOT)
+
+import threading
+import time
+from concurrent.futures import Future
+
+import pytest
+
+from admission import AdmissionController, Saturated
+
+
+def wait_until(predicate, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, '等待超时'
+        time.sleep(0.005)
+
+
+def hold(controller):
+    """占用一个名额，返回释放函数"""
+    cm = controller.admit()
+    cm.__enter__()
+    return lambda: cm.__exit__(None, None, None)
+
+
+def start_waiter(controller, name, order):
+    def run():
+        with controller.admit(timeout=5):
+            order.append(name)
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    return thread
+
+
+def test_fifo_order():
+    controller = AdmissionController(max_concurrent=1, max_queue=5, queue_timeout=5)
+    release = hold(controller)
+    order = []
+    threads = []
+    for i, name in enumerate('ABCD'):
+        threads.append(start_waiter(controller, name, order))
+        wait_until(lambda: controller.stats()['queued'] == i + 1)
+    release()
+    for thread in threads:
+        thread.join(5)
+    assert order == list('ABCD')
+    assert controller.stats()['active'] == 0
+
+
+def test_queue_full_rejects_immediately():
+    controller = AdmissionController(max_concurrent=1, max_queue=1, queue_timeout=5)
+    release = hold(controller)
+    order = []
+    waiter = start_waiter(controller, 'A', order)
+    wait_until(lambda: controller.stats()['queued'] == 1)
+
+    start = time.monotonic()
+    with pytest.raises(Saturated) as info:
+        with controller.admit():
+            pass
+    assert time.monotonic() - start < 0.5
+    assert info.value.retry_after >= 1
+    assert controller.stats()['rejected'] == 1
+
+    release()
+    waiter.join(5)
+    assert order == ['A']
+
+
+def test_queue_timeout():
+    controller = AdmissionController(max_concurrent=1, max_queue=4, queue_timeout=0.1)
+    release = hold(controller)
+    start = time.monotonic()
+    with pytest.raises(Saturated):
+        with controller.admit():
+            pass
+    assert time.monotonic() - start >= 0.1
+    stats = controller.stats()
+    assert stats['timed_out'] == 1
+    assert stats['queued'] == 0
+    release()
+    assert controller.stats()['active'] == 0
+
+
+def test_retry_after_grows_with_queue_depth():
+    controller = AdmissionController(max_concurrent=1, max_queue=8, queue_timeout=5)
+    controller.avg_duration = 2.0
+    release = hold(controller)
+    values = [controller.retry_after()]
+    order = []
+    threads = []
+    for i in range(3):
+        threads.append(start_waiter(controller, i, order))
+        wait_until(lambda: controller.stats()['queued'] == i + 1)
+        values.append(controller.retry_after())
+    assert values == sorted(values) and values[0] < values[-1]
+    assert values[0] == 2 and values[-1] == 8
+    release()
+    for thread in threads:
+        thread.join(5)
+
+
+def test_slot_released_when_body_raises():
+    controller = AdmissionController(max_concurrent=2, max_queue=0)
+    with pytest.raises(RuntimeError):
+        with controller.admit():
+            assert controller.stats()['active'] == 1
+            raise RuntimeError('boom')
+    assert controller.stats()['active'] == 0
+
+
+def test_slot_held_until_future_done():
+    controller = AdmissionController(max_concurrent=1, max_queue=0)
+    future = Future()
+    with controller.admit() as slot:
+        slot.hold_until(future)
+    stats = controller.stats()
+    assert stats['active'] == 1 and stats['lingering'] == 1
+    with pytest.raises(Saturated):
+        with controller.admit():
+            pass
+    future.set_result(None)
+    stats = controller.stats()
+    assert stats['active'] == 0 and stats['lingering'] == 0
@@ -0,0 +1,91 @@
+# compiled_template_test.py
+# 验证同一个 CompiledTemplate 被多个线程同时渲染时，dns 段缓存与静态段片段缓存保持一致
+
+import os, sys
+
+# 计算项目根目录：.../项目根/parsers_test/compiled_template_test.py → .../项目根
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_ROOT not in sys.path:
+    sys.path.append(PROJECT_ROOT)
+
+import contextlib
+import io
+import json
+import threading
+
+import main
+
+ASODS = [
+    {'proxy': 'proxyDns', 'direct': 'localDns'},
+    {'proxy': 'altDns', 'direct': 'localDns'},
+    {'proxy': 'proxyDns', 'direct': 'altDns'},
+    {'proxy': 'altDns', 'direct': 'proxyDns'},
+]
+
+
+def make_template():
+    return {
+        'dns': {
+            'servers': [
+                {'tag': 'proxyDns', 'type': 'https', 'server': '8.8.8.8'},
+                {'tag': 'localDns', 'type': 'udp', 'server': '223.5.5.5'},
+                {'tag': 'altDns', 'type': 'tls', 'server': '1.1.1.1'},
+            ],
+            'rules': [{'outbound': 'any', 'server': 'localDns'}],
+        },
+        'outbounds': [
+            {'tag': 'Proxy', 'type': 'selector', 'outbounds': ['{all}']},
+            {'tag': 'Google', 'type': 'selector', 'outbounds': ['Proxy', '{all}']},
+            {'tag': 'direct', 'type': 'direct'},
+        ],
+        'route': {'rules': [
+            {'geosite': 'google', 'outbound': 'Google'},
+            {'geosite': 'cn', 'outbound': 'direct'},
+        ]},
+    }
+
+
+def test_concurrent_render_with_different_asod():
+    data = {'A': [{'tag': 'HK 01', 'type': 'trojan'}, {'tag': 'JP 01', 'type': 'trojan'}]}
+    # 频繁切换线程，放大 dns 段生成与片段查找交错执行的机会
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    try:
+        run_concurrent_renders(data, rounds=50)
+    finally:
+        sys.setswitchinterval(interval)
+
+
+def run_concurrent_renders(data, rounds):
+    for _ in range(rounds):
+        template = main.CompiledTemplate(make_template())
+        threads_per_asod = 4
+        barrier = threading.Barrier(len(ASODS) * threads_per_asod)
+        results = []
+        errors = []
+
+        def worker(asod):
+            ctx = main.GenerationContext({'auto_set_outbounds_dns': asod}, parsers={})
+            try:
+                barrier.wait()
+                with contextlib.redirect_stdout(io.StringIO()):
+                    config = template.render(data, ctx)
+                body = main.dump_config(config)
+                results.append((asod['proxy'], asod['direct'], config, body))
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=worker, args=(asod,))
+                   for asod in ASODS for _ in range(threads_per_asod)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(10)
+
+        assert errors == []
+        assert len(results) == len(threads)
+        assert sorted(template.dns_cache) == sorted((asod['proxy'], asod['direct']) for asod in ASODS)
+        for proxy, direct, config, body in results:
+            # 同一 (proxy, direct) 的请求共享同一个缓存的 dns 段
+            assert config['dns'] is template.dns_cache[(proxy, direct)]
+            assert body == json.dumps(config, indent=2, ensure_ascii=False).encode('utf-8')
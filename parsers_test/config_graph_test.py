@@ -0,0 +1,104 @@
+# config_graph_test.py
+# 验证 config_graph：悬空引用、不可达对象的识别，以及 prune_config 不修改共享的原有对象
+
+import os, sys
+
+# 计算项目根目录：.../项目根/parsers_test/config_graph_test.py → .../项目根
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_ROOT not in sys.path:
+    sys.path.append(PROJECT_ROOT)
+
+import copy
+
+from config_graph import DNS_SERVER, OUTBOUND, RULE_SET, ReferenceGraph, prune_config
+
+
+def make_config():
+    return {
+        'dns': {
+            'servers': [
+                {'tag': 'localDns', 'type': 'udp', 'server': '223.5.5.5'},
+                {'tag': 'proxyDns', 'type': 'https', 'server': '8.8.8.8', 'detour': 'Proxy'},
+                {'tag': 'unused_dns', 'type': 'udp', 'server': '1.1.1.1'},
+            ],
+            'rules': [
+                {'rule_set': 'geosite-cn', 'server': 'localDns'},
+                {'domain_suffix': ['example.com'], 'server': 'missingDns'},
+            ],
+            'final': 'proxyDns',
+        },
+        'outbounds': [
+            {'tag': 'Proxy', 'type': 'selector', 'outbounds': ['HK 01', 'JP 01', 'ghost']},
+            {'tag': 'direct', 'type': 'direct'},
+            {'tag': 'Empty', 'type': 'selector', 'outbounds': ['direct']},
+            {'tag': 'HK 01', 'type': 'shadowsocks', 'detour': 'HK relay'},
+            {'tag': 'HK relay', 'type': 'shadowtls'},
+            {'tag': 'JP 01', 'type': 'trojan'},
+            {'tag': 'orphan', 'type': 'trojan'},
+        ],
+        'route': {
+            'rules': [
+                {'rule_set': ['geosite-cn', 'geoip-cn'], 'outbound': 'direct'},
+                {'type': 'logical', 'mode': 'or', 'rules': [{'rule_set': 'geosite-ads'}], 'outbound': 'block'},
+            ],
+            'rule_set': [
+                {'tag': 'geosite-cn', 'type': 'remote', 'download_detour': 'Proxy'},
+                {'tag': 'geoip-cn', 'type': 'remote'},
+                {'tag': 'geosite-ads', 'type': 'remote'},
+                {'tag': 'geosite-unused', 'type': 'remote'},
+            ],
+            'final': 'Proxy',
+        },
+    }
+
+
+def test_dangling_references():
+    dangling = {(kind, tag) for _, kind, tag in ReferenceGraph(make_config()).dangling()}
+    assert dangling == {
+        (OUTBOUND, 'ghost'),
+        (OUTBOUND, 'block'),
+        (DNS_SERVER, 'missingDns'),
+    }
+
+
+def test_unreachable_objects():
+    graph = ReferenceGraph(make_config())
+    assert graph.unreachable() == {
+        OUTBOUND: ['Empty', 'orphan'],
+        DNS_SERVER: ['unused_dns'],
+        RULE_SET: ['geosite-unused'],
+    }
+    # detour 与 download_detour 指向的对象可达
+    reachable = graph.reachable()
+    assert (OUTBOUND, 'HK relay') in reachable
+    assert (RULE_SET, 'geosite-ads') in reachable
+    assert graph.direct_only_groups() == ['Empty']
+
+
+def test_prune_removes_unreachable_without_mutating_input():
+    config = make_config()
+    snapshot = copy.deepcopy(config)
+    dns, route = config['dns'], config['route']
+    outbound_objects = list(config['outbounds'])
+
+    removed = prune_config(config)
+    assert removed[OUTBOUND] == ['Empty', 'orphan']
+    assert [o['tag'] for o in config['outbounds']] == ['Proxy', 'direct', 'HK 01', 'HK relay', 'JP 01']
+    assert [s['tag'] for s in config['dns']['servers']] == ['localDns', 'proxyDns']
+    assert [r['tag'] for r in config['route']['rule_set']] == ['geosite-cn', 'geoip-cn', 'geosite-ads']
+
+    # 原有的 dns / route 段与出站对象保持不变（模板静态段可能被多次渲染共享）
+    assert dns == snapshot['dns'] and route == snapshot['route']
+    assert config['dns'] is not dns and config['route'] is not route
+    assert outbound_objects == snapshot['outbounds']
+    # 保留下来的对象是原对象本身，而不是副本
+    assert config['outbounds'][0] is outbound_objects[0]
+
+
+def test_prune_without_unreachable_keeps_sections():
+    config = make_config()
+    prune_config(config)
+    dns, route, outbounds = config['dns'], config['route'], config['outbounds']
+    removed = prune_config(config)
+    assert removed == {OUTBOUND: [], DNS_SERVER: [], RULE_SET: []}
+    assert config['dns'] is dns and config['route'] is route and config['outbounds'] == outbounds
@@ -0,0 +1,80 @@
+# config_minifier_test.py
+# 验证 config_minifier：删除与 sing-box 默认值相同的字段，保留缺省与零值含义不同的字段
+
+import os, sys
+
+# 计算项目根目录：.../项目根/parsers_test/config_minifier_test.py → .../项目根
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_ROOT not in sys.path:
+    sys.path.append(PROJECT_ROOT)
+
+import copy
+import json
+
+from config_minifier import minify_config, minify_outbound
+
+
+def make_config():
+    return {
+        'dns': {'servers': [{'tag': 'localDns', 'type': 'udp', 'server': '223.5.5.5', 'detour': ''}]},
+        'outbounds': [
+            {'tag': 'direct', 'type': 'direct'},
+            {
+                'tag': 'vless-plain', 'type': 'vless', 'server': 'a.example.com', 'server_port': 443,
+                'uuid': 'u', 'flow': '', 'packet_encoding': '',
+                'tls': {'enabled': True, 'server_name': 'a.example.com', 'insecure': False,
+                        'utls': {'enabled': False, 'fingerprint': 'chrome'}},
+                'multiplex': {'enabled': True, 'protocol': 'h2mux', 'max_connections': 0},
+            },
+            {
+                'tag': 'vless-xudp', 'type': 'vless', 'server': 'b.example.com', 'server_port': 443,
+                'uuid': 'u', 'packet_encoding': 'xudp', 'tls': {'enabled': False, 'server_name': ''},
+            },
+            {
+                'tag': 'ss', 'type': 'shadowsocks', 'server': 'c.example.com', 'server_port': 8388,
+                'method': 'aes-128-gcm', 'password': 'pw', 'packet_encoding': '', 'udp_over_tcp': False,
+            },
+        ],
+    }
+
+
+def test_minify_outbounds():
+    config, stats = minify_config(make_config())
+    outbounds = {o['tag']: o for o in config['outbounds']}
+
+    # vless 的 packet_encoding: "" 表示不使用 packet encoding，与缺省的 xudp 不同，必须保留
+    assert outbounds['vless-plain']['packet_encoding'] == ''
+    assert 'packet_encoding' not in outbounds['vless-xudp']
+    # 其他类型的空字符串按零值删除
+    assert 'packet_encoding' not in outbounds['ss'] and 'udp_over_tcp' not in outbounds['ss']
+
+    assert outbounds['vless-plain']['tls'] == {'enabled': True, 'server_name': 'a.example.com'}
+    assert outbounds['vless-plain']['multiplex'] == {'enabled': True}
+    assert 'flow' not in outbounds['vless-plain']
+    # enabled: false 的嵌套对象整体删除
+    assert 'tls' not in outbounds['vless-xudp']
+    assert outbounds['direct'] == {'tag': 'direct', 'type': 'direct'}
+    assert stats.removed_fields > 0 and stats.bytes_saved > 0
+
+    # 只处理 outbounds / endpoints，dns 等段保持原样
+    assert config['dns'] == make_config()['dns']
+
+
+def test_minify_round_trip():
+    original = make_config()
+    config, _ = minify_config(copy.deepcopy(original))
+    # 序列化再读回后再次精简，结果不再变化
+    reloaded = json.loads(json.dumps(config, ensure_ascii=False))
+    again, stats = minify_config(copy.deepcopy(reloaded))
+    assert again == reloaded
+    assert stats.removed_fields == 0
+    assert [o['tag'] for o in reloaded['outbounds']] == [o['tag'] for o in original['outbounds']]
+    assert reloaded['outbounds'][1]['packet_encoding'] == ''
+
+
+def test_minify_does_not_mutate_outbound():
+    outbound = make_config()['outbounds'][1]
+    snapshot = copy.deepcopy(outbound)
+    minified = minify_outbound(outbound)
+    assert outbound == snapshot
+    assert minified is not outbound and minified['tls'] is not outbound['tls']
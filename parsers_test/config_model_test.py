@@ -0,0 +1,35 @@
+# config_model_test.py
+# 验证 ConfigModel：按 tag 索引查找，以及只读访问不会修改被包装的配置
+
+import os, sys
+
+# 计算项目根目录：.../项目根/parsers_test/config_model_test.py → .../项目根
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_ROOT not in sys.path:
+    sys.path.append(PROJECT_ROOT)
+
+from config_model import ConfigModel
+
+
+def test_read_access_does_not_modify_config():
+    config = {'dns': {'rules': []}, 'outbounds': [], 'route': {'rules': []}}
+    model = ConfigModel(config)
+    assert model.dns_servers == []
+    assert not model.has_dns_server('proxyDns')
+    assert model.remove_dns_server('proxyDns') == 0
+    assert model.rule_sets == []
+    # 没有 servers / rule_set 时不补写空列表
+    assert config == {'dns': {'rules': []}, 'outbounds': [], 'route': {'rules': []}}
+
+
+def test_add_and_remove_dns_servers():
+    config = {'dns': {}, 'outbounds': [{'tag': 'direct', 'type': 'direct'}]}
+    model = ConfigModel(config)
+    model.add_dns_servers([{'tag': 'proxyDns'}, {'tag': 'localDns'}])
+    assert config['dns']['servers'] == [{'tag': 'proxyDns'}, {'tag': 'localDns'}]
+    assert model.dns_server('localDns') is config['dns']['servers'][1]
+
+    assert model.remove_dns_server('proxyDns') == 1
+    assert config['dns']['servers'] == [{'tag': 'localDns'}]
+    assert model.dns_server('proxyDns') is None
+    assert model.first_outbound_of_type('direct') is config['outbounds'][0]
@@ -0,0 +1,113 @@
+# config_writer_test.py
+# 验证 config_writer：原子写入、内容未变化检测、备份数量保留与硬链接 / 复制回退
+
+import os, sys
+
+# 计算项目根目录：.../项目根/parsers_test/config_writer_test.py → .../项目根
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_ROOT not in sys.path:
+    sys.path.append(PROJECT_ROOT)
+
+import pytest
+
+import config_writer
+from config_writer import backup_file, content_changed, write_atomic, write_if_changed
+
+
+def test_write_atomic_replaces_and_keeps_mode(tmp_path):
+    path = tmp_path / 'config.json'
+    write_atomic(str(path), b'{"a": 1}')
+    assert path.read_bytes() == b'{"a": 1}'
+
+    os.chmod(path, 0o600)
+    write_atomic(str(path), [b'{"a": ', b'2}'])
+    assert path.read_bytes() == b'{"a": 2}'
+    assert os.stat(path).st_mode & 0o777 == 0o600
+    # 不留下临时文件
+    assert os.listdir(tmp_path) == ['config.json']
+
+
+def test_write_atomic_failure_keeps_original(tmp_path):
+    path = tmp_path / 'config.json'
+    path.write_bytes(b'old')
+
+    def chunks():
+        yield b'new'
+        raise RuntimeError('render failed')
+
+    with pytest.raises(RuntimeError):
+        write_atomic(str(path), chunks())
+    assert path.read_bytes() == b'old'
+    assert os.listdir(tmp_path) == ['config.json']
+
+
+def test_content_changed(tmp_path):
+    path = tmp_path / 'config.json'
+    assert content_changed(str(path), b'x')
+    path.write_bytes(b'abc')
+    assert not content_changed(str(path), b'abc')
+    assert not content_changed(str(path), [b'a', b'bc'])
+    assert content_changed(str(path), b'abd')
+
+
+def test_backup_file_retention(tmp_path):
+    path = tmp_path / 'config.json'
+    assert backup_file(str(path)) is None
+
+    path.write_bytes(b'current')
+    old_backups = [f'config.json.2024010100000{i}.bak' for i in range(5)]
+    for name in old_backups:
+        (tmp_path / name).write_bytes(b'old')
+    # 不符合备份命名的文件不会被清理
+    (tmp_path / 'config.json.manual.bak').write_bytes(b'keep me')
+
+    backup_path = backup_file(str(path), keep=3)
+    backups = sorted(name for name in os.listdir(tmp_path) if name.endswith('.bak'))
+    assert os.path.basename(backup_path) in backups
+    assert backups == sorted(old_backups[-2:] + [os.path.basename(backup_path), 'config.json.manual.bak'])
+
+    # 硬链接备份：原子替换 path 后备份中仍是旧内容
+    write_atomic(str(path), b'next')
+    assert open(backup_path, 'rb').read() == b'current'
+
+
+def test_backup_file_copy_fallback(tmp_path, monkeypatch):
+    path = tmp_path / 'config.json'
+    path.write_bytes(b'current')
+
+    def no_link(src, dst):
+        raise OSError('hard links not supported')
+
+    monkeypatch.setattr(config_writer.os, 'link', no_link)
+    backup_path = backup_file(str(path), keep=0)
+    assert open(backup_path, 'rb').read() == b'current'
+    assert os.stat(backup_path).st_ino != os.stat(path).st_ino
+
+
+def test_write_if_changed_streams_once(tmp_path):
+    path = tmp_path / 'config.json'
+    consumed = []
+
+    def chunks(*parts):
+        # 生成器只能遍历一次：写入与哈希比较必须在同一遍中完成
+        for part in parts:
+            consumed.append(part)
+            yield part
+
+    assert write_if_changed(str(path), chunks(b'{"a": ', b'1}'), backup_keep=3)
+    assert path.read_bytes() == b'{"a": 1}'
+    # 新文件没有可备份的旧内容
+    assert os.listdir(tmp_path) == ['config.json']
+
+    inode = os.stat(path).st_ino
+    assert not write_if_changed(str(path), chunks(b'{"a": 1', b'}'), backup_keep=3)
+    # 内容未变化：不替换文件、不备份、不留临时文件
+    assert os.stat(path).st_ino == inode
+    assert os.listdir(tmp_path) == ['config.json']
+
+    assert write_if_changed(str(path), chunks(b'{"a": 2}'), backup_keep=3)
+    assert path.read_bytes() == b'{"a": 2}'
+    backups = [name for name in os.listdir(tmp_path) if name.endswith('.bak')]
+    assert len(backups) == 1
+    assert (tmp_path / backups[0]).read_bytes() == b'{"a": 1}'
+    assert consumed == [b'{"a": ', b'1}', b'{"a": 1', b'}', b'{"a": 2}']
@@ -0,0 +1,85 @@
+# dns_rules_test.py
+# 验证 set_proxy_rule_dns 生成的 DNS 规则：按内容去重、相邻同 server 的域名规则合并
+
+import os, sys
+
+# 计算项目根目录：.../项目根/parsers_test/dns_rules_test.py → .../项目根
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_ROOT not in sys.path:
+    sys.path.append(PROJECT_ROOT)
+
+import copy
+
+import main
+
+ASOD = {'proxy': 'proxyDns', 'direct': 'localDns'}
+
+
+def test_merge_adjacent_domain_rules():
+    rules = [
+        {'geosite': 'youtube', 'server': 'Google_dns'},
+        {'geosite': ['google', 'youtube'], 'domain_suffix': 'g.co', 'server': 'Google_dns'},
+        {'geosite': 'apple', 'server': 'Apple_dns'},
+        {'geosite': 'apple-cn', 'server': 'Apple_dns'},
+        # 含非域名字段的规则不合并，也阻断前后合并
+        {'geosite': 'apple', 'clash_mode': 'rule', 'server': 'Apple_dns'},
+        {'domain': ['icloud.com'], 'server': 'Apple_dns'},
+        {'geosite': 'cn', 'server': 'localDns'},
+    ]
+    original = copy.deepcopy(rules)
+    merged = main.merge_dns_rules(rules)
+    assert merged == [
+        {'geosite': ['youtube', 'google'], 'domain_suffix': ['g.co'], 'server': 'Google_dns'},
+        {'geosite': ['apple', 'apple-cn'], 'server': 'Apple_dns'},
+        {'geosite': 'apple', 'clash_mode': 'rule', 'server': 'Apple_dns'},
+        {'domain': ['icloud.com'], 'server': 'Apple_dns'},
+        {'geosite': 'cn', 'server': 'localDns'},
+    ]
+    # 不修改传入的规则对象
+    assert rules == original
+    # 未合并的规则保持原对象
+    assert merged[2] is rules[4]
+
+
+def make_config():
+    return {
+        'dns': {
+            'servers': [
+                {'tag': 'proxyDns', 'type': 'https', 'server': '8.8.8.8'},
+                {'tag': 'localDns', 'type': 'udp', 'server': '223.5.5.5'},
+            ],
+            'rules': [
+                {'outbound': 'any', 'server': 'localDns'},
+                {'outbound': 'any', 'server': 'localDns'},
+            ],
+        },
+        'route': {'rules': [
+            {'protocol': 'dns', 'outbound': 'dns-out'},
+            {'geosite': 'youtube', 'outbound': 'Google'},
+            {'geosite': 'google', 'outbound': 'Google'},
+            {'geosite': 'youtube', 'outbound': 'Google'},
+            {'ip_cidr': ['1.1.1.1/32'], 'outbound': 'Google'},
+            {'geosite': 'cn', 'outbound': 'direct'},
+            {'type': 'logical', 'mode': 'and', 'rules': [{'network': 'udp'}, {'port': 443}], 'outbound': 'block'},
+            {'type': 'logical', 'mode': 'or', 'rules': [{'geosite': 'apple'}, {'ip_cidr': ['17.0.0.0/8']}],
+             'outbound': 'Apple'},
+        ]},
+    }
+
+
+def test_set_proxy_rule_dns_dedupes_and_merges():
+    config = make_config()
+    main.set_proxy_rule_dns(config, ASOD)
+    assert config['dns']['rules'] == [
+        # 模板中的重复规则去重
+        {'outbound': 'any', 'server': 'localDns'},
+        # youtube 重复规则去重后与相邻的 google 合并
+        {'geosite': ['youtube', 'google'], 'server': 'Google_dns'},
+        {'geosite': 'cn', 'server': 'localDns'},
+        {'type': 'logical', 'mode': 'or', 'rules': [{'geosite': 'apple'}], 'server': 'Apple_dns'},
+    ]
+    servers = config['dns']['servers']
+    assert [server['tag'] for server in servers] == ['proxyDns', 'localDns', 'Google_dns', 'Apple_dns']
+    # 出站专用 DNS server 复制自 proxy 模板，detour 指向对应出站
+    assert servers[2] == {'tag': 'Google_dns', 'type': 'https', 'server': '8.8.8.8', 'detour': 'Google'}
+    assert 'detour' not in servers[0]
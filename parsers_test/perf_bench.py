@@ -0,0 +1,272 @@
+# perf_bench.py
+# 节点处理流水线的性能基准：python parsers_test/perf_bench.py
+# 每一项都会先确认新旧实现结果一致，再输出耗时对比
+
+import os, sys
+
+# 计算项目根目录：.../项目根/parsers_test/perf_bench.py → .../项目根
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_ROOT not in sys.path:
+    sys.path.append(PROJECT_ROOT)
+
+import contextlib
+import copy
+import json
+import random
+import re
+import time
+import tool
+import main
+
+
+def make_nodes(count, seed=7):
+    """生成带地区关键字、序号和 shadowtls detour 的模拟节点"""
+    rnd = random.Random(seed)
+    regions = ['香港', 'HK', '日本', 'JP', '美国', 'US', '新加坡', 'SG', '台湾', '韩国', '德国', 'UK']
+    extras = ['', ' IPLC', ' 专线', ' x2', ' 剩余流量', ' 到期时间', ' Netflix', ' BGP']
+    types = ['shadowsocks', 'trojan', 'vmess', 'vless', 'hysteria2']
+    nodes = []
+    for i in range(count):
+        node = {
+            'tag': f'{rnd.choice(regions)} {i % 50:02d}{rnd.choice(extras)}',
+            'type': rnd.choice(types),
+            'server': f'{rnd.randint(1, 223)}.{rnd.randint(0, 255)}.0.{rnd.randint(1, 254)}'
+            if rnd.random() < 0.5 else f'n{i}.example.com',
+            'server_port': 443,
+        }
+        if rnd.random() < 0.05:
+            node['detour'] = node['tag'] + '_shadowtls'
+        nodes.append(node)
+    return nodes
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def report(title, old_cost, new_cost):
+    print(f'{title}: 旧 {old_cost:.3f}s  新 {new_cost:.3f}s  提速 {old_cost / new_cost:.1f}x')
+
+
+def bench_subscribe_transform(count=20000):
+    """订阅后处理：prefix + emoji + ex-node-name 三遍处理 vs 单次遍历"""
+    subscribe = {
+        'prefix': '✈️ ',
+        'emoji': 1,
+        'ex-node-name': '故障,网址,重置,到期,自动,剩余,手动,文档,官网,群,防,时间,'
+                        '过期,流量,套餐,官方,测试,维护,公告,返利,客服,更新,订阅,剩余流量|到期时间',
+    }
+
+    def old_stage(nodes):
+        if subscribe.get('prefix'):
+            for node in nodes:
+                node['tag'] = subscribe['prefix'] + node['tag']
+                if node.get('detour'):
+                    node['detour'] = subscribe['prefix'] + node['detour']
+        if subscribe.get('emoji'):
+            for node in nodes:
+                node['tag'] = tool.rename(node['tag'])
+                if node.get('detour'):
+                    node['detour'] = tool.rename(node['detour'])
+        if subscribe.get('ex-node-name'):
+            for exns in re.split(r'[,\|]', subscribe['ex-node-name']):
+                for node in nodes[:]:
+                    if exns in node['tag']:
+                        nodes.remove(node)
+        return nodes
+
+    nodes = make_nodes(count)
+    old_nodes, old_cost = timed(old_stage, copy.deepcopy(nodes))
+    tool._region_match.cache_clear()
+    new_nodes, new_cost = timed(main.compile_subscribe_transform(subscribe), copy.deepcopy(nodes))
+    assert old_nodes == new_nodes
+    report(f'订阅后处理 {count} 节点', old_cost, new_cost)
+
+
+def bench_keyword_filter(count=20000):
+    """keywords 过滤：逐个正则 search vs 字面量合并为多模式匹配器"""
+    keywords = ['🇭🇰|HK|hk|香港|港', '🇹🇼|TW|tw|台湾|臺灣|台', '剩余', '到期', '官网', '流量',
+                '套餐', '重置', '测试', '维护', '公告', '返利', '客服', 'Netflix', 'IPLC']
+
+    def old_filter(nodes):
+        patterns = [re.compile(kw) for kw in keywords]
+        return [node for node in nodes if not any(p.search(node['tag']) for p in patterns)]
+
+    nodes = make_nodes(count)
+    filters = [{'action': 'exclude', 'keywords': keywords}]
+    old_nodes, old_cost = timed(old_filter, nodes)
+    new_nodes, new_cost = timed(main.nodes_filter, nodes, filters, 'all')
+    assert old_nodes == new_nodes
+    report(f'keywords 过滤 {count} 节点 / {len(keywords)} 个关键字', old_cost, new_cost)
+
+
+def make_template(selectors=30):
+    """生成含 selectors 个分组出站的模板：{all}、相同 filter 的 selector/urltest 成对、{group} 各占一部分"""
+    regions = ['🇭🇰|HK|香港', '🇯🇵|JP|日本', '🇺🇸|US|美国', '🇸🇬|SG|新加坡', '🇹🇼|TW|台湾']
+    outbounds = []
+    for i in range(selectors):
+        kind = i % 3
+        outbound = {'tag': f'selector-{i}', 'type': 'selector' if i % 2 else 'urltest'}
+        if kind == 0:
+            outbound['outbounds'] = ['direct', '{all}']
+        elif kind == 1:
+            outbound['outbounds'] = ['{all}']
+            outbound['filter'] = [{'action': 'include', 'keywords': [regions[(i // 2) % len(regions)]]},
+                                  {'action': 'exclude', 'keywords': ['剩余|到期']}]
+        else:
+            outbound['outbounds'] = ['{A}', '{B}', '{A}']
+        outbounds.append(outbound)
+    outbounds += [{'type': 'direct', 'tag': 'direct'}, {'type': 'block', 'tag': 'block'}]
+    return {'outbounds': outbounds, 'dns': {'servers': [], 'rules': []}, 'route': {'rules': []}}
+
+
+def baseline_expand(config, data):
+    """旧版 combin_to_config 的出站展开：逐个出站列表查重、{all} 每次按分组重新拼接"""
+    config_outbounds = config['outbounds']
+    direct_item = next((item for item in config_outbounds if item.get('type') == 'direct'), None)
+    filter_cache = main.FilterCache()
+    for po in config_outbounds:
+        if not po.get('outbounds'):
+            continue
+        if '{all}' in po['outbounds']:
+            po['outbounds'] = [item for item in po['outbounds']
+                               if not (item.startswith('{') and item.endswith('}')) or item == '{all}']
+        t_o = []
+        check_dup = []
+        for oo in po['outbounds']:
+            if oo in check_dup:
+                continue
+            check_dup.append(oo)
+            if oo.startswith('{') and oo.endswith('}'):
+                oo_key = oo[1:-1]
+                if data.get(oo_key):
+                    t_o.extend(main.pro_node_template(data[oo_key], po, oo_key, filter_cache))
+                elif oo_key == 'all':
+                    for group in data:
+                        t_o.extend(main.pro_node_template(data[group], po, group, filter_cache))
+            else:
+                t_o.append(oo)
+        if not t_o:
+            t_o.append(direct_item['tag'])
+        po['outbounds'] = t_o
+        if po.get('filter'):
+            del po['filter']
+    temp_outbounds = []
+    for group in data:
+        temp_outbounds.extend(data[group])
+    config['outbounds'] = config_outbounds + temp_outbounds
+    return config
+
+
+def bench_combin_to_config(count=20000, selectors=30):
+    """模板渲染：{all} / {group} / filter 展开，旧版逐个出站展开 vs 当前 combin_to_config"""
+    nodes = make_nodes(count)
+    quarter = count // 4
+    data = {group: nodes[i * quarter:(i + 1) * quarter] for i, group in enumerate('ABCD')}
+    template = make_template(selectors)
+    # 各取 3 次中最快的一次，减少抖动
+    with contextlib.redirect_stdout(None):
+        old_runs = [timed(baseline_expand, copy.deepcopy(template), data) for _ in range(3)]
+        new_runs = [timed(main.combin_to_config, copy.deepcopy(template), data) for _ in range(3)]
+    old_config, old_cost = old_runs[0][0], min(cost for _, cost in old_runs)
+    config, cost = new_runs[0][0], min(cost for _, cost in new_runs)
+    assert json.dumps(old_config, ensure_ascii=False) == json.dumps(config, ensure_ascii=False)
+    size = sum(len(o.get('outbounds', [])) for o in config['outbounds'] if isinstance(o.get('outbounds'), list))
+    report(f'模板渲染 {selectors} 个分组出站 / {count} 节点（展开 {size} 个引用）', old_cost, cost)
+
+
+def bench_compiled_render(count=200, renders=50):
+    """重复渲染同一模板：每次重新解析 + combin_to_config vs 复用 CompiledTemplate"""
+    path = os.path.join(PROJECT_ROOT, 'config_template', 'config_template_groups_tun.json')
+    with open(path, 'rb') as f:
+        content = f.read()
+    nodes = make_nodes(count)
+    data = {'A': nodes[:count // 2], 'B': nodes[count // 2:]}
+    ctx = main.GenerationContext({'auto_set_outbounds_dns': {'proxy': 'proxyDns', 'direct': 'localDns'}}, parsers={})
+
+    def old_render():
+        return [main.combin_to_config(main.json.loads(content), data, ctx) for _ in range(renders)]
+
+    def new_render():
+        template = main.compile_template_source(content)
+        return [template.render(data, ctx) for _ in range(renders)]
+
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        old_configs, old_cost = timed(old_render)
+        new_configs, new_cost = timed(new_render)
+    assert json.dumps(old_configs) == json.dumps(new_configs)
+    report(f'重复渲染模板 {renders} 次 / {count} 节点', old_cost, new_cost)
+
+
+def bench_dump_config(count=100, renders=200):
+    """配置输出：每次整体 json.dumps vs 静态段片段缓存后拼接"""
+    path = os.path.join(PROJECT_ROOT, 'config_template', 'config_template_groups_tun.json')
+    with open(path, 'rb') as f:
+        template = main.compile_template_source(f.read())
+    nodes = make_nodes(count)
+    ctx = main.GenerationContext({'auto_set_outbounds_dns': {'proxy': 'proxyDns', 'direct': 'localDns'}}, parsers={})
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        configs = [template.render({'A': nodes}, ctx) for _ in range(renders)]
+
+    def old_dump():
+        return [json.dumps(config, indent=2, ensure_ascii=False).encode('utf-8') for config in configs]
+
+    def new_dump():
+        return [main.dump_config(config) for config in configs]
+
+    old_bodies, old_cost = timed(old_dump)
+    new_bodies, new_cost = timed(new_dump)
+    assert old_bodies == new_bodies
+    report(f'配置输出 {renders} 次 / {count} 节点', old_cost, new_cost)
+
+
+def bench_serializer(count=20000):
+    """20k 出站配置的序列化与写文件：整体 json.dumps + 写入 vs 各后端分段写入（格式化 / 紧凑）"""
+    import tempfile
+    import config_writer
+    path = os.path.join(PROJECT_ROOT, 'config_template', 'config_template_groups_tun.json')
+    with open(path, 'rb') as f:
+        template = main.compile_template_source(f.read())
+    ctx = main.GenerationContext({'auto_set_outbounds_dns': {'proxy': 'proxyDns', 'direct': 'localDns'}}, parsers={})
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        config = template.render({'A': make_nodes(count)}, ctx)
+
+    def old_write(target):
+        with open(target, 'w', encoding='utf-8') as f:
+            f.write(json.dumps(config, indent=2, ensure_ascii=False))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        old_target = os.path.join(tmp, 'old.json')
+        _, old_cost = timed(old_write, old_target)
+        with open(old_target, 'rb') as f:
+            expected = f.read()
+        backend = config_writer.get_backend()
+        try:
+            for name in config_writer.BACKENDS:
+                config_writer.set_backend(name)
+                for pretty in (True, False):
+                    target = os.path.join(tmp, f'{name}-{pretty}.json')
+                    _, new_cost = timed(main.write_config, target, config, pretty)
+                    size = os.path.getsize(target)
+                    if pretty:
+                        with open(target, 'rb') as f:
+                            assert f.read() == expected
+                    mode = '格式化' if pretty else '紧凑'
+                    report(f'写出 {count} 出站配置 [{name}/{mode} {size // 1024} KB]', old_cost, new_cost)
+        finally:
+            config_writer.set_backend(backend)
+
+
+def main_bench():
+    bench_subscribe_transform()
+    bench_keyword_filter()
+    bench_combin_to_config()
+    bench_compiled_render()
+    bench_dump_config()
+    bench_serializer()
+
+
+if __name__ == "__main__":
+    main_bench()
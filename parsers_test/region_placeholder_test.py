@@ -0,0 +1,75 @@
+# region_placeholder_test.py
+# 验证 {region:XX} 占位符：按地区索引展开节点，支持旗帜 emoji 与两位代码（不区分大小写）
+
+import os, sys
+
+# 计算项目根目录：.../项目根/parsers_test/region_placeholder_test.py → .../项目根
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_ROOT not in sys.path:
+    sys.path.append(PROJECT_ROOT)
+
+import contextlib
+import io
+
+import main
+import tool
+
+
+def make_data():
+    return {
+        'A': [
+            {'tag': '🇭🇰 01', 'type': 'trojan'},
+            {'tag': 'HK IPLC 02', 'type': 'trojan'},
+            {'tag': '日本 01', 'type': 'trojan'},
+            {'tag': 'JP 02', 'type': 'trojan'},
+        ],
+        'B': [
+            {'tag': '香港 03', 'type': 'trojan'},
+            {'tag': '🇯🇵 Tokyo', 'type': 'trojan'},
+            {'tag': 'Unknown', 'type': 'trojan'},
+        ],
+    }
+
+
+def render(outbounds):
+    template = {'outbounds': outbounds + [{'tag': 'direct', 'type': 'direct'}], 'route': {'rules': []}}
+    with contextlib.redirect_stdout(io.StringIO()):
+        config = main.CompiledTemplate(template).render(make_data())
+    return {outbound['tag']: outbound for outbound in config['outbounds']}
+
+
+def test_region_code():
+    assert main.region_code('HK') == 'HK'
+    assert main.region_code(' hk ') == 'HK'
+    assert main.region_code('Jp') == 'JP'
+    assert main.region_code('🇭🇰') == 'HK'
+    assert tool.flag_to_code('🇯🇵') == 'JP'
+
+
+def test_build_region_index():
+    index = main.build_region_index(make_data())
+    assert [node['tag'] for node in index['HK']] == ['🇭🇰 01', 'HK IPLC 02', '香港 03']
+    assert [node['tag'] for node in index['JP']] == ['日本 01', 'JP 02', '🇯🇵 Tokyo']
+    assert not any(node['tag'] == 'Unknown' for nodes in index.values() for node in nodes)
+
+
+def test_region_placeholders():
+    outbounds = render([
+        {'tag': 'HK', 'type': 'selector', 'outbounds': ['{region:HK}']},
+        {'tag': 'hk-lower', 'type': 'selector', 'outbounds': ['{region:hk}']},
+        {'tag': 'hk-flag', 'type': 'selector', 'outbounds': ['{region:🇭🇰}']},
+        {'tag': 'JP-IPLC-free', 'type': 'urltest', 'outbounds': ['{region:jp}'],
+         'filter': [{'action': 'exclude', 'keywords': ['Tokyo']}]},
+        {'tag': 'Asia', 'type': 'selector', 'outbounds': ['{region:HK}', '{region:🇯🇵}']},
+        {'tag': 'Nowhere', 'type': 'selector', 'outbounds': ['{region:ZZ}']},
+    ])
+    hk = ['🇭🇰 01', 'HK IPLC 02', '香港 03']
+    assert outbounds['HK']['outbounds'] == hk
+    assert outbounds['hk-lower']['outbounds'] == hk
+    assert outbounds['hk-flag']['outbounds'] == hk
+    # 出站自身的 filter 仍然生效
+    assert outbounds['JP-IPLC-free']['outbounds'] == ['日本 01', 'JP 02']
+    assert 'filter' not in outbounds['JP-IPLC-free']
+    assert outbounds['Asia']['outbounds'] == hk + ['日本 01', 'JP 02', '🇯🇵 Tokyo']
+    # 没有节点的地区降级为 direct
+    assert outbounds['Nowhere']['outbounds'] == ['direct']
@@ -0,0 +1,113 @@
+# rename_test.py
+# 用来验证 tool.rename 关键字预筛选后的结果与逐个正则匹配的旧实现完全一致，并输出提速倍数
+
+import os, sys
+
+# 计算项目根目录：.../项目根/parsers_test/rename_test.py → .../项目根
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_ROOT not in sys.path:
+    sys.path.append(PROJECT_ROOT)
+
+import random
+import re
+import time
+import tool
+
+
+def reference_rename(input_str):
+    """旧版 tool.rename：按 regex_patterns 顺序逐个 startswith + search"""
+    for country_code, pattern in tool.regex_patterns.items():
+        if input_str.startswith(country_code):
+            return country_code + ' ' + input_str[len(country_code):].strip()
+        if pattern.search(input_str):
+            if input_str.startswith('🇺🇲'):
+                return country_code + ' ' + input_str[len('🇺🇲'):].strip()
+            else:
+                return country_code + ' ' + input_str
+    return input_str
+
+
+def build_corpus(size=20000, seed=20240601):
+    """由各地区正则中的关键字拼接出大量节点名称（含旗帜前缀、序号、干扰词）"""
+    rnd = random.Random(seed)
+    words = []
+    for pattern in tool.regex_patterns.values():
+        for part in pattern.pattern.split('|'):
+            word = re.sub(r'\(\?<?[!=][^)]*\)|\(\\s\|-\)\??|\\d\*?|\\b|\\s|[()?*]', '', part)
+            if word:
+                words.append(word)
+    flags = list(tool.regex_patterns.keys()) + ['🇺🇲', '']
+    noise = ['', ' ', '-', '_', 'IPLC', 'BGP', 'RELAY', 'GIA', 'Premium', '专线', '| x2', 'W', 'Netflix']
+    corpus = []
+    for _ in range(size):
+        parts = [rnd.choice(flags) if rnd.random() < 0.3 else '']
+        for _ in range(rnd.randint(1, 3)):
+            parts.append(rnd.choice(words) if rnd.random() < 0.7 else rnd.choice(noise))
+            parts.append(rnd.choice(['', ' ', '-', ' ' + str(rnd.randint(1, 99)), str(rnd.randint(1, 9))]))
+        corpus.append(''.join(parts))
+    return corpus
+
+
+def test_rename_matches_reference():
+    tool._region_match.cache_clear()
+    for tag in build_corpus():
+        assert tool.rename(tag) == reference_rename(tag), tag
+
+
+def test_region_of():
+    assert tool.region_of('香港 01') == '🇭🇰'
+    assert tool.region_of('🇯🇵 Tokyo') == '🇯🇵'
+    assert tool.region_of('no region here') is None
+
+
+def test_duplicate_names_keep_detour_within_subscription():
+    """重名节点改名后，detour 只指向同一订阅内对应的节点"""
+    nodes = {
+        'sub1': [{'tag': 'X'}, {'tag': 'ss-a', 'detour': 'X'}, {'tag': 'ss-b', 'detour': 'X'}],
+        'sub2': [{'tag': 'X'}, {'tag': 'ss-c', 'detour': 'X'}, {'tag': 'ss-d', 'detour': 'Y'}],
+    }
+    tool.proDuplicateNodeName(nodes)
+    assert [node['tag'] for node in nodes['sub1']] == ['X', 'ss-a', 'ss-b']
+    assert [node['tag'] for node in nodes['sub2']] == ['X2', 'ss-c', 'ss-d']
+    assert nodes['sub1'][1]['detour'] == 'X'
+    assert nodes['sub1'][2]['detour'] == 'X'
+    assert nodes['sub2'][1]['detour'] == 'X2'
+    # 本订阅中没有的名称保留原值
+    assert nodes['sub2'][2]['detour'] == 'Y'
+
+
+def test_duplicate_names_pair_detours_in_order():
+    """同一订阅中重复出现的 ss + shadowtls 对：第 k 个 detour 指向第 k 个同名节点"""
+    nodes = {'sub': [
+        {'tag': 'stls'}, {'tag': 'HK', 'detour': 'stls'},
+        {'tag': 'stls'}, {'tag': 'HK', 'detour': 'stls'},
+    ]}
+    tool.proDuplicateNodeName(nodes)
+    assert [node['tag'] for node in nodes['sub']] == ['stls', 'HK', 'stls2', 'HK2']
+    assert nodes['sub'][1]['detour'] == 'stls'
+    assert nodes['sub'][3]['detour'] == 'stls2'
+
+
+def main():
+    test_rename_matches_reference()
+    test_region_of()
+    print('rename 结果与旧实现一致')
+
+    corpus = build_corpus(size=10000)
+    start = time.perf_counter()
+    for tag in corpus:
+        reference_rename(tag)
+    reference_cost = time.perf_counter() - start
+
+    tool._region_match.cache_clear()
+    start = time.perf_counter()
+    for tag in corpus:
+        tool.rename(tag)
+    compiled_cost = time.perf_counter() - start
+
+    print(f'旧实现: {reference_cost:.3f}s  预筛选(冷缓存): {compiled_cost:.3f}s  '
+          f'提速 {reference_cost / compiled_cost:.1f}x')
+
+
+if __name__ == "__main__":
+    main()
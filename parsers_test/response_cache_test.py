@@ -0,0 +1,168 @@
+# response_cache_test.py
+# 验证 response_cache：ETag 匹配、TTL / stale-while-revalidate、同一 key 只生成一次，以及 304 响应
+
+import os, sys
+
+# 计算项目根目录：.../项目根/parsers_test/response_cache_test.py → .../项目根
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_ROOT not in sys.path:
+    sys.path.append(PROJECT_ROOT)
+
+import io
+import json
+import threading
+import time
+
+from response_cache import ResponseCache, etag_matches, make_etag
+
+
+class Counter:
+    """按调用次数生成不同响应体的 generate 函数"""
+
+    def __init__(self, delay=0.0):
+        self.calls = 0
+        self.delay = delay
+        self.lock = threading.Lock()
+
+    def __call__(self):
+        time.sleep(self.delay)
+        with self.lock:
+            self.calls += 1
+            return f'body-{self.calls}'.encode()
+
+
+def age(cache, key, seconds):
+    """把缓存项的创建时间往前推 seconds 秒"""
+    cache._entries[key].created -= seconds
+
+
+def wait_until(predicate, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, '等待超时'
+        time.sleep(0.005)
+
+
+def test_etag_matches():
+    etag = make_etag(b'config')
+    assert etag.startswith('"') and etag.endswith('"')
+    assert etag_matches(etag, etag)
+    assert etag_matches('W/' + etag, etag)
+    assert etag_matches('"other", ' + etag, etag)
+    assert etag_matches('"other", W/' + etag, etag)
+    assert etag_matches('*', etag)
+    assert not etag_matches('"other"', etag)
+    assert not etag_matches(None, etag)
+    assert not etag_matches('', etag)
+
+
+def test_fresh_hit_and_expiry():
+    cache = ResponseCache(ttl=60, stale=30)
+    generate = Counter()
+    entry, state = cache.get('k', generate)
+    assert (entry.body, state) == (b'body-1', 'miss')
+    entry, state = cache.get('k', generate)
+    assert (entry.body, state) == (b'body-1', 'hit')
+    assert generate.calls == 1
+
+    # 超过 ttl + stale：同步重新生成
+    age(cache, 'k', 91)
+    entry, state = cache.get('k', generate)
+    assert (entry.body, state) == (b'body-2', 'miss')
+
+
+def test_stale_while_revalidate():
+    cache = ResponseCache(ttl=60, stale=30)
+    generate = Counter()
+    cache.get('k', generate)
+    age(cache, 'k', 61)
+
+    entry, state = cache.get('k', generate)
+    # 先返回旧内容，后台刷新
+    assert (entry.body, state) == (b'body-1', 'stale')
+    wait_until(lambda: cache.lookup('k')[1] == 'fresh')
+    entry, state = cache.get('k', generate)
+    assert (entry.body, state) == (b'body-2', 'hit')
+    assert generate.calls == 2
+
+
+def test_stale_refresh_failure_keeps_old_entry():
+    cache = ResponseCache(ttl=60, stale=30)
+    cache.get('k', Counter())
+    age(cache, 'k', 61)
+    done = threading.Event()
+
+    def failing():
+        done.set()
+        raise RuntimeError('airport down')
+
+    entry, state = cache.get('k', failing)
+    assert (entry.body, state) == (b'body-1', 'stale')
+    done.wait(2)
+    wait_until(lambda: 'k' not in cache._inflight)
+    assert cache.lookup('k')[0].body == b'body-1'
+
+
+def test_single_flight():
+    cache = ResponseCache(ttl=60, stale=0)
+    generate = Counter(delay=0.1)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get('k', generate)[0].body)) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+    assert results == [b'body-1'] * 8
+    assert generate.calls == 1
+
+
+def test_disabled_cache_bypasses():
+    cache = ResponseCache(ttl=0, stale=0)
+    generate = Counter()
+    assert cache.get('k', generate)[1] == 'bypass'
+    assert cache.get('k', generate)[0].body == b'body-2'
+    assert cache.cache_control() == 'private, no-cache'
+
+
+def make_handler(if_none_match=None):
+    from api.generate import handler
+    h = handler.__new__(handler)
+    h.headers = {'If-None-Match': if_none_match} if if_none_match else {}
+    h.wfile = io.BytesIO()
+    h.request_version = 'HTTP/1.1'
+    h.requestline = 'GET /api/generate HTTP/1.1'
+    h.command = 'GET'
+    h.log_message = lambda *args: None
+    return h
+
+
+def test_not_modified_response():
+    cache = ResponseCache(ttl=60, stale=30)
+    entry, _ = cache.get('k', Counter())
+
+    h = make_handler()
+    h._send_cached(entry, 'miss')
+    response = h.wfile.getvalue()
+    assert response.split(b' ', 2)[1] == b'200'
+    assert f'ETag: {entry.etag}'.encode() in response
+    assert response.endswith(b'\r\n\r\nbody-1')
+
+    h = make_handler('W/' + entry.etag)
+    h._send_cached(entry, 'hit')
+    response = h.wfile.getvalue()
+    assert response.split(b' ', 2)[1] == b'304'
+    assert b'Content-Length' not in response
+    assert response.endswith(b'\r\n\r\n')
+
+
+def test_send_json_streams_body():
+    h = make_handler()
+    h._send_json(200, {'outbounds': [{'tag': f'node {i}'} for i in range(3)]}, pretty=False)
+    response = h.wfile.getvalue()
+    head, body = response.split(b'\r\n\r\n', 1)
+    assert head.split(b' ', 2)[1] == b'200'
+    # 边序列化边写出：不带 Content-Length，由关闭连接标记响应结束
+    assert b'Content-Length' not in head
+    assert b'Connection: close' in head
+    assert h.close_connection
+    assert json.loads(body) == {'outbounds': [{'tag': 'node 0'}, {'tag': 'node 1'}, {'tag': 'node 2'}]}
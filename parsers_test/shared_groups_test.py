@@ -0,0 +1,124 @@
+# shared_groups_test.py
+# 验证模板 shared_groups 模式：多次展开的分组只生成一个共享出站，其余出站改为引用它
+
+import os, sys
+
+# 计算项目根目录：.../项目根/parsers_test/shared_groups_test.py → .../项目根
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_ROOT not in sys.path:
+    sys.path.append(PROJECT_ROOT)
+
+import contextlib
+import copy
+import io
+
+import main
+
+
+def make_data():
+    return {
+        'A': [{'tag': 'HK 01', 'type': 'trojan'}, {'tag': 'JP 01', 'type': 'trojan'}],
+        'B': [{'tag': 'US 01', 'type': 'trojan'}],
+        'C': [{'tag': 'SG 01', 'type': 'trojan'}],
+    }
+
+
+def make_template(shared_groups):
+    return {
+        'shared_groups': shared_groups,
+        'outbounds': [
+            {'tag': 'Proxy', 'type': 'selector', 'outbounds': ['auto', '{all}']},
+            {'tag': 'auto', 'type': 'urltest', 'outbounds': ['{all}']},
+            {'tag': 'A-only', 'type': 'selector', 'outbounds': ['{A}']},
+            {'tag': 'HK', 'type': 'selector', 'outbounds': ['{all}'],
+             'filter': [{'action': 'include', 'keywords': ['HK']}]},
+            {'tag': 'direct', 'type': 'direct'},
+        ],
+        'route': {'rules': []},
+    }
+
+
+def render(template):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return main.CompiledTemplate(template).render(make_data())
+
+
+def outbound_map(config):
+    return {outbound['tag']: outbound for outbound in config['outbounds']}
+
+
+def test_shared_groups_disabled_expands_tags():
+    config = render(make_template(False))
+    outbounds = outbound_map(config)
+    assert 'shared_groups' not in config
+    assert outbounds['Proxy']['outbounds'] == ['auto', 'HK 01', 'JP 01', 'US 01', 'SG 01']
+    assert outbounds['auto']['outbounds'] == ['HK 01', 'JP 01', 'US 01', 'SG 01']
+    assert not any(tag.endswith('-nodes') for tag in outbounds)
+
+
+def test_shared_groups_reference_shared_outbounds():
+    template = make_template(True)
+    snapshot = copy.deepcopy(template)
+    config = render(template)
+    outbounds = outbound_map(config)
+
+    assert 'shared_groups' not in config
+    # 每个分组被 {all} 引用两次以上，只生成一个共享 urltest 出站
+    assert outbounds['Proxy']['outbounds'] == ['auto', 'A-nodes', 'B-nodes', 'C-nodes']
+    assert outbounds['auto']['outbounds'] == ['A-nodes', 'B-nodes', 'C-nodes']
+    assert outbounds['A-only']['outbounds'] == ['A-nodes']
+    assert outbounds['A-nodes'] == {'tag': 'A-nodes', 'type': 'urltest', 'outbounds': ['HK 01', 'JP 01']}
+    assert outbounds['B-nodes']['outbounds'] == ['US 01']
+    # 带 filter 的出站不使用共享分组，仍直接展开
+    assert outbounds['HK']['outbounds'] == ['HK 01']
+    # 共享出站位于模板出站之后、节点之前
+    tags = [outbound['tag'] for outbound in config['outbounds']]
+    assert tags == ['Proxy', 'auto', 'A-only', 'HK', 'direct', 'A-nodes', 'B-nodes', 'C-nodes',
+                    'HK 01', 'JP 01', 'US 01', 'SG 01']
+    # 模板本身不变
+    assert template == snapshot
+
+
+def test_shared_groups_options_and_single_reference():
+    template = make_template({'type': 'selector', 'tag': '{group} pool', 'interrupt_exist_connections': True})
+    # 只剩一个 {all}：只有被 {A} 再次引用的分组 A 值得共享
+    template['outbounds'][1]['outbounds'] = ['direct']
+    config = render(template)
+    outbounds = outbound_map(config)
+    assert outbounds['Proxy']['outbounds'] == ['auto', 'A pool', 'US 01', 'SG 01']
+    assert outbounds['A-only']['outbounds'] == ['A pool']
+    assert outbounds['A pool'] == {
+        'interrupt_exist_connections': True, 'tag': 'A pool', 'type': 'selector', 'outbounds': ['HK 01', 'JP 01'],
+    }
+    assert 'B pool' not in outbounds and 'C pool' not in outbounds
+
+
+def test_shared_groups_tag_collision_falls_back_to_expansion():
+    template = make_template(True)
+    # 模板出站占用了 A 分组的共享 tag
+    template['outbounds'].insert(4, {'tag': 'A-nodes', 'type': 'selector', 'outbounds': ['direct']})
+    data = make_data()
+    # 节点占用了 B 分组的共享 tag
+    data['B'].append({'tag': 'B-nodes', 'type': 'trojan'})
+    with contextlib.redirect_stdout(io.StringIO()):
+        config = main.CompiledTemplate(template).render(data)
+    outbounds = outbound_map(config)
+
+    tags = [outbound['tag'] for outbound in config['outbounds']]
+    assert len(tags) == len(set(tags))
+    # 重名的分组改为直接展开节点，其余分组照常共享
+    assert outbounds['auto']['outbounds'] == ['HK 01', 'JP 01', 'US 01', 'B-nodes', 'C-nodes']
+    assert outbounds['A-only']['outbounds'] == ['HK 01', 'JP 01']
+    assert outbounds['A-nodes'] == {'tag': 'A-nodes', 'type': 'selector', 'outbounds': ['direct']}
+    assert outbounds['B-nodes'] == {'tag': 'B-nodes', 'type': 'trojan'}
+    assert outbounds['C-nodes']['outbounds'] == ['SG 01']
+
+
+def test_shared_groups_fixed_tag_shared_once():
+    # tag 中没有 {group}：只有第一个分组能使用该 tag，其余分组直接展开
+    config = render(make_template({'tag': 'pool'}))
+    outbounds = outbound_map(config)
+    tags = [outbound['tag'] for outbound in config['outbounds']]
+    assert len(tags) == len(set(tags))
+    assert outbounds['auto']['outbounds'] == ['pool', 'US 01', 'SG 01']
+    assert outbounds['pool']['outbounds'] == ['HK 01', 'JP 01']
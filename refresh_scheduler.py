@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+"""
+后台刷新调度器：预先拉取订阅、预先渲染各 profile 的配置。
+
+请求到来时不再同步执行 拉取 → 解析 → 合并，而是直接返回最近一次渲染好的配置。
+    - 每个订阅按自己的间隔刷新（订阅项中的 refresh_interval 秒，缺省为 interval）；
+      同一订阅（url + User-Agent + exclude_protocol 相同）被多个 profile 使用时只拉取一次
+    - 订阅节点、模板版本或 profile 配置有变化时才重新渲染该 profile
+    - 拉取失败时继续使用上一次的节点
+    - 渲染结果保存在内存中，指定 output_dir 时同时写入 output_dir/<profile>.json（内容未变化时不写）
+
+generate_server.py --refresh 在自托管服务中启用；也可单独运行，只把配置写入目录：
+    python refresh_scheduler.py --output-dir ./profiles --interval 1800
+"""
+import argparse
+import json
+import os
+import threading
+import time
+
+import main
+from config_writer import content_changed, dump_config, write_atomic
+from response_cache import CacheEntry, hash_key, template_version
+
+
+def load_profiles(profile_env_map=None):
+    """
+    从环境变量读取各 profile 的 providers 配置，未设置或不是合法 JSON 的 profile 会被跳过。
+
+    参数：
+        profile_env_map: dict[str, str] | None
+            profile -> 环境变量名，默认使用 api/generate.py 中的 PROFILE_ENV_MAP。
+
+    返回：
+        dict[str, dict]: { profile: providers }
+    """
+    if profile_env_map is None:
+        from api.generate import PROFILE_ENV_MAP
+        profile_env_map = PROFILE_ENV_MAP
+    profiles = {}
+    for profile, env_key in profile_env_map.items():
+        raw = os.environ.get(env_key, '').strip()
+        if not raw:
+            continue
+        try:
+            profiles[profile] = json.loads(raw)
+        except ValueError as e:
+            print(f"[WARN] 环境变量 {env_key} 不是合法的 JSON，跳过 profile {profile}: {e}")
+    return profiles
+
+
+class RenderedProfile:
+    """
+    预渲染的 profile 配置。
+
+    属性：
+        entry: CacheEntry
+            序列化后的配置与 ETag。
+        pretty: bool
+            是否为格式化 JSON。
+        rendered_at: float
+            渲染时间（time.time()）。
+        data_time: float
+            所用订阅数据中最早一次拉取的时间（time.time()）。
+        input_key: str
+            订阅节点 + 模板版本 + profile 配置的哈希，不变时跳过渲染。
+    """
+
+    __slots__ = ('entry', 'pretty', 'rendered_at', 'data_time', 'input_key')
+
+    def __init__(self, entry, pretty, rendered_at, data_time, input_key):
+        self.entry = entry
+        self.pretty = pretty
+        self.rendered_at = rendered_at
+        self.data_time = data_time
+        self.input_key = input_key
+
+    def data_age(self):
+        """订阅数据距今的秒数。"""
+        return max(0.0, time.time() - self.data_time)
+
+
+class RefreshScheduler:
+    """
+    参数：
+        profiles: dict[str, dict] | None
+            profile -> providers，默认由 load_profiles() 从环境变量读取。
+        interval: float | None
+            订阅的默认刷新间隔（秒），默认读取环境变量 REFRESH_INTERVAL（缺省 1800）。
+        tick: float | None
+            检查是否有订阅到期的间隔（秒），默认为 min(60, interval)。
+        output_dir: str | None
+            渲染结果同时写入的目录。
+    """
+
+    def __init__(self, profiles=None, interval=None, tick=None, output_dir=None):
+        if interval is None:
+            interval = float(os.environ.get('REFRESH_INTERVAL', '1800'))
+        self.profiles = load_profiles() if profiles is None else profiles
+        self.interval = interval
+        self.tick = tick if tick is not None else min(60.0, interval)
+        self.output_dir = output_dir
+        # (url, User-Agent, exclude_protocol) -> (节点列表, 拉取时间, 节点哈希)
+        self._fetched = {}
+        self._rendered = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def get(self, profile):
+        """返回 profile 最近一次渲染的结果（RenderedProfile），尚未渲染时返回 None。"""
+        with self._lock:
+            return self._rendered.get(profile)
+
+    def refresh_subscriptions(self, providers):
+        """
+        拉取 providers 中到期的订阅，返回 { url: (节点列表, 拉取时间, 节点哈希) }。
+        拉取失败时沿用上一次的结果；从未成功时节点列表为空。
+        """
+        ctx = main.GenerationContext(providers)
+        result = {}
+        for subscribe in main.active_subscribes(ctx.get('subscribes') or []):
+            url = subscribe['url']
+            key = ctx.subscription_key(url)
+            interval = float(subscribe.get('refresh_interval') or self.interval)
+            cached = self._fetched.get(key)
+            now = time.time()
+            if cached is None or now - cached[1] >= interval:
+                try:
+                    nodes = main.get_nodes(url, ctx)
+                except Exception as e:
+                    print(f"[WARN] 刷新订阅失败: {e}")
+                    nodes = []
+                if nodes:
+                    cached = self._fetched[key] = (nodes, now, hash_key(nodes))
+                elif cached is not None:
+                    print(f"[WARN] 订阅没有拉取到节点，继续使用 {int(now - cached[1])} 秒前的结果")
+            result[url] = cached if cached is not None else ([], now, '')
+        return result
+
+    def refresh_profile(self, profile, providers):
+        """
+        刷新 profile 用到的订阅，输入有变化时重新渲染。
+
+        返回：
+            bool: 是否重新渲染。
+        """
+        fetched = self.refresh_subscriptions(providers)
+        pretty = not main.is_compact_output(providers)
+        input_key = hash_key(
+            providers, template_version(providers.get('config_template')),
+            {url: item[2] for url, item in fetched.items()}, pretty,
+        )
+        data_time = min((item[1] for item in fetched.values()), default=time.time())
+
+        current = self.get(profile)
+        if current is not None and current.input_key == input_key:
+            # 内容未变化，只更新数据时间
+            current.data_time = data_time
+            return False
+
+        final_config = main.generate_config_from_providers(
+            providers, fetched={url: item[0] for url, item in fetched.items()}
+        )
+        rendered = RenderedProfile(CacheEntry(dump_config(final_config, pretty)), pretty,
+                                   time.time(), data_time, input_key)
+        with self._lock:
+            self._rendered[profile] = rendered
+        if self.output_dir:
+            path = os.path.join(self.output_dir, profile + '.json')
+            if content_changed(path, rendered.entry.body):
+                write_atomic(path, rendered.entry.body)
+        print(f"已重新渲染 profile: {profile}")
+        return True
+
+    def run_once(self):
+        """
+        刷新所有 profile，返回重新渲染的 profile 列表；单个 profile 失败不影响其他 profile。
+        """
+        refreshed = []
+        for profile, providers in self.profiles.items():
+            try:
+                if self.refresh_profile(profile, providers):
+                    refreshed.append(profile)
+            except Exception as e:
+                print(f"[WARN] 刷新 profile {profile} 失败，继续使用上一次的配置: {e}")
+        return refreshed
+
+    def run_forever(self):
+        while not self._stop.is_set():
+            self.run_once()
+            self._stop.wait(self.tick)
+
+    def start(self):
+        """在后台守护线程中运行调度器。"""
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self.run_forever, name='refresh-scheduler', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description='后台刷新订阅并预渲染各 profile 配置')
+    parser.add_argument('--output-dir', required=True, help='渲染结果写入的目录（<profile>.json）')
+    parser.add_argument('--interval', type=float, default=None, help='订阅默认刷新间隔秒数（默认 REFRESH_INTERVAL 或 1800）')
+    parser.add_argument('--once', action='store_true', help='只刷新一次后退出')
+    args = parser.parse_args()
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    scheduler = RefreshScheduler(interval=args.interval, output_dir=args.output_dir)
+    if not scheduler.profiles:
+        print('没有找到任何 profile 配置（SUB_CONFIG / SUB_CONFIG_MAC / ...）')
+        return
+    if args.once:
+        scheduler.run_once()
+        return
+    try:
+        scheduler.run_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main_cli()
@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+"""
+生成结果的响应缓存（/api/generate 与 Flask /config 共用）。
+
+客户端和路由器每隔几分钟轮询一次订阅地址，每次都会重新拉取所有机场订阅并重新渲染。
+ResponseCache 按 (profile, providers JSON 的哈希, 模板版本, 输出格式) 缓存序列化后的响应体：
+    - 缓存时间 < ttl：直接返回缓存（fresh）
+    - ttl <= 缓存时间 < ttl + stale：先返回旧内容，同时在后台重新生成（stale-while-revalidate）
+    - 更久或不存在：同步生成；同一 key 的并发请求只生成一次，其余请求等待同一结果
+
+响应带内容哈希 ETag；If-None-Match 命中缓存中的 ETag 时直接返回 304，不做任何生成工作。
+ttl / stale 默认读取环境变量 RESPONSE_CACHE_TTL（秒，缺省 300）/ RESPONSE_CACHE_STALE（秒，缺省 600），
+RESPONSE_CACHE_TTL=0 关闭缓存（仍会返回 ETag，内容未变化时返回 304）。
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+
+def make_etag(body):
+    """
+    返回响应体的强 ETag（SHA-256 前 32 位十六进制，带引号）。
+    """
+    return '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+
+
+def etag_matches(if_none_match, etag):
+    """
+    判断请求头 If-None-Match 是否与 etag 匹配（支持 *、逗号分隔的多个值与弱校验 W/ 前缀）。
+    """
+    if not if_none_match or not etag:
+        return False
+    for candidate in if_none_match.split(','):
+        candidate = candidate.strip()
+        if candidate == '*':
+            return True
+        if candidate.startswith('W/'):
+            candidate = candidate[2:]
+        if candidate == etag:
+            return True
+    return False
+
+
+def hash_key(*parts):
+    """
+    将若干可 JSON 序列化的部分规范化后计算 SHA-256，作为缓存 key。
+    """
+    text = json.dumps(parts, sort_keys=True, ensure_ascii=False, separators=(',', ':'))
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def template_version(config_template):
+    """
+    返回模板版本标识：本地模板为 路径:mtime:大小，远程模板与空值原样返回
+    （远程模板内容变化依靠 ttl 过期后重新生成）。
+    """
+    path = (config_template or '').strip()
+    if not path or path.startswith(('http://', 'https://')):
+        return path
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return path
+    return f"{path}:{stat.st_mtime_ns}:{stat.st_size}"
+
+
+class CacheEntry:
+    """缓存的响应：body 为序列化后的响应体（bytes），etag 为其内容哈希"""
+
+    __slots__ = ('body', 'etag', 'created')
+
+    def __init__(self, body):
+        self.body = body
+        self.etag = make_etag(body)
+        self.created = time.monotonic()
+
+    def age(self):
+        return time.monotonic() - self.created
+
+
+class ResponseCache:
+    """
+    带 TTL 与 stale-while-revalidate 的进程内响应缓存（LRU，线程安全）。
+
+    参数：
+        ttl: float | None
+            缓存新鲜期（秒），<= 0 表示不缓存。
+        stale: float | None
+            过了新鲜期后仍可先返回旧内容、同时后台刷新的时长（秒）。
+        max_entries: int
+            最多缓存的响应个数。
+    """
+
+    def __init__(self, ttl=None, stale=None, max_entries=32):
+        if ttl is None:
+            ttl = float(os.environ.get('RESPONSE_CACHE_TTL', '300'))
+        if stale is None:
+            stale = float(os.environ.get('RESPONSE_CACHE_STALE', '600'))
+        self.ttl = ttl
+        self.stale = max(0, stale)
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._inflight = {}
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.ttl > 0
+
+    def cache_control(self):
+        """
+        返回 Cache-Control 响应头。配置中含订阅地址等私密信息，只允许客户端自身缓存。
+        """
+        if not self.enabled:
+            return 'private, no-cache'
+        value = f'private, max-age={int(self.ttl)}'
+        if self.stale:
+            value += f', stale-while-revalidate={int(self.stale)}'
+        return value
+
+    def lookup(self, key):
+        """
+        返回 (entry, state)：state 为 'fresh'、'stale'，缓存不存在或已过期时返回 (None, None)。
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None, None
+            age = entry.age()
+            if age < self.ttl:
+                self._entries.move_to_end(key)
+                return entry, 'fresh'
+            if age < self.ttl + self.stale:
+                return entry, 'stale'
+            del self._entries[key]
+            return None, None
+
+    def get(self, key, generate):
+        """
+        返回 (entry, state)。
+
+        参数：
+            key: str
+                缓存 key（见 hash_key）。
+            generate: Callable[[], bytes]
+                生成响应体的函数；生成失败时异常直接抛出，不会被缓存。
+
+        返回：
+            state 为 'hit'（新鲜缓存）、'stale'（旧内容，已触发后台刷新）、
+            'miss'（本次同步生成）或 'bypass'（缓存已关闭）。
+        """
+        if not self.enabled:
+            return CacheEntry(generate()), 'bypass'
+        entry, state = self.lookup(key)
+        if state == 'fresh':
+            return entry, 'hit'
+        if state == 'stale':
+            self.refresh_async(key, generate)
+            return entry, 'stale'
+        return self.refresh(key, generate), 'miss'
+
+    def refresh(self, key, generate):
+        """
+        生成并写入缓存；同一 key 已有生成在进行时，等待并返回它的结果。
+        """
+        with self._lock:
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner:
+                future = self._inflight[key] = Future()
+        if not owner:
+            return future.result()
+        try:
+            entry = self.put(key, generate())
+            future.set_result(entry)
+            return entry
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def put(self, key, body):
+        """
+        直接写入 key 的响应体（如启动预热时预先渲染的配置），返回 CacheEntry。
+        """
+        entry = CacheEntry(body)
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return entry
+
+    def refresh_async(self, key, generate):
+        """
+        在后台线程中刷新 key（已有刷新在进行时不重复启动）。刷新失败时保留旧内容。
+        """
+        with self._lock:
+            if key in self._inflight:
+                return
+
+        def run():
+            try:
+                self.refresh(key, generate)
+            except Exception as e:
+                print(f"[WARN] 后台刷新缓存失败，继续使用旧内容: {e}")
+
+        threading.Thread(target=run, name='cache-refresh', daemon=True).start()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
@@ -1,4 +1,9 @@
-import base64,requests,paramiko,random,string,re,chardet
+import base64,requests,paramiko,random,string,re,chardet,functools,threading,http.cookiejar
+import requests.adapters
+try:
+    import re._parser as _sre_parse, re._constants as _sre_constants
+except ImportError:
+    import sre_parse as _sre_parse, sre_constants as _sre_constants
 from paramiko import SSHClient
 from scp import SCPClient
 
@@ -155,16 +160,95 @@ regex_patterns = {
     '🇦🇶': re.compile(r'南极|南極|(\s|-)?AQ\d*|Antarctica'),
     '🇨🇳': re.compile(r'中国|中國|江苏|北京|上海|广州|深圳|杭州|徐州|青岛|宁波|镇江|沈阳|济南|回国|back|(\s|-)?CN(?!2GIA)\d*|China'),
 }
+def _required_literals(pattern):
+    """
+    提取正则每个分支中必然出现的最长连续字面量，作为预筛选关键字。
+    任一分支提取不到字面量（或解析失败）时返回 None，表示只能直接用正则判断。
+    """
+    if pattern.flags & re.IGNORECASE:
+        return None
+    try:
+        parsed = _sre_parse.parse(pattern.pattern, pattern.flags)
+    except Exception:
+        return None
+    items = list(parsed)
+    if len(items) == 1 and items[0][0] is _sre_constants.BRANCH:
+        branches = items[0][1][1]
+    else:
+        branches = [items]
+    literals = []
+    for branch in branches:
+        best = run = ''
+        for op, av in branch:
+            if op is _sre_constants.LITERAL:
+                run += chr(av)
+                if len(run) > len(best):
+                    best = run
+            elif op not in (_sre_constants.AT, _sre_constants.ASSERT, _sre_constants.ASSERT_NOT):
+                # 零宽断言不打断字面量，其余结构（可选组、重复等）都会打断
+                run = ''
+        if not best:
+            return None
+        literals.append(best)
+    return literals
+
+# 预筛选：关键字按首字符建索引，扫描一遍节点名称即可得到可能命中的地区，
+# 再按 regex_patterns 的顺序用原正则确认，保证与逐个 search 的优先级一致
+_region_codes = list(regex_patterns.keys())
+_region_regexes = list(regex_patterns.values())
+_region_prefix_index = {code: i for i, code in enumerate(_region_codes)}
+_region_prefix_lengths = sorted({len(code) for code in _region_codes})
+_region_always = []
+_region_anchor_index = {}
+for _i, _pattern in enumerate(_region_regexes):
+    _literals = _required_literals(_pattern)
+    if _literals is None:
+        _region_always.append(_i)
+        continue
+    for _literal in set(_literals):
+        _region_anchor_index.setdefault(_literal[0], []).append((_literal, _i))
+
+@functools.lru_cache(maxsize=65536)
+def _region_match(input_str):
+    best = None
+    for length in _region_prefix_lengths:
+        i = _region_prefix_index.get(input_str[:length])
+        if i is not None and (best is None or i < best):
+            best = i
+    prefix_hit = best
+    candidates = set(_region_always)
+    for pos, char in enumerate(input_str):
+        for literal, i in _region_anchor_index.get(char, ()):
+            if (best is None or i < best) and input_str.startswith(literal, pos):
+                candidates.add(i)
+    for i in sorted(candidates):
+        if best is not None and i >= best:
+            break
+        if _region_regexes[i].search(input_str):
+            best = i
+            break
+    if best is None:
+        return None, False
+    # 同一序号下 startswith 判断先于正则匹配
+    return best, best == prefix_hit
+
+def region_of(input_str):
+    i, _ = _region_match(input_str)
+    return _region_codes[i] if i is not None else None
+
+def flag_to_code(flag):
+    return ''.join(chr(ord(c) - 0x1F1E6 + ord('A')) for c in flag)
+
 def rename(input_str):
-    for country_code, pattern in regex_patterns.items():
-        if input_str.startswith(country_code):
-            return country_code + ' ' + input_str[len(country_code):].strip()
-        if pattern.search(input_str):
-            if input_str.startswith('🇺🇲'):
-                return country_code + ' ' + input_str[len('🇺🇲'):].strip()
-            else:
-                return country_code + ' ' + input_str
-    return input_str
+    i, by_prefix = _region_match(input_str)
+    if i is None:
+        return input_str
+    country_code = _region_codes[i]
+    if by_prefix:
+        return country_code + ' ' + input_str[len(country_code):].strip()
+    if input_str.startswith('🇺🇲'):
+        return country_code + ' ' + input_str[len('🇺🇲'):].strip()
+    return country_code + ' ' + input_str
 
 def urlDecode(str):
     str = str.strip()
@@ -253,16 +337,34 @@ def replaceStr(nodelist,keywords):
     return nodelist
 
 def proDuplicateNodeName(nodes):
-    names = []
+    names = set()
+    # 每个原始名称下一次尝试的序号，已占用的 s+index 不会再释放，可直接续接
+    next_index = {}
     for key in nodes.keys():
         nodelist = nodes[key]
+        # 本订阅内 原始名称 -> 按出现顺序重命名后的名称列表，用于同步 detour
+        renamed = {}
         for node in nodelist:
-            index = 2
             s = node['tag']
-            while node['tag'] in names:
+            if s in names:
+                index = next_index.get(s, 2)
+                while s+str(index) in names:
+                    index += 1
                 node['tag'] = s+str(index)
-                index += 1
-            names.append(node['tag'])
+                next_index[s] = index+1
+            names.add(node['tag'])
+            renamed.setdefault(s, []).append(node['tag'])
+        # detour 只在同一订阅内解析：第 k 个引用某名称的 detour 对应本订阅第 k 个该名称的节点
+        # （如 ss + shadowtls 成对出现），本订阅没有该名称时保留原值
+        detour_count = {}
+        for node in nodelist:
+            detour = node.get('detour')
+            if not detour or detour not in renamed:
+                continue
+            targets = renamed[detour]
+            k = detour_count.get(detour, 0)
+            node['detour'] = targets[min(k, len(targets)-1)]
+            detour_count[detour] = k+1
 
 def removeNodes(nodelist):
     newlist = []
@@ -286,6 +388,22 @@ def prefixStr(nodelist,prestr):
         node['name'] = prestr+node['name'].strip()
     return nodelist
 
+# 进程内共享的 HTTP 连接池（长驻服务中多次请求同一机场时复用连接）；不保存 cookie，避免不同请求之间互相影响
+_session = None
+_session_lock = threading.Lock()
+
+def get_session():
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            session.cookies.set_policy(http.cookiejar.DefaultCookiePolicy(allowed_domains=[]))
+            adapter = requests.adapters.HTTPAdapter(pool_connections=32, pool_maxsize=32)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            _session = session
+        return _session
+
 def getResponse(url, custom_user_agent=None):
     response = None
     headers = {
@@ -293,7 +411,7 @@ def getResponse(url, custom_user_agent=None):
         #'User-Agent': 'clash.meta'
     }
     try:
-        response = requests.get(url,headers=headers,timeout=5000)
+        response = get_session().get(url,headers=headers,timeout=5000)
         if response.status_code==200:
             print(f"getResponse::::{response}")
             return response
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+启动预热：让冷启动后的第一个请求与稳定状态下的请求一样快。
+
+Vercel 冷实例或刚重启的自托管服务上，每个 profile 的第一个请求要承担
+模板下载与编译、协议解析模块导入、正则编译以及全部订阅拉取。warm_up 在进程启动时
+（或通过 /api/warmup）提前完成这些工作：
+    - 导入 parsers 目录下的全部协议解析模块（init_parsers）
+    - 加载并编译每个 profile 的模板（远程模板按内容缓存，本地模板按 mtime 缓存），
+      预先生成自动 DNS 段，编译出站 filter 与订阅的 ex-node-name 匹配器
+    - tool 中的地区正则与预筛选索引在导入 tool 时已编译完成，随 main 一起导入
+    - prefetch=True 时并行拉取各 profile 订阅的并集（相同订阅只拉取一次），并渲染各 profile
+      （main.generate_configs_for_profiles）
+
+单独运行时按环境变量 SUB_CONFIG / SUB_CONFIG_MAC / ... 预热并打印报告：
+    python warmup.py --prefetch
+"""
+import argparse
+import json
+import time
+
+import main
+
+
+def warm_template(ctx):
+    """
+    加载并编译 ctx 对应的模板，预先生成 dns 段并编译各出站的 filter。
+
+    返回：
+        CompiledTemplate | None: 未配置 config_template 时返回 None。
+    """
+    template = main.load_template(ctx)
+    if template is None:
+        return None
+    template.dns_section(ctx.get('auto_set_outbounds_dns'))
+    for _, _, filters, _ in template.slots.values():
+        if filters:
+            main.compile_filters(filters)
+    return template
+
+
+def warm_up(profiles, prefetch=False, workers=4):
+    """
+    预热各 profile。单个 profile 失败只记录在报告中，不影响其他 profile。
+
+    参数：
+        profiles: dict[str, dict]
+            profile -> providers（见 refresh_scheduler.load_profiles）。
+        prefetch: bool
+            是否并行拉取订阅并渲染各 profile。
+        workers: int
+            并行拉取订阅的线程数。
+
+    返回：
+        tuple[dict, dict[str, dict]]:
+            (报告, { profile: 渲染后的配置 })；prefetch=False 时配置为空。
+            报告中包含各 profile 的模板、耗时（秒）与错误信息。
+    """
+    start = time.monotonic()
+    parsers = main.init_parsers()
+    report = {'parsers': len(parsers), 'prefetch': prefetch, 'profiles': {}}
+
+    for profile, providers in profiles.items():
+        item = report['profiles'][profile] = {}
+        begin = time.monotonic()
+        try:
+            ctx = main.GenerationContext(providers, parsers)
+            template = warm_template(ctx)
+            for subscribe in main.active_subscribes(ctx.get('subscribes') or []):
+                main.compile_subscribe_transform(subscribe)
+            item['template'] = ctx.get('config_template') if template is not None else None
+        except Exception as e:
+            item['error'] = str(e)
+        item['template_time'] = round(time.monotonic() - begin, 3)
+
+    configs = {}
+    if prefetch:
+        names = [profile for profile in profiles if 'error' not in report['profiles'][profile]]
+        begin = time.monotonic()
+        configs, errors = main.generate_configs_for_profiles({name: profiles[name] for name in names},
+                                                             parsers, workers)
+        report['render_time'] = round(time.monotonic() - begin, 3)
+        for profile, error in errors.items():
+            report['profiles'][profile]['error'] = str(error)
+
+    report['time'] = round(time.monotonic() - start, 3)
+    return report, configs
+
+
+def main_cli():
+    from refresh_scheduler import load_profiles
+
+    parser = argparse.ArgumentParser(description='预热各 profile 的模板、解析模块与订阅')
+    parser.add_argument('--prefetch', action='store_true', help='并行拉取订阅并渲染各 profile')
+    parser.add_argument('--workers', type=int, default=4, help='并行拉取订阅的线程数')
+    args = parser.parse_args()
+
+    report, _ = warm_up(load_profiles(), args.prefetch, args.workers)
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+if __name__ == '__main__':
+    main_cli()